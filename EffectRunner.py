@@ -0,0 +1,606 @@
+# -*- coding: utf-8 -*-
+# Running the effects of StdEffects without the main window (batch jobs, worker processes, pipelines)
+import json
+import multiprocessing
+import os
+import time
+import traceback
+import numpy as np
+from ImgLib import ImageIO
+from ImgLib.EnergyCache import EnergyCache
+from ImgLib.Progress import CancelToken, PollingCancelToken, ProgressReporter
+
+try:
+    from multiprocessing import shared_memory # Since Python 3.8
+except:
+    shared_memory = None
+
+try:
+    from PyQt5 import QtWidgets as gui
+except:
+    from PyQt4 import QtGui as gui
+
+
+__app = None
+
+
+def ensureApplication():
+    '''
+    The effects create widgets for their settings, so a QApplication is needed.
+    Creates one (without a display if none is available) if there is none yet.
+    @return The QApplication
+    '''
+    global __app
+    app = gui.QApplication.instance()
+    if app is None:
+        if not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = __app = gui.QApplication(["seameater"])  # Keep a reference, otherwise it is collected
+    return app
+
+
+def effectTitles():
+    '''
+    Returns the titles of all exported effects.
+    @return List of titles
+    '''
+    return [effect.title() for effect in __allEffects()]
+
+
+def energyNames():
+    '''
+    Returns the names of all available energy functions.
+    @return List of names
+    '''
+    import EnergyFunction as Functions
+    return list(Functions.export.keys())
+
+
+__effects = None
+
+
+def __allEffects():
+    global __effects
+    if __effects is None:
+        import StdEffects as Effects
+        ensureApplication()
+        __effects = [effectClass() for effectClass in Effects.export]
+    return __effects
+
+
+def effectName(effect):
+    '''
+    Returns the name of an effect for createEffect.
+    @param effect An effect
+    @return The class name or None if the class is not in StdEffects.export
+    '''
+    import StdEffects as Effects
+    if type(effect) in Effects.export:
+        return type(effect).__name__
+    return None
+
+
+def energyName(func):
+    '''
+    Returns the name of an energy function.
+    @param func An energy function of EnergyFunction.export
+    @return The name (key of EnergyFunction.export) or None if it is not exported
+    '''
+    import EnergyFunction as Functions
+    for name, candidate in Functions.export.items():
+        if candidate is func:
+            return name
+    return None
+
+
+def createEffect(name, params=None, energy=None):
+    '''
+    Returns a configured effect of StdEffects.export.
+    @param name The title (e.g. "Remove Seams") or the class name (e.g. "RemoveSeamImage") of the effect
+    @param params A map of parameters for the effect (see StdEffect.setParameters)
+    @param energy The name of the energy function (key of EnergyFunction.export).
+                  None uses the first one.
+    @return The effect
+    '''
+    import StdEffects as Effects
+    import EnergyFunction as Functions
+    ensureApplication()
+    effectClass = None
+    for cls in Effects.export:
+        if cls.__name__.lower() == name.lower():
+            effectClass = cls
+    if effectClass is None:
+        for candidate in __allEffects():
+            if candidate.title().lower() == name.lower():
+                effectClass = type(candidate)
+    if effectClass is None:
+        raise ValueError("Unknown effect '%s' (known: %s)" % (name, ", ".join(effectTitles())))
+    effect = effectClass()
+    if energy is None:
+        energy = list(Functions.export.keys())[0]
+    if not energy in Functions.export:
+        raise ValueError("Unknown energy function '%s' (known: %s)" % (energy, ", ".join(energyNames())))
+    effect.setEnergyBuildFunction(Functions.export[energy])
+    if params:
+        effect.setParameters(params)
+    return effect
+
+
+def runEffect(effect, img, mask=None):
+    '''
+    Applies the effect synchronously.
+    @param effect The effect (see createEffect)
+    @param img The image (numpy array)
+    @param mask An optional mask (numpy array)
+    @return The resulting image or None if the effect failed.
+    '''
+    data = {'img': img}
+    if mask is not None:
+        data['mask'] = mask
+    return effect.applyEffect(data)
+
+
+def _carveMask(mask, seams):
+    # The mask without the pixels of seams (a SeamSet)
+    keep = ~seams.mask()
+    if not seams.vertical:
+        return np.swapaxes(_carveMask(np.swapaxes(mask, 0, 1), seams.transposed()), 0, 1)
+    return mask[keep].reshape((mask.shape[0], -1) + mask.shape[2:])
+
+
+class Pipeline:
+    '''
+    A list of configured effects which are applied one after another to a picture.
+    The result of a step is given to the next one as it is (no conversion to uint8, no gui in between)
+    and the steps share their energy maps while they work on the same picture (see ImgLib.EnergyCache).
+    A pipeline can be saved as recipe (JSON) and used again, e.g. by batch.py --recipe:
+        {"steps": [{"effect": "HistoEqu", "params": {}, "energy": "AbsDiv"},
+                   {"effect": "RemoveSeamImage", "params": {"seams": 40}, "energy": "AbsDiv"}]}
+    '''
+
+    def __init__(self, recipe=None):
+        '''
+        @param recipe A recipe (see Pipeline.recipe) with the steps, None for an empty pipeline
+        '''
+        self.__steps = [] # (step of the recipe, effect)
+        self.__cancelToken = CancelToken()
+        self.energyCache = EnergyCache()
+        self.removedSeams = None # As StdEffect.removedSeams, for a pipeline with one step
+        if recipe is not None:
+            for step in recipe.get('steps', []):
+                if not 'effect' in step:
+                    raise ValueError("Every step of a recipe needs an effect")
+                self.addStep(step['effect'], step.get('params'), step.get('energy'))
+
+    def __len__(self):
+        return len(self.__steps)
+
+    def steps(self):
+        '''
+        @return The steps as list of maps with the keys effect, params and energy
+        '''
+        return [dict(step) for step, effect in self.__steps]
+
+    def addStep(self, name, params=None, energy=None):
+        '''
+        Appends an effect.
+        @param name, params, energy See createEffect
+        '''
+        import EnergyFunction as Functions
+        effect = createEffect(name, params, energy)
+        if energy is None:
+            energy = list(Functions.export.keys())[0]
+        effect.setCancelToken(PollingCancelToken(self.__cancelToken, 0)) # Stays cancelled when the effect starts
+        step = {'effect': effectName(effect), 'params': effect.parameters(), 'energy': energy}
+        self.__steps.append((step, effect))
+
+    def addEffect(self, effect, energyFunc=None):
+        '''
+        Appends a copy of an effect with its current parameters (e.g. the one of the gui).
+        @param effect An effect of StdEffects.export
+        @param energyFunc An energy function of EnergyFunction.export, None for the default one
+        '''
+        name = effectName(effect)
+        if name is None:
+            raise ValueError("'%s' cannot be used in a pipeline" % effect.title())
+        energy = None
+        if energyFunc is not None:
+            energy = energyName(energyFunc)
+            if energy is None:
+                raise ValueError("The energy function cannot be used in a pipeline")
+        self.addStep(name, effect.parameters(), energy)
+
+    def removeStep(self, index):
+        del self.__steps[index]
+
+    def clear(self):
+        self.__steps = []
+
+    def recipe(self):
+        '''
+        @return The recipe of this pipeline (a map which can be saved as JSON)
+        '''
+        return {'steps': self.steps()}
+
+    def save(self, filename):
+        '''
+        Saves the recipe as JSON file.
+        '''
+        with open(filename, "w") as f:
+            json.dump(self.recipe(), f, indent=2)
+
+    @staticmethod
+    def load(filename):
+        '''
+        Loads a pipeline from a recipe file (see save).
+        @return The Pipeline
+        '''
+        with open(filename) as f:
+            recipe = json.load(f)
+        if not isinstance(recipe, dict) or not isinstance(recipe.get('steps'), list):
+            raise ValueError("'%s' is not a recipe" % filename)
+        return Pipeline(recipe)
+
+    def cancel(self):
+        '''
+        Stops the running step and the following ones (run returns None).
+        '''
+        self.__cancelToken.cancel()
+
+    def run(self, img, mask=None, progressFunc=None):
+        '''
+        Applies the steps one after another.
+        @param img The image (numpy array, it is not changed)
+        @param mask An optional mask (numpy array) for the first step. It is given to the following steps
+                    as long as the size of the picture does not change (or only seams are removed).
+        @param progressFunc Function receiving the progress of the whole pipeline (int -> )
+        @return The resulting image or None if a step failed or the pipeline was cancelled
+        '''
+        self.__cancelToken.reset()
+        self.removedSeams = None
+        reporters = ProgressReporter(progressFunc).stages([1] * len(self.__steps))
+        res = img
+        try:
+            for (step, effect), reporter in zip(self.__steps, reporters):
+                if self.__cancelToken():
+                    return None
+                data = {'img': self.energyCache.share(res)}
+                if mask is not None:
+                    data['mask'] = mask
+                effect.setEnergyCache(self.energyCache)
+                effect.progress.connect(reporter)
+                try:
+                    out = effect.applyEffect(data)
+                finally:
+                    effect.progress.disconnect(reporter)
+                    effect.setEnergyCache(None)
+                if out is None or self.__cancelToken():
+                    return None
+                if mask is not None and out.shape[:2] != res.shape[:2]:
+                    seams = effect.removedSeams
+                    mask = None if seams is None else _carveMask(mask, seams)
+                if len(self.__steps) == 1:
+                    self.removedSeams = effect.removedSeams
+                res = out
+        finally:
+            self.energyCache.clear()
+        return res
+
+
+def toUint8(img):
+    '''
+    Converts the result of an effect into an uint8 picture for saving (see ImageIO.toUint8).
+    @param img The image
+    @return The clipped uint8 image
+    '''
+    return ImageIO.toUint8(img)
+
+
+class SharedArray:
+    '''
+    A numpy array in shared memory (see multiprocessing.shared_memory).
+    Another process gets the same memory with SharedArray.attach(description()),
+    so the pixels are neither pickled nor sent through a pipe.
+    '''
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.__shm = shm
+        self.__owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @staticmethod
+    def create(array):
+        '''
+        Copies an array into new shared memory.
+        @param array The numpy array
+        @return The SharedArray (owns the shared memory)
+        '''
+        array = np.asarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        res = SharedArray(shm, array.shape, array.dtype, True)
+        res.array[...] = array
+        return res
+
+    @staticmethod
+    def attach(description):
+        '''
+        @param description The description of a SharedArray of another process
+        @return A SharedArray with the same memory
+        '''
+        name, shape, dtype = description
+        return SharedArray(shared_memory.SharedMemory(name=name), shape, np.dtype(dtype), False)
+
+    def description(self):
+        '''
+        @return A small picklable tuple describing the array (see attach)
+        '''
+        return (self.__shm.name, self.array.shape, self.array.dtype.str)
+
+    def close(self, unlink=None):
+        '''
+        Releases the memory in this process (self.array and all views of it must not be used anymore).
+        @param unlink If True, the shared memory is removed. None removes it if this SharedArray created it.
+        '''
+        self.array = None
+        try:
+            self.__shm.close()
+        except BufferError: # Views of the array still exist, the memory is released with them
+            pass
+        if unlink or (unlink is None and self.__owner):
+            self.__shm.unlink()
+
+
+def _cancelRequested(conn):
+    while conn.poll():
+        if conn.recv() == 'cancel':
+            return True
+    return False
+
+
+def _runJob(conn, job):
+    # Applies an effect in a worker process, the messages are described at EffectJob.poll
+    inputs = [SharedArray.attach(job['img'])]
+    if job['mask'] is not None:
+        inputs.append(SharedArray.attach(job['mask']))
+    result = effect = data = res = None
+    try:
+        effect = createEffect(job['effect'], job['params'], job['energy'])
+        effect.setCancelToken(PollingCancelToken(lambda: _cancelRequested(conn)))
+        effect.progress.connect(lambda value: conn.send(('progress', value)))
+        effect.preview.connect(lambda img: conn.send(('preview', img)))
+        effect.profiled.connect(lambda report: conn.send(('profile', report)))
+        for shared in inputs: # The other processes use it, too
+            shared.array.flags.writeable = False
+        data = {'img': inputs[0].array, 'profile': job['profile']}
+        if len(inputs) > 1:
+            data['mask'] = inputs[1].array
+        res = effect.applyEffect(data)
+        if res is not None:
+            result = SharedArray.create(res)
+        seams = effect.removedSeams
+        conn.send(('finished', None if result is None else result.description(), seams))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        conn.send(('finished', None, None))
+    finally:
+        effect = data = res = None
+        for shared in inputs:
+            shared.close()
+    return result
+
+
+def _workerMain(conn):
+    ensureApplication()
+    result = None
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if result is not None: # The parent has copied it before sending a new job
+            result.close(unlink=False)
+            result = None
+        if job is None:
+            break
+        if job == 'cancel': # Too late for the last job
+            continue
+        result = _runJob(conn, job)
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_workerMain, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+
+class EffectJob:
+    '''
+    An effect running in a worker process of an EffectProcessPool.
+    Call poll regularly (e.g. with a QTimer) for receiving the progress and the result.
+    '''
+
+    def __init__(self, pool, request, inputs):
+        self.__pool = pool
+        self.__request = request
+        self.__inputs = inputs
+        self.__worker = None
+        self.__sendRequest = False
+        self.__done = False
+        self.__cancelled = False
+        self.result = None # The resulting image (None if cancelled or failed)
+        self.removedSeams = None # See StdEffect.removedSeams
+        self.error = None # The traceback, if the effect failed
+
+    def done(self):
+        return self.__done
+
+    def cancel(self):
+        '''
+        Stops the effect (it finishes without result).
+        '''
+        if self.__done or self.__cancelled:
+            return
+        self.__cancelled = True
+        if self.__worker is not None:
+            try:
+                self.__worker.conn.send('cancel')
+            except OSError:
+                pass
+
+    def poll(self):
+        '''
+        Receives the messages of the worker without waiting.
+        @return A list of events: ('progress', percent), ('preview', uint8 image), ('profile', report),
+                ('error', traceback) and at last ('finished', image or None, removed seams or None)
+        '''
+        if self.__done:
+            return []
+        if self.__worker is None:
+            if self.__cancelled:
+                return self.__finish(None, None)
+            self.__worker = self.__pool._acquire()
+            if self.__worker is None: # All workers are busy
+                return []
+            self.__sendRequest = True
+        events = []
+        try:
+            if self.__sendRequest:
+                self.__sendRequest = False
+                self.__worker.conn.send(self.__request)
+            while not self.__done and self.__worker.conn.poll():
+                message = self.__worker.conn.recv()
+                if message[0] == 'finished':
+                    events += self.__finish(message[1], message[2])
+                else:
+                    if message[0] == 'error':
+                        self.error = message[1]
+                    events.append(message)
+        except (EOFError, OSError):
+            self.__pool._discard(self.__worker)
+            self.__worker = None
+            self.error = "The worker process has stopped"
+            events.append(('error', self.error))
+            events += self.__finish(None, None)
+        return events
+
+    def wait(self, timeout=None):
+        '''
+        Waits for the end of the effect (the events are dropped).
+        @param timeout The maximal time in seconds or None
+        @return The resulting image or None
+        '''
+        start = time.monotonic()
+        while not self.__done and (timeout is None or time.monotonic() - start < timeout):
+            if self.__worker is not None:
+                self.__worker.conn.poll(0.05)
+            else:
+                time.sleep(0.01)
+            self.poll()
+        return self.result
+
+    def __finish(self, description, seams):
+        if description is not None:
+            shared = SharedArray.attach(description)
+            self.result = np.array(shared.array)
+            shared.close(unlink=True)
+        self.removedSeams = seams
+        for shared in self.__inputs:
+            shared.close()
+        self.__inputs = []
+        if self.__worker is not None:
+            self.__pool._release(self.__worker)
+            self.__worker = None
+        self.__done = True
+        self.__pool._jobDone(self)
+        return [('finished', self.result, seams)]
+
+    def _abort(self):
+        # Called by EffectProcessPool.shutdown
+        if not self.__done:
+            self.__worker = None
+            self.__finish(None, None)
+
+
+class EffectProcessPool:
+    '''
+    Runs effects of StdEffects in worker processes, so neither the GIL nor a crash of an effect
+    affects the calling process (e.g. the gui). The pictures are passed through shared memory,
+    the progress and the cancellation through a pipe for every worker.
+    The workers are started when needed (spawn, a QApplication must not be forked).
+    '''
+
+    def __init__(self, processes=None):
+        '''
+        @param processes The maximal number of worker processes (effects running at once), default: number of CPUs
+        '''
+        if shared_memory is None:
+            raise RuntimeError("Worker processes need multiprocessing.shared_memory (Python 3.8)")
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.__context = multiprocessing.get_context("spawn")
+        self.__workers = []
+        self.__idle = []
+        self.__jobs = []
+
+    def submit(self, effect, img, mask=None, params=None, energy=None, profile=False):
+        '''
+        Starts an effect (or queues it if all workers are busy, it is started by EffectJob.poll).
+        @param effect The title or the class name of the effect (see createEffect)
+        @param img The image (copied into shared memory)
+        @param mask An optional mask
+        @param params A map of parameters for the effect
+        @param energy The name of the energy function or None
+        @param profile If True, the report of Profiling is sent as event
+        @return The EffectJob
+        '''
+        inputs = [SharedArray.create(img)]
+        if mask is not None:
+            inputs.append(SharedArray.create(mask))
+        request = {'effect': effect, 'params': params or {}, 'energy': energy, 'profile': profile,
+                   'img': inputs[0].description(), 'mask': inputs[1].description() if mask is not None else None}
+        job = EffectJob(self, request, inputs)
+        self.__jobs.append(job)
+        job.poll()
+        return job
+
+    def _acquire(self):
+        if self.__idle:
+            return self.__idle.pop()
+        if len(self.__workers) < self.processes:
+            worker = _Worker(self.__context)
+            self.__workers.append(worker)
+            return worker
+        return None
+
+    def _release(self, worker):
+        if worker in self.__workers:
+            self.__idle.append(worker)
+
+    def _jobDone(self, job):
+        if job in self.__jobs:
+            self.__jobs.remove(job)
+
+    def _discard(self, worker):
+        if worker in self.__workers:
+            self.__workers.remove(worker)
+        worker.process.terminate()
+
+    def shutdown(self):
+        '''
+        Stops all worker processes (running effects are terminated).
+        '''
+        for job in list(self.__jobs):
+            job._abort()
+        for worker in self.__workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self.__workers:
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        self.__workers = []
+        self.__idle = []
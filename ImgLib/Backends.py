@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Registry for the implementations (backends) of the hot kernels.
+# Every kernel (e.g. "seam" = findOptimalSeam) can have several implementations
+# (e.g. "cython", "numpy", "numba"). The fastest available one is chosen per size class
+# by a short calibration run, whose result is cached per machine.
+# A backend can be forced with setBackend or the environment variable SEAMEATER_BACKEND,
+# e.g. SEAMEATER_BACKEND=numpy (all kernels) or SEAMEATER_BACKEND=seam=cython,energy=numpy.
+# SEAMEATER_CALIBRATE=0 disables the calibration (the first registered backend is used).
+# A call can be limited to a memory budget (maxBytes), then a backend whose
+# estimated memory use fits is chosen.
+import json
+import os
+import platform
+import threading
+import time
+
+# Size classes (name, upper bound of the size) and the size used for calibrating them.
+sizeClasses = (("small", 2 ** 18), ("medium", 2 ** 22), ("large", None))
+calibrationSizes = {"small": 256 * 256, "medium": 768 * 768, "large": 1536 * 1536}
+
+_kernels = {}
+_forced = {}
+_cache = None
+_lock = threading.RLock()
+
+
+class MemoryBudgetError(MemoryError):
+    '''
+    Raised if an algorithm would need more memory than allowed by its maxBytes budget.
+    '''
+
+    def __init__(self, what, needed, maxBytes):
+        '''
+        @param what The name of the algorithm
+        @param needed The estimated memory use in bytes
+        @param maxBytes The budget in bytes
+        '''
+        MemoryError.__init__(self, "%s needs about %d bytes, but only %d bytes are allowed"
+                             % (what, needed, maxBytes))
+        self.needed = needed
+        self.maxBytes = maxBytes
+
+
+def sizeClass(size):
+    '''
+    Returns the name of the size class.
+    @param size The size of the input (usually the number of pixels)
+    @return "small", "medium" or "large"
+    '''
+    for name, bound in sizeClasses:
+        if bound is None or size < bound:
+            return name
+
+
+class Kernel:
+    '''
+    A kernel with several implementations. Calling it calls the selected implementation.
+    '''
+
+    def __init__(self, name, sizeFunc, sampleFunc, doc=None):
+        '''
+        @param name The name of the kernel (e.g. "seam")
+        @param sizeFunc Returns the size of the input of a call (same arguments as the kernel)
+        @param sampleFunc Returns the arguments (tuple) of a typical call with the given size (for calibration)
+        @param doc The docstring of the kernel
+        '''
+        self.name = name
+        self.sizeFunc = sizeFunc
+        self.sampleFunc = sampleFunc
+        self.__doc__ = doc
+        self.__impls = {}
+        self.__calibrate = {}
+        self.__memory = {}
+        self.lastBackend = None
+
+    def register(self, backend, func, calibrate=True, memory=None):
+        '''
+        Adds an implementation. Backends registered first are preferred without calibration.
+        @param backend The name of the backend (e.g. "numpy")
+        @param func The implementation
+        @param calibrate False, if it should only be used when forced or when it is the only one
+                         fitting into a memory budget (e.g. slow reference implementations)
+        @param memory Returns the estimated memory use of a call in bytes, besides the arguments
+                      (same arguments as the kernel). None if unknown.
+        '''
+        self.__impls[backend] = func
+        self.__calibrate[backend] = calibrate
+        self.__memory[backend] = memory
+
+    def backends(self):
+        '''
+        @return The names of the available backends
+        '''
+        return list(self.__impls.keys())
+
+    def implementation(self, backend):
+        '''
+        @return The implementation of a backend
+        '''
+        return self.__impls[backend]
+
+    def memory(self, backend, *args, **kwargs):
+        '''
+        @return The estimated memory use in bytes of a call with backend (0 if unknown)
+        '''
+        memory = self.__memory[backend]
+        return 0 if memory is None else memory(*args, **kwargs)
+
+    def select(self, size):
+        '''
+        Returns the backend used for an input of the given size.
+        @param size The size of the input
+        @return The name of the backend
+        '''
+        forced, specific = _forcedBackend(self.name)
+        if forced is not None:
+            if forced in self.__impls:
+                return forced
+            if specific: # A backend forced for all kernels may be missing for some of them
+                raise ValueError("Backend '%s' is not available for kernel '%s' (available: %s)"
+                                 % (forced, self.name, ", ".join(self.__impls)))
+        candidates = [b for b in self.__impls if self.__calibrate[b]] or list(self.__impls)
+        if len(candidates) == 1 or os.environ.get("SEAMEATER_CALIBRATE", "1") == "0":
+            return candidates[0]
+        cls = sizeClass(size)
+        with _lock:
+            cache = _loadCache()
+            entry = cache.get(self.name, {})
+            if entry.get("backends") != sorted(candidates) or not cls in entry.get("choice", {}):
+                timings = self.calibrate(cls, candidates)
+                if entry.get("backends") != sorted(candidates):
+                    entry = {"backends": sorted(candidates), "choice": {}, "seconds": {}}
+                entry["choice"][cls] = min(timings, key=timings.get)
+                entry["seconds"][cls] = timings
+                cache[self.name] = entry
+                _saveCache(cache)
+            return entry["choice"][cls]
+
+    def calibrate(self, cls, candidates=None):
+        '''
+        Measures the backends with a sample input of a size class.
+        @param cls The size class
+        @param candidates The backends to measure, None for all that may be calibrated
+        @return A map backend => seconds
+        '''
+        if candidates is None:
+            candidates = [b for b in self.__impls if self.__calibrate[b]]
+        args = self.sampleFunc(calibrationSizes[cls])
+        timings = {}
+        for backend in candidates:
+            func = self.__impls[backend]
+            try:
+                func(*args)  # Warm up (e.g. JIT compilation)
+                start = time.perf_counter()
+                func(*args)
+                timings[backend] = time.perf_counter() - start
+            except Exception:
+                timings[backend] = float("inf")
+        return timings
+
+    def selectWithin(self, maxBytes, *args, **kwargs):
+        '''
+        Returns the backend used for a call that may use at most maxBytes.
+        The selected backend (see select) is used if it fits, otherwise the fastest one that fits
+        (measured by the calibration, backends that are not calibrated last).
+        @param maxBytes The memory budget in bytes
+        @return The name of the backend
+        @throws MemoryBudgetError if no backend fits
+        '''
+        size = self.sizeFunc(*args, **kwargs)
+        backend = self.select(size)
+        needed = {b: self.memory(b, *args, **kwargs) for b in self.__impls}
+        if needed[backend] <= maxBytes:
+            return backend
+        fitting = [b for b in self.__impls if needed[b] <= maxBytes]
+        if not fitting:
+            raise MemoryBudgetError(self.name, min(needed.values()), maxBytes)
+        with _lock:
+            seconds = _loadCache().get(self.name, {}).get("seconds", {}).get(sizeClass(size), {})
+        order = list(self.__impls)
+        return min(fitting, key=lambda b: (not self.__calibrate[b], seconds.get(b, float("inf")), order.index(b)))
+
+    def __call__(self, *args, maxBytes=None, **kwargs):
+        '''
+        Calls the selected implementation.
+        @param maxBytes If given, a backend is chosen whose estimated memory use fits (see selectWithin)
+        '''
+        if maxBytes is None:
+            backend = self.select(self.sizeFunc(*args, **kwargs))
+        else:
+            backend = self.selectWithin(maxBytes, *args, **kwargs)
+        self.lastBackend = backend
+        return self.__impls[backend](*args, **kwargs)
+
+
+def kernel(name, sizeFunc, sampleFunc, doc=None):
+    '''
+    Returns the kernel with the name, creates it if needed.
+    @see Kernel
+    '''
+    with _lock:
+        if not name in _kernels:
+            _kernels[name] = Kernel(name, sizeFunc, sampleFunc, doc)
+        return _kernels[name]
+
+
+def kernels():
+    '''
+    @return A map name => Kernel of all kernels
+    '''
+    return dict(_kernels)
+
+
+def setBackend(backend, kernelName=None):
+    '''
+    Forces a backend.
+    @param backend The name of the backend, None removes the forcing
+    @param kernelName The kernel, None for all kernels
+    '''
+    _forced[kernelName] = backend
+
+
+def forcedBackend(kernelName):
+    '''
+    Returns the forced backend of a kernel (by setBackend or SEAMEATER_BACKEND).
+    @return The name of the backend or None
+    '''
+    return _forcedBackend(kernelName)[0]
+
+
+def _forcedBackend(kernelName):
+    # Returns (backend, True if forced for this kernel and not for all kernels)
+    if _forced.get(kernelName) is not None:
+        return _forced[kernelName], True
+    if _forced.get(None) is not None:
+        return _forced[None], False
+    env = os.environ.get("SEAMEATER_BACKEND", "").strip()
+    if not env:
+        return None, False
+    if not "=" in env:
+        return env, False
+    for part in env.split(","):
+        name, _, backend = part.partition("=")
+        if name.strip() == kernelName:
+            return backend.strip(), True
+    return None, False
+
+
+def lastBackends():
+    '''
+    Returns which backend ran last for every kernel.
+    @return A map kernel name => backend name (None if not called yet)
+    '''
+    return {name: k.lastBackend for name, k in _kernels.items()}
+
+
+def cacheFilename():
+    '''
+    @return The file where the calibration results are stored (one per machine)
+    '''
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "seameater", "backends-%s.json" % platform.node())
+
+
+def _loadCache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(cacheFilename()) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _saveCache(cache):
+    try:
+        os.makedirs(os.path.dirname(cacheFilename()), exist_ok=True)
+        with open(cacheFilename(), "w") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+    except OSError:
+        pass # The choice is still used for this process
+
+
+def clearCalibration():
+    '''
+    Forgets all calibration results (also the cached ones).
+    '''
+    global _cache
+    with _lock:
+        _cache = {}
+        _saveCache(_cache)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# A picture from which vertical seams are removed in place.
+# The memory is allocated once with the original size. Removing a seam moves the rest of
+# every row one pixel to the left, the current picture is a view of the first columns.
+import numpy as np
+from ImgLib.SeamSet import SeamSet
+
+_shiftRowsLeft = None
+try:
+    import ImgLib.MyLib_Cy as Cy
+    _shiftRowsLeft = Cy.shiftRowsLeft
+except:
+    pass
+
+
+def removeSeamInPlace(buf, seam, width):
+    '''
+    Removes a vertical seam from buf[:, :width] in place. Afterwards buf[:, :width-1] is the result.
+    @param buf The picture (C-contiguous numpy array, 2 or 3 dimensions)
+    @param seam The seam (column of every row)
+    @param width The current width of the picture
+    '''
+    h, w = buf.shape[:2]
+    if _shiftRowsLeft is not None:
+        _shiftRowsLeft(buf.reshape((h, -1)).view(np.uint8), seam, width, buf.itemsize * (buf.size // max(1, h * w)))
+        return
+    for r in range(h):
+        c = seam[r]
+        buf[r, c:width - 1] = buf[r, c + 1:width]
+
+
+class CarvingBuffer:
+    '''
+    A picture (and its energy) from which vertical seams are removed without allocating memory.
+    '''
+
+    def __init__(self, img, energy=None, trackPositions=False):
+        '''
+        @param img The picture (is copied)
+        @param energy The energy of the picture or None (is copied)
+        @param trackPositions If True, the original column of every pixel is tracked (see positions)
+        '''
+        self.__img = np.array(img, order='C')
+        h, w = self.__img.shape[:2]
+        self.__width = w
+        self.__energy = None
+        if energy is not None:
+            self.__energy = np.array(energy, dtype=np.float64, order='C')
+        self.__positions = None
+        if trackPositions:
+            self.__positions = np.tile(np.arange(w, dtype=np.int32), (h, 1))
+
+    def width(self):
+        '''
+        @return The current width
+        '''
+        return self.__width
+
+    def image(self):
+        '''
+        @return The current picture (a view, it changes when a seam is removed)
+        '''
+        return self.__img[:, :self.__width]
+
+    def energy(self):
+        '''
+        @return The current energy (a view) or None
+        '''
+        if self.__energy is None:
+            return None
+        return self.__energy[:, :self.__width]
+
+    def positions(self):
+        '''
+        @return The original column of every pixel of the current picture (a view) or None
+        '''
+        if self.__positions is None:
+            return None
+        return self.__positions[:, :self.__width]
+
+    def removedPixels(self):
+        '''
+        Returns the pixels removed so far (needs trackPositions).
+        @return A SeamSet of the original picture with the removed columns of every row (in ascending order).
+                These are the pixels of the removed seams, but not ordered by seam.
+        '''
+        if self.__positions is None:
+            return None
+        h, w = self.__img.shape[:2]
+        removed = np.ones((h, w), dtype=bool)
+        removed[np.arange(h)[:, None], self.__positions[:, :self.__width]] = False
+        return SeamSet(np.nonzero(removed)[1].reshape((h, w - self.__width)).T, (h, w))
+
+    def setEnergy(self, energy):
+        '''
+        Sets the energy of the current picture.
+        @param energy The energy (numpy array with the shape of the current picture)
+        '''
+        if self.__energy is None:
+            self.__energy = np.zeros(self.__img.shape[:2])
+        self.__energy[:, :self.__width] = energy
+
+    def removeSeam(self, seam):
+        '''
+        Removes a vertical seam from the picture, the energy and the positions.
+        @param seam The seam
+        '''
+        for buf in (self.__img, self.__energy, self.__positions):
+            if buf is not None:
+                removeSeamInPlace(buf, seam, self.__width)
+        self.__width -= 1
+
+    def refreshEnergy(self, energyFactory, seam, margin=4):
+        '''
+        Recomputes the energy near a removed seam. Only the columns up to margin pixels
+        next to the seam are computed again (with margin more pixels as context),
+        so the energy of a pixel must only depend on the pixels at most margin columns away
+        (true for all energy functions of EnergyFunction).
+        @param energyFactory A function computing the energy function (numpy array) of a picture
+        @param seam The seam that was removed last
+        @param margin The maximal distance of pixels an energy value depends on
+        '''
+        width = self.__width
+        lo = max(0, int(np.min(seam)) - margin - 1)
+        hi = min(width, int(np.max(seam)) + margin + 1)
+        a = max(0, lo - margin)
+        b = min(width, hi + margin)
+        energy = energyFactory(self.__img[:, a:b])
+        self.__energy[:, lo:hi] = energy[:, lo - a:hi - a]
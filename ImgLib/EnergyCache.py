@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Sharing energy maps between effects which work on the same picture (e.g. the steps of a pipeline).
+import numpy as np
+
+
+class EnergyCache:
+    '''
+    Remembers the energy maps of one picture, so an energy function is computed only once for it.
+    Only the picture registered with share is cached. It is passed on as a read-only view,
+    so it cannot change while its energy maps are kept. Energy maps are computed for other
+    pictures (e.g. the carved ones inside an effect) as usual.
+    Every caller gets its own copy of an energy map, because the effects may change it.
+    '''
+
+    def __init__(self):
+        self.__img = None
+        self.__entries = [] # (energy function, energy map) of self.__img
+        self.hits = 0
+        self.misses = 0
+
+    def share(self, img):
+        '''
+        Registers the picture the next effect works on. The energy maps of the previous picture are dropped,
+        unless img is that picture (e.g. an effect returned its input unchanged).
+        @param img The picture
+        @return A read-only view of img, which has to be given to the effect instead of img
+        '''
+        if img is self.__img:
+            return img
+        self.__entries = []
+        view = np.asarray(img).view()
+        view.flags.writeable = False
+        self.__img = view
+        return view
+
+    def clear(self):
+        self.__img = None
+        self.__entries = []
+
+    def __call__(self, func, img):
+        '''
+        @param func The energy function (img => energy map)
+        @param img The picture
+        @return func(img), computed only once for the registered picture (see share)
+        '''
+        if not img is self.__img:
+            return func(img)
+        for candidate, energy in self.__entries:
+            if candidate == func:
+                self.hits += 1
+                return energy.copy()
+        self.misses += 1
+        energy = func(img)
+        if not isinstance(energy, np.ndarray): # E.g. a function of the position, not cached
+            return energy
+        self.__entries.append((func, energy))
+        return energy.copy()
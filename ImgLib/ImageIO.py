@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Reading and writing pictures as uint8 numpy arrays.
+# Pillow decodes straight into the array (imageio is used if Pillow is missing or cannot read a file).
+# JPEGs can be decoded at 1/2, 1/4 or 1/8 of their size (draft mode), which is much faster than
+# decoding and downscaling them. Writing converts the picture to uint8 in blocks of rows
+# (no float64 copy of the whole picture) and can run in a background thread.
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    from PIL import Image
+except:
+    Image = None
+
+_saveExecutor = None
+
+
+def _asSize(maxSize):
+    if maxSize is None:
+        return None
+    if np.ndim(maxSize) == 0:
+        return int(maxSize), int(maxSize)
+    return int(maxSize[0]), int(maxSize[1])
+
+
+def _fromPillow(im):
+    # The pixels of a Pillow image as uint8 array (h, w), (h, w, 3) or (h, w, 4)
+    if im.mode in ("I;16", "I;16B", "I;16L"): # 16 bit grayscale (e.g. PNG)
+        return (np.asarray(im, dtype=np.uint16) >> 8).astype(np.uint8)
+    if im.mode == "P":
+        im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+    elif im.mode in ("LA", "PA", "RGBa", "La"):
+        im = im.convert("RGBA")
+    elif im.mode in ("1", "I", "F"):
+        im = im.convert("L")
+    elif not im.mode in ("L", "RGB", "RGBA"):
+        im = im.convert("RGB")
+    return np.asarray(im)
+
+
+def readImage(source, maxSize=None):
+    '''
+    Reads a picture.
+    @param source A filename or a file object
+    @param maxSize None for the whole picture. Otherwise (w, h) or a number for both: the picture may be
+                   decoded at a reduced size that is still at least maxSize (or the original size, if smaller).
+                   JPEGs are decoded directly at 1/2, 1/4 or 1/8 of their size.
+    @return uint8 array: (h, w) for grayscale pictures, (h, w, 3) or (h, w, 4) (RGBA) for colored ones.
+            It may be read-only.
+    '''
+    maxSize = _asSize(maxSize)
+    if Image is not None:
+        start = source.tell() if hasattr(source, "seek") else None
+        try:
+            # Pillow decodes lazily, decoding errors (e.g. a truncated file) are raised by _fromPillow
+            with Image.open(source) as im:
+                if maxSize is not None:
+                    if im.format == "JPEG":
+                        im.draft(im.mode, maxSize)
+                    else:
+                        factor = min(im.width // max(1, maxSize[0]), im.height // max(1, maxSize[1]))
+                        if factor > 1:
+                            im = im.reduce(factor)
+                return _fromPillow(im)
+        except Exception:
+            pass
+        if start is not None:
+            source.seek(start)
+    import imageio
+    img = toUint8(imageio.imread(source))
+    if maxSize is not None:
+        from ImgLib.MyLibTool import downscale
+        step = min(img.shape[1] // max(1, maxSize[0]), img.shape[0] // max(1, maxSize[1]))
+        img = toUint8(downscale(img, step))
+    return img
+
+
+def toUint8(img, rows=256):
+    '''
+    Converts a picture (e.g. the float64 result of an effect) into a uint8 picture (rounded and clipped).
+    The conversion runs in blocks of rows, so no temporary copy of the whole picture is made.
+    @param img The picture
+    @param rows The number of rows of a block
+    @return The uint8 picture (img itself if it already is one)
+    '''
+    img = np.asarray(img)
+    if img.dtype == np.uint8:
+        return img
+    if img.dtype == np.uint16: # E.g. 16 bit PNGs
+        return (img >> 8).astype(np.uint8)
+    res = np.empty(img.shape, dtype=np.uint8)
+    for start in range(0, max(1, img.shape[0]), rows):
+        block = img[start:start + rows]
+        if block.dtype.kind == 'f':
+            block = np.rint(block)
+        np.clip(block, 0, 255, out=res[start:start + rows], casting='unsafe')
+    return res
+
+
+def writeImage(target, img, format=None, **options):
+    '''
+    Writes a picture.
+    @param target A filename or a file object
+    @param img The picture (any type, it is converted with toUint8): (h, w), (h, w, 1), (h, w, 3) or (h, w, 4)
+    @param format The format (e.g. "png"), by default from the extension of target
+    @param options Options of the encoder (see Pillow), e.g. quality=90 for JPEGs
+    '''
+    img = toUint8(img)
+    if np.ndim(img) == 3 and img.shape[2] == 1:
+        img = img[:, :, 0]
+    if format is None and isinstance(target, str):
+        format = os.path.splitext(target)[1][1:]
+    if format is not None:
+        format = format.lower()
+    if format in ("jpg", "jpeg", "bmp") and np.ndim(img) == 3 and img.shape[2] == 4: # No alpha channel
+        img = img[:, :, :3]
+    if Image is not None:
+        im = Image.fromarray(np.ascontiguousarray(img))
+        pillowFormat = {"jpg": "JPEG", "tif": "TIFF"}.get(format, format.upper() if format else None)
+        im.save(target, format=pillowFormat, **options)
+        return
+    import imageio
+    imageio.imwrite(target, img, format=format, **options)
+
+
+def saveInBackground(filename, img, **options):
+    '''
+    Writes a picture in a background thread (the encoders release the GIL).
+    The saves run one after another in the order of the calls.
+    @param filename The filename
+    @param img The picture (must not be changed until the save is done)
+    @param options See writeImage
+    @return A concurrent.futures.Future, its result is the filename (or the exception of writeImage)
+    '''
+    global _saveExecutor
+    if _saveExecutor is None:
+        _saveExecutor = ThreadPoolExecutor(1)
+
+    def save():
+        writeImage(filename, img, **options)
+        return filename
+
+    return _saveExecutor.submit(save)
@@ -2,17 +2,46 @@
 # Important functions for  Seam-Paper
 import numpy as np
 from ImgLib.Poisson import poissonInsertMask, laplace_div
+import ImgLib.Backends as Backends
+from ImgLib.Backends import MemoryBudgetError
+from ImgLib.MyLibTool import makeGray
+from ImgLib.SeamSet import SeamSet, isHorizontal, asSeamArray
+from ImgLib.Progress import asCancelToken, asProgressReporter
 from typing import Callable
 
-findOptimalSeam = None
+# The hot kernels (findOptimalSeam, absDivergence, removeSeams, duplicateSeams and
+# Poisson.poissonInsertMask) exist in several versions. The fastest available one
+# is chosen by ImgLib.Backends.
+Cy = None
 try:
     import ImgLib.MyLib_Cy as Cy
-    findOptimalSeam = Cy.findOptimalSeam
 except:
     pass
+Nb = None
+try:
+    import ImgLib.MyLib_Nb as Nb
+except:
+    pass
+
+
+def _sampleEnergy(size):
+    # A reproducible energy of about size pixels for calibrating the backends
+    n = max(2, int(np.sqrt(size)))
+    return np.random.RandomState(0).random_sample((n, n))
+
 
+def _sampleSeams(size):
+    # An image of about size pixels and some disjoint seams for calibrating the backends
+    n = max(2, int(np.sqrt(size)))
+    img = (np.random.RandomState(0).random_sample((n, n, 3)) * 255).astype(np.uint8)
+    return img, [np.full(n, c, dtype=np.int64) for c in range(0, n, max(1, n // 16))]
 
-def absDivergence(img):
+
+def _pixels(img, *args, **kwargs):
+    return img.shape[0] * img.shape[1]
+
+
+def absDivergence_Np(img):
     '''
     Returns a function that adds the absolute values of the gradient.
     |di(x,y)/dx| + |di(x,y)/dy|
@@ -22,13 +51,18 @@ def absDivergence(img):
     grad = np.gradient(img)
     return np.abs(grad[0]) + np.abs(grad[1])
 
+absDivergence = Backends.kernel("energy", _pixels, lambda size: (_sampleEnergy(size),), absDivergence_Np.__doc__)
+absDivergence.register("numpy", absDivergence_Np)
+if Nb is not None:
+    absDivergence.register("numba", Nb.absDivergence)
+
 
 def findOptimalSeam_Py(s: np.ndarray, stopFunc: Callable[[],bool] = None):
     """
     Finds optimal adjacent pixels in every row.
     These pixels minimize the energy s.
     @param s The energy function (a numpy array)
-    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked once per row.
     @return A vector M. The size of its elements are equal to the size of s rows.
             The value M[i] gives the best column of the pixel at the row i.
             If it is impossible to return a seam that has not the energy infinity or if
@@ -43,9 +77,9 @@ def findOptimalSeam_Py(s: np.ndarray, stopFunc: Callable[[],bool] = None):
         C[0, c] = s[0, c]
     # Then compute for every column in every row the best neighbor above
     for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None
         for c in range(N):
-            if stopFunc and stopFunc():
-                return None
             left = max(c - 1, 0)
             right = min(N - 1, c + 1)
             j = left + C[r - 1, left:right + 1].argmin()
@@ -67,42 +101,559 @@ def findOptimalSeam_Py(s: np.ndarray, stopFunc: Callable[[],bool] = None):
         minPointer = Pointer[prevR, row]
     return seam
 
-if findOptimalSeam is None:
-    findOptimalSeam = findOptimalSeam_Py
 
-def findTopDisjointSeams(s, count, progressFunc=None, bigvalue=np.inf, stopFunc = None):
+
+def findOptimalSeamParallel(s, numThreads=0, tileSize=0, stopFunc=None):
+    """
+    Like findOptimalSeam, but every row is split into tiles of columns that are computed
+    by several threads without the GIL (needs the Cython-Extension, otherwise findOptimalSeam is used).
+    Every row only depends on the row above, so the threads only have to wait for each other once per row.
+    Gives the same seams as findOptimalSeam.
+    @param s The energy function (a numpy array)
+    @param numThreads Number of threads. 0 uses all cores.
+    @param tileSize Number of adjacent columns computed by one thread at once.
+           0 splits every row into one tile per thread (least synchronization).
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return The seam (see findOptimalSeam)
+    """
+    try:
+        parallelKernel = Cy.findOptimalSeamParallel
+    except (NameError, AttributeError): # No (or an old) Cython-Extension
+        return findOptimalSeam(s, stopFunc)
+    return parallelKernel(np.asarray(s, dtype=np.float64), numThreads, tileSize, stopFunc)
+
+
+def findBandSeam_Py(s, start, bandWidth, stopFunc=None):
+    """
+    Finds the optimal seam inside a band of columns. The band of row r
+    contains the columns start[r] ... start[r]+bandWidth-1.
+    Ties are resolved like findOptimalSeam (leftmost neighbor).
+    @param s The energy function (a numpy array)
+    @param start The first column of the band in every row (int array)
+    @param bandWidth The width of the band
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return (seam, cost). seam is None if there is no seam with finite energy or if stopped.
+    """
+    M, N = s.shape
+    start = np.asarray(start, dtype=np.int64)
+    cols = np.arange(bandWidth)
+    E = s[np.arange(M)[:, None], start[:, None] + cols]
+    Pointer = np.zeros((M, bandWidth), dtype=np.int8)
+    # The previous row, padded with inf so that shifted neighbors outside of the band are never chosen
+    pad = int(np.abs(np.diff(start)).max()) + 1 if M > 1 else 1
+    ext = np.full(bandWidth + 2 * pad, np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(ext, bandWidth)
+    ext[pad:pad + bandWidth] = E[0]
+    for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None, np.inf
+        o = pad + start[r] - start[r - 1] - 1
+        cand = windows[o:o + 3] # Neighbor above left, above and above right
+        k = cand.argmin(axis=0)
+        ext[pad:pad + bandWidth] = cand[k, cols] + E[r]
+        Pointer[r] = k - 1
+    C = ext[pad:pad + bandWidth]
+    minCol = C.argmin()
+    if C[minCol] == np.inf:
+        return None, np.inf
+    seam = np.zeros(M, dtype=np.int64)
+    seam[M - 1] = start[M - 1] + minCol
+    for r in range(M - 1, 0, -1):
+        seam[r - 1] = seam[r] + Pointer[r, seam[r] - start[r]]
+    return seam, C[minCol]
+
+findBandSeam = findBandSeam_Py
+try:
+    findBandSeam = Cy.findBandSeam
+except:
+    pass
+
+
+def findOptimalSeam_Np(s, stopFunc=None):
+    """
+    NumPy version of findOptimalSeam (every row is computed at once).
+    @see findOptimalSeam_Py
+    """
+    s = np.asarray(s, dtype=np.float64)
+    return findBandSeam_Py(s, np.zeros(s.shape[0], dtype=np.int64), s.shape[1], stopFunc)[0]
+
+
+def findOptimalSeam_Cy(s, stopFunc=None):
+    """
+    Cython version of findOptimalSeam.
+    @see findOptimalSeam_Py
+    """
+    return Cy.findOptimalSeam(np.ascontiguousarray(s, dtype=np.float64), stopFunc)
+
+def _checkpointRows(M):
+    # Rows between two checkpoints of findOptimalSeamCheckpointed, minimizes the memory use
+    return max(1, int(np.sqrt(8 * M)))
+
+
+def findOptimalSeamCheckpointed(s, stopFunc=None):
+    """
+    Like findOptimalSeam, but the offsets to the row above are not kept for the whole picture.
+    Only every k-th row of the cumulative energy is kept (k about sqrt(8*rows)). The offsets are
+    recomputed from these rows block by block while backtracking. Needs about 2*sqrt(8*rows)
+    bytes per column instead of at least one byte per pixel, but computes every row twice.
+    @see findOptimalSeam_Py
+    """
+    s = np.asarray(s, dtype=np.float64)
+    M, N = s.shape
+    B = _checkpointRows(M)
+    cols = np.arange(N)
+    ext = np.full(N + 2, np.inf) # The previous row, padded with inf
+    windows = np.lib.stride_tricks.sliding_window_view(ext, N)
+
+    def rows(C, r0, r1, Pointer=None):
+        # Computes the cumulative energy of the rows r0+1 ... r1 from the row r0 (C)
+        for r in range(r0 + 1, r1 + 1):
+            if stopFunc and stopFunc():
+                return None
+            ext[1:N + 1] = C
+            k = windows.argmin(axis=0) # Neighbor above left, above and above right
+            C = windows[k, cols] + s[r]
+            if Pointer is not None:
+                Pointer[r - r0 - 1] = k - 1
+        return C
+
+    checkpoints = [s[0].copy()]
+    C = checkpoints[0]
+    for r0 in range(0, M - 1, B):
+        C = rows(C, r0, min(M - 1, r0 + B))
+        if C is None:
+            return None
+        if r0 + B < M - 1:
+            checkpoints.append(C)
+    minCol = C.argmin()
+    if C[minCol] == np.inf:
+        return None
+    seam = np.zeros(M, dtype=np.int64)
+    seam[M - 1] = minCol
+    Pointer = np.zeros((B, N), dtype=np.int8)
+    for i in range(len(checkpoints) - 1, -1, -1):
+        r0 = i * B
+        r1 = min(M - 1, r0 + B)
+        if rows(checkpoints[i], r0, r1, Pointer) is None:
+            return None
+        for r in range(r1, r0, -1):
+            seam[r - 1] = seam[r] + Pointer[r - r0 - 1, seam[r]]
+    return seam
+
+
+def _seamMemory(bytesPerPixel, convert=True):
+    # Returns the memory estimate of a seam backend (see Backends.Kernel.register):
+    # bytesPerPixel for its tables, 8 more if s is converted to a contiguous float64 array.
+    def memory(s, *args, **kwargs):
+        s = np.asarray(s)
+        copy = convert and not (s.dtype == np.float64 and s.flags.c_contiguous)
+        return s.size * (bytesPerPixel + 8 * copy)
+    return memory
+
+
+def _checkpointMemory(s, *args, **kwargs):
+    M, N = np.shape(s)
+    copy = 0 if np.asarray(s).dtype == np.float64 else 8 * M * N
+    return N * (8 * (M // _checkpointRows(M) + 8) + _checkpointRows(M)) + copy
+
+
+findOptimalSeam = Backends.kernel("seam", _pixels, lambda size: (_sampleEnergy(size),), findOptimalSeam_Py.__doc__)
+if Cy is not None:
+    findOptimalSeam.register("cython", findOptimalSeam_Cy, memory=_seamMemory(24))
+    if hasattr(Cy, "findOptimalSeamParallel"):
+        findOptimalSeam.register("openmp", lambda s, stopFunc=None: findOptimalSeamParallel(s, stopFunc=stopFunc),
+                                 memory=_seamMemory(1))
+if Nb is not None:
+    findOptimalSeam.register("numba", Nb.findOptimalSeam, memory=_seamMemory(1))
+findOptimalSeam.register("numpy", findOptimalSeam_Np, memory=_seamMemory(17))
+findOptimalSeam.register("python", findOptimalSeam_Py, calibrate=False, memory=_seamMemory(24, False)) # Only as reference
+findOptimalSeam.register("checkpoint", findOptimalSeamCheckpointed, calibrate=False, memory=_checkpointMemory)
+
+
+def _forwardCosts(gray, r):
+    # The costs of the new edges in row r: (above left, above, above right)
+    left = np.concatenate((gray[r, :1], gray[r, :-1]))
+    right = np.concatenate((gray[r, 1:], gray[r, -1:]))
+    cU = np.abs(right - left)
+    if r == 0:
+        return None, cU, None
+    return cU + np.abs(gray[r - 1] - left), cU, cU + np.abs(gray[r - 1] - right)
+
+
+def findOptimalSeamForward_Np(gray, energy=None, stopFunc=None):
+    """
+    Finds the seam with the lowest forward energy, the energy of the new edges between
+    the pixels that become neighbors after removing the seam. In contrast to findOptimalSeam
+    no energy function has to be computed (again after removing a seam).
+    @param gray The grayscale picture
+    @param energy An additional energy of every pixel (numpy array) or None
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return The seam, None if stopped or if there is no seam with finite energy.
+    """
+    gray = np.asarray(gray, dtype=np.float64)
+    M, N = gray.shape
+    cols = np.arange(N)
+    Pointer = np.zeros((M, N), dtype=np.int8)
+    ext = np.full(N + 2, np.inf) # The previous row, padded with inf
+    windows = np.lib.stride_tricks.sliding_window_view(ext, N)
+    C = _forwardCosts(gray, 0)[1]
+    if energy is not None:
+        C = C + energy[0]
+    for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None
+        ext[1:N + 1] = C
+        cand = windows[0:3] + _forwardCosts(gray, r)
+        k = cand.argmin(axis=0)
+        C = cand[k, cols]
+        if energy is not None:
+            C += energy[r]
+        Pointer[r] = k - 1
+    minCol = C.argmin()
+    if C[minCol] == np.inf:
+        return None
+    seam = np.zeros(M, dtype=np.int64)
+    seam[M - 1] = minCol
+    for r in range(M - 1, 0, -1):
+        seam[r - 1] = seam[r] + Pointer[r, seam[r]]
+    return seam
+
+
+def forwardSeamEnergy(gray, seam):
+    """
+    Summarizes the forward energy of a seam (see findOptimalSeamForward).
+    @param gray The grayscale picture
+    @param seam The seam
+    @return The forward energy of the seam.
+    """
+    gray = np.asarray(gray, dtype=np.float64)
+    h, w = gray.shape
+    rows = np.arange(h)
+    left = gray[rows, np.maximum(seam - 1, 0)]
+    right = gray[rows, np.minimum(seam + 1, w - 1)]
+    res = np.abs(right - left).sum()
+    step = np.diff(seam)
+    up = gray[rows[1:] - 1, seam[1:]] # The pixel above the seam pixel (see _forwardCosts)
+    res += np.abs(up - left[1:])[step == 1].sum() # Coming from above left
+    res += np.abs(up - right[1:])[step == -1].sum() # Coming from above right
+    return res
+
+findOptimalSeamForward = Backends.kernel("forwardSeam", _pixels, lambda size: (_sampleEnergy(size),),
+                                         findOptimalSeamForward_Np.__doc__)
+if Cy is not None:
+    findOptimalSeamForward.register("cython", lambda gray, energy=None, stopFunc=None:
+        Cy.findOptimalSeamForward(np.asarray(gray, dtype=np.float64), energy, stopFunc))
+findOptimalSeamForward.register("numpy", findOptimalSeamForward_Np)
+
+
+def _downsampleEnergy(s):
+    """
+    Halves the size of the energy by summing up blocks of 2x2 pixels.
+    Odd sizes are padded by repeating the last row/column.
+    """
+    M, N = s.shape
+    if M % 2 or N % 2:
+        s = np.pad(s, ((0, M % 2), (0, N % 2)), mode="edge")
+    return s[0::2, 0::2] + s[1::2, 0::2] + s[0::2, 1::2] + s[1::2, 1::2]
+
+
+def findOptimalSeamPyramid(s, levels=None, band=2, minWidth=64, tolerance=None, stopFunc=None):
+    """
+    Coarse to fine approximation of findOptimalSeam.
+    The seam is searched on a downsampled energy and then refined on every finer level
+    within a narrow band of columns around the upsampled path.
+    @param s The energy function (a numpy array)
+    @param levels Number of times the energy is halved. None chooses it by minWidth.
+    @param band Number of columns left and right of the upsampled path that are searched.
+    @param minWidth The coarsest level is at least that wide (if levels is None).
+    @param tolerance If not None, the exact search is used when the cost of the refined seam
+           exceeds the cost estimated from the coarser level by more than tolerance*|estimate|.
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return The seam (see findOptimalSeam)
+    """
+    s = np.asarray(s, dtype=np.float64)
+    pyramid = [s]
+    while (levels is None and min(pyramid[-1].shape) >= 2 * minWidth and pyramid[-1].shape[1] >= 2 * minWidth) \
+            or (levels is not None and len(pyramid) <= levels and min(pyramid[-1].shape) >= 4):
+        pyramid.append(_downsampleEnergy(pyramid[-1]))
+    def exactSeam(energy): # The whole width as band is the exact search
+        return findBandSeam(energy, np.zeros(energy.shape[0], dtype=np.int64), energy.shape[1], stopFunc)
+
+    if len(pyramid) == 1:
+        return exactSeam(s)[0]
+    seam, cost = exactSeam(pyramid[-1])
+    if seam is None:
+        return None
+    for level in range(len(pyramid) - 2, -1, -1):
+        energy = pyramid[level]
+        M, N = energy.shape
+        bandWidth = min(N, 2 * band + 2)
+        start = np.clip(2 * seam[np.arange(M) // 2] - band, 0, N - bandWidth)
+        seam, refined = findBandSeam(energy, start, bandWidth, stopFunc)
+        if stopFunc and stopFunc():
+            return None
+        estimate = cost / 2 # A seam crosses two rows of a 2x2 block, one pixel in each row
+        if seam is None or (tolerance is not None and refined - estimate > tolerance * abs(estimate)):
+            return exactSeam(s)[0]
+        cost = refined
+    return seam
+
+
+def _pyramidMemory(s, *args, **kwargs):
+    # The coarser levels need a third of the energy, the band tables a few columns per row
+    M, N = np.shape(s)
+    copy = 0 if np.asarray(s).dtype == np.float64 else 8 * M * N
+    return 8 * M * N // 3 + 64 * M + copy
+
+
+# Approximation (not exact, so it is only used when forced, e.g. SEAMEATER_BACKEND=seam=pyramid)
+findOptimalSeam.register("pyramid", findOptimalSeamPyramid, calibrate=False, memory=_pyramidMemory)
+
+def _cumulativeEnergy_Py(s, stopFunc=None):
+    """
+    Computes the table of the cumulative energy used by findOptimalSeam.
+    @param s The energy function (a numpy array)
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return (C, Pointer). C[r, c] is the energy of the best seam from the first row to (r, c),
+            Pointer[r, c] the offset (-1, 0, 1) of its column in row r-1. None, if stopped.
+    """
+    M, N = s.shape
+    cols = np.arange(N)
+    C = np.empty((M, N))
+    Pointer = np.zeros((M, N), dtype=np.int8)
+    C[0] = s[0]
+    ext = np.full(N + 2, np.inf) # The previous row, padded with inf
+    windows = np.lib.stride_tricks.sliding_window_view(ext, N)
+    for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None
+        ext[1:N + 1] = C[r - 1]
+        k = windows.argmin(axis=0) # Neighbor above left, above and above right
+        C[r] = windows[k, cols] + s[r]
+        Pointer[r] = k - 1
+    return C, Pointer
+
+
+def _updateCumulativeEnergy_Py(s, C, Pointer, seam):
+    """
+    Updates the table of cumulative energy (see _cumulativeEnergy_Py) after the energy s was changed
+    only on the pixels of the seam. Only the columns that can have changed are recomputed:
+    in every row the columns next to the changed columns of the row above and the seam pixel.
+    @param s The changed energy function
+    @param C The cumulative energy (changed in place)
+    @param Pointer The offsets to the row above (changed in place)
+    @param seam The seam (column of every row) where s was changed
+    """
+    M, N = s.shape
+    lo = hi = seam[0]
+    C[0, lo] = s[0, lo]
+    for r in range(1, M):
+        if lo <= hi:
+            a = min(max(lo - 1, 0), seam[r])
+            b = max(min(hi + 1, N - 1), seam[r]) + 1
+        else:
+            a, b = seam[r], seam[r] + 1
+        ext = np.full(b - a + 2, np.inf) # The columns a-1 ... b of the previous row
+        ext[max(0, 1 - a):min(b - a + 2, N - a + 1)] = C[r - 1, max(0, a - 1):min(b + 1, N)]
+        windows = np.lib.stride_tricks.sliding_window_view(ext, b - a)
+        k = windows.argmin(axis=0)
+        new = windows[k, np.arange(b - a)] + s[r, a:b]
+        changed = np.flatnonzero(new != C[r, a:b])
+        C[r, a:b] = new
+        Pointer[r, a:b] = k - 1
+        if len(changed):
+            lo, hi = a + changed[0], a + changed[-1]
+        else:
+            lo, hi = N, -1
+
+
+_cumulativeEnergy = _cumulativeEnergy_Py
+_updateCumulativeEnergy = _updateCumulativeEnergy_Py
+try:
+    _cumulativeEnergy = Cy.cumulativeEnergy
+    _updateCumulativeEnergy = Cy.updateCumulativeEnergy
+except:
+    pass
+
+
+def _claimPath_Py(C, Pointer, claimed, col, maxSteps):
+    """
+    Backtracks a seam from the column col of the last row and claims its pixels.
+    If the path leads to a claimed pixel, the unclaimed neighbor above with the lowest
+    cumulative energy is used instead. If there is none, the path goes back up to maxSteps rows
+    and tries the other neighbors there.
+    @param C The cumulative energy
+    @param Pointer The offsets to the row above
+    @param claimed The pixels used by other seams (1 = used, changed in place)
+    @param col The column in the last row (not claimed)
+    @param maxSteps The maximal number of steps back
+    @return The seam, None if the path cannot be repaired.
+    """
+    h, w = C.shape
+    seam = np.zeros(h, dtype=np.int64)
+    tried = [set() for r in range(h)] # The tried neighbors in row r-1
+    seam[h - 1] = col
+    r = h - 1
+    steps = 0
+    while r > 0:
+        c = int(seam[r])
+        best = -1
+        pref = c + int(Pointer[r, c])
+        if not pref in tried[r] and not claimed[r - 1, pref]:
+            best = pref
+        else:
+            for n in range(max(0, c - 1), min(w, c + 2)):
+                if not n in tried[r] and not claimed[r - 1, n] and (best < 0 or C[r - 1, n] < C[r - 1, best]):
+                    best = n
+        if best < 0: # Dead end, go back
+            r += 1
+            steps += 1
+            if r >= h or steps > maxSteps:
+                return None
+            continue
+        tried[r].add(best)
+        seam[r - 1] = best
+        r -= 1
+        tried[r] = set()
+    claimed[np.arange(h), seam] = 1
+    return seam
+
+
+_claimPath = _claimPath_Py
+try:
+    _claimPath = Cy.claimPath
+except:
+    pass
+
+
+def _findTopDisjointSeamsApprox(s, count, progressFunc, bigvalue, stopFunc, previewFunc):
+    """
+    @see findTopDisjointSeams with approximate=True
+    """
+    (h, w) = s.shape
+    shapes = np.zeros((count, h), dtype=np.int64)
+    claimed = np.zeros((h, w), dtype=np.uint8)
+    s = np.array(s, dtype=np.float64) # The found seams are marked in this copy
+    rows = np.arange(h)
+    found = 0
+    while found < count:
+        table = _cumulativeEnergy(s, stopFunc)
+        if table is None:
+            return shapes[:0]
+        C, Pointer = table
+        foundBefore = found
+        for col in np.argsort(C[h - 1], kind="stable"):
+            if stopFunc and stopFunc():
+                return shapes[:0]
+            if C[h - 1, col] == np.inf or found == count:
+                break
+            if claimed[h - 1, col]:
+                continue
+            seam = _claimPath(C, Pointer, claimed, col, h)
+            if seam is None: # Cannot be repaired => new DP with the claimed pixels
+                break
+            shapes[found] = seam
+            s[rows, seam] = bigvalue
+            found += 1
+            if not progressFunc is None:
+                progressFunc(found * 100 / count)
+            if previewFunc:
+                previewFunc(SeamSet(shapes[:found], (h, w)))
+        if found == foundBefore: # Even the new DP gives no usable seam
+            break
+    return shapes[:found]
+
+
+def _findTopDisjointSeamsRepeated(s, count, progressFunc, bigvalue, stopFunc, previewFunc, maxBytes):
+    # findTopDisjointSeams without the table of the cumulative energy: the seam search runs again after every seam
+    h, w = s.shape
+    if 8 * h * w > maxBytes: # The copy of s is needed anyway
+        raise MemoryBudgetError("findTopDisjointSeams", 8 * h * w + _checkpointMemory(s), maxBytes)
+    s = np.array(s, dtype=np.float64)
+    shapes = np.zeros((count, h), dtype=np.int64)
+    rows = np.arange(h)
+    found = 0
+    for pack in range(count):
+        if stopFunc and stopFunc():
+            return shapes[:0]
+        if not progressFunc is None:
+            progressFunc((pack + 1) * 100 / count)
+        seam = findOptimalSeam(s, stopFunc, maxBytes=maxBytes - 8 * h * w)
+        if seam is None:
+            if stopFunc and stopFunc():
+                return shapes[:0]
+            break
+        shapes[found] = seam
+        found += 1
+        if previewFunc:
+            previewFunc(SeamSet(shapes[:found], (h, w)))
+        s[rows, seam] = bigvalue
+    return shapes[:found]
+
+
+def findTopDisjointSeams(s, count, progressFunc=None, bigvalue=np.inf, stopFunc = None, approximate=False,
+                         previewFunc=None, maxBytes=None):
     """
       Tries to find a list of seams which are pairwise disjoint.
       In other words two seams, which do not have the same value in 
       the same row.
       Sometimes the algorithm cannot find as many disjoint seams as needed.
       In that case, the algorithm returns only the found disjoint seams. 
+      The table of the cumulative energy is computed once, after every seam only the part
+      below the seam that has changed is recomputed.
       @param s The energy numpy array 
       @param count the number of seams to find
       @param bigvalue A value to replace the energy on seams that are already found. (Used to find disjoint seams).
       @param stopFunc Function, if stopFunct()==True then the algorithm will stop.
-      @return List of seams. [], if stopped.
+      @param approximate If True, the table of the cumulative energy is computed only once and the seams
+                         are backtracked from the lowest entries of the last row. A seam running into an
+                         already found one is re-routed locally (going back some rows if needed), only if
+                         that fails the table is computed again.
+                         Much faster for many seams, but the seams are not always optimal.
+      @param previewFunc Called with a SeamSet of the seams found so far after every seam. (SeamSet -> )
+      @param maxBytes The memory budget in bytes, None for no limit. The table needs 17 bytes per pixel,
+                      without room for it the seams are searched one after another with findOptimalSeam
+                      (same result, but slower).
+      @return SeamSet of the seams (an array with the shape (number of seams, h)). Empty, if stopped.
+      @throws MemoryBudgetError if not even the copy of s fits into maxBytes
     """
     (h, w) = s.shape
-    shapes = []
-    toAdd = [w * i for i in range(h)]
-
-    def biggerSeam(seam, array):
-        tmp = array.flatten()
-        tmp[seam + toAdd] = bigvalue
-        return tmp.reshape((h, w))
-
+    stopFunc = asCancelToken(stopFunc)
+    progressFunc = asProgressReporter(progressFunc)
+    shapes = np.zeros((max(0, count), h), dtype=np.int64)
+    if count <= 0:
+        return SeamSet(shapes, (h, w))
+    if maxBytes is not None and (17 + approximate) * h * w > maxBytes:
+        return SeamSet(_findTopDisjointSeamsRepeated(s, count, progressFunc, bigvalue, stopFunc, previewFunc, maxBytes),
+                       (h, w))
+    if approximate:
+        return SeamSet(_findTopDisjointSeamsApprox(s, count, progressFunc, bigvalue, stopFunc, previewFunc), (h, w))
+    s = np.array(s, dtype=np.float64) # The found seams are marked in this copy
+    rows = np.arange(h)
+    table = _cumulativeEnergy(s, stopFunc)
+    if table is None:
+        return SeamSet(shapes[:0], (h, w))
+    C, Pointer = table
+    found = 0
     for pack in range(count):
         if stopFunc and stopFunc():
-            return []
+            return SeamSet(shapes[:0], (h, w))
         if not progressFunc is None:
             progressFunc((pack + 1) * 100 / count)
-        seam = findOptimalSeam(s, stopFunc)
-        if seam is None:
+        minCol = C[h - 1].argmin()
+        if C[h - 1, minCol] == np.inf:
             break
-        shapes.append(seam)
-        s = biggerSeam(seam, s)
-    return shapes
+        seam = shapes[found]
+        seam[h - 1] = minCol
+        for r in range(h - 1, 0, -1):
+            seam[r - 1] = seam[r] + Pointer[r, seam[r]]
+        found += 1
+        if previewFunc:
+            previewFunc(SeamSet(shapes[:found], (h, w)))
+        s[rows, seam] = bigvalue
+        if found < count:
+            _updateCumulativeEnergy(s, C, Pointer, seam)
+    return SeamSet(shapes[:found], (h, w))
 
 
 def defaultSeam(img):
@@ -115,103 +666,166 @@ def defaultSeam(img):
     return findOptimalSeam(img_div)
 
 
-def removeSeams(img, seams):
+def removeSeams_Np(img, seams):
     """
     Remove the seams in the image img.
     @param img The image
-    @param seams a list of seams or just one.
+    @param seams a list of seams, just one or a SeamSet.
     @return A image where the seams are removed.
     """
-    if type(seams) == np.ndarray:
-        seams = [seams]
-    def removeGray(img):
-        h, w = img.shape
-        toAdd = np.array([w * x for x in range(0, h)])
-        toDelete = np.array([])
-        for seam in seams:
-            toDelete = np.append(toDelete, seam + toAdd)
-        nimg = np.delete(img, toDelete)
-        nimg.shape = (h, w - len(seams))
-        return nimg
-    if type(seams) == np.ndarray:
-        seams = [seams]
-    if np.ndim(img) == 3:
-            h, w, p = img.shape
-            toAdd = np.array([w * x for x in range(0, h)])
-            toAppend = np.array([])
-            for seam in seams:
-                toAppend = np.append(toAppend, (seam + toAdd) * p)
-            toDel = np.array([])
-            for k in range(0, p):
-                toDel = np.append(toDel, toAppend + k)
-            nimg = np.delete(img, toDel)
-            nimg.shape = (h, w - len(seams), p)
-            return nimg
-    else:
-        return removeGray(img)
+    if isHorizontal(seams):
+        return np.swapaxes(removeSeams_Np(np.swapaxes(img, 0, 1), seams.transposed()), 0, 1)
+    h, w = img.shape[:2]
+    seams = asSeamArray(seams, h)
+    keep = np.ones((h, w), dtype=bool)
+    keep[np.arange(h), seams] = False
+    return img[keep].reshape((h, w - len(seams)) + img.shape[2:])
+
 
+removeSeams = Backends.kernel("removeSeams", _pixels, _sampleSeams, removeSeams_Np.__doc__)
+removeSeams.register("numpy", removeSeams_Np)
+if Nb is not None:
+    removeSeams.register("numba", Nb.removeSeams)
 
-def removeSeamsInGradient(img, seams, it=20, mixCount=15, progressFunc = None, stopFunc = None):
+
+def removeMaskedObject(img, mask, energyFactory, progressFunc=None, stopFunc=None):
+    '''
+    Removes a marked object by removing seams through it.
+    The seams are vertical or horizontal, whichever needs fewer seams for the bounding box of the mask.
+    Seams through the mask can only reach a window of columns around it (a seam moves at most one
+    column per row), so the seams are only searched in that window. Every iteration removes several
+    disjoint seams through all marked rows.
+    @param img The image
+    @param mask mask[y,x]>0 => The pixel belongs to the object
+    @param energyFactory A function computing the energy function (numpy array) of an image
+    @param progressFunc A function for showing the progress. (int -> )
+    @param stopFunc Function, stopFunc()==True stops the algorithm. (-> boolean)
+    @return The image without the object. None, if stopped.
+    '''
+    stopFunc = asCancelToken(stopFunc)
+    marked = np.asarray(mask) > 0
+    h, w = marked.shape
+    colCount = np.count_nonzero(marked.any(axis=0))
+    rowCount = np.count_nonzero(marked.any(axis=1))
+    energy = np.array(energyFactory(img), dtype=np.float64)
+    energy[marked] = -abs(energy.max()) * h * w # Be as little as possible so it cannot be reached otherwise.
+    vertical = colCount <= rowCount
+    if not vertical:
+        img, marked, energy = [np.ascontiguousarray(np.swapaxes(a, 0, 1)) for a in (img, marked, energy)]
+    total = min(colCount, rowCount)
+    removed = 0
+    while True:
+        if stopFunc and stopFunc():
+            return None
+        cols = np.flatnonzero(marked.any(axis=0))
+        if len(cols) == 0:
+            break
+        rows = np.flatnonzero(marked.any(axis=1))
+        h, w = marked.shape
+        reach = max(rows[-1], h - 1 - rows[0]) # The farthest a seam through the mask can go from it
+        left = max(0, cols[0] - reach)
+        right = min(w, cols[-1] + reach + 1)
+        seams = findTopDisjointSeams(energy[:, left:right], len(cols), stopFunc=stopFunc)
+        if stopFunc and stopFunc():
+            return None
+        # Only seams that remove a marked pixel in every marked row, at least the best seam through the mask
+        hits = marked[:, left:right][np.arange(h), seams.array]
+        through = hits[:, rows].all(axis=1)
+        if not through.any():
+            through = hits.any(axis=1) & (np.arange(len(seams)) == 0)
+        seams = seams[through]
+        if len(seams) == 0:
+            break
+        seams = SeamSet(seams.array.astype(np.int64) + left, (h, w))
+        img = removeSeams(img, seams)
+        marked = removeSeams(marked, seams)
+        energy = removeSeams(energy, seams)
+        removed += len(seams)
+        if progressFunc:
+            progressFunc(min(100, removed * 100 / total))
+    if not vertical:
+        img = np.swapaxes(img, 0, 1)
+    return np.ascontiguousarray(img)
+
+
+def removeSeamsInGradient(img, seams, it=20, mixCount=15, progressFunc = None, stopFunc = None, maxBytes=None):
     '''
     Removes seams from the gradient of the image img and reconstructs the result image
     from the gradient.
     @param img The image
-    @param seams A list of seams or just one
+    @param seams A list of seams, just one or a SeamSet
     @param it Number of iterations used to solve the system of linear equations. 0 let solve the equations exactly.
     @param mixCount number of pixel that will be deleted around the seams and be mixed with the original picture.
     @param progressFunc A function for showing the progress. (int -> )
     @param stopFunc Function. Stops the algorithm when evaluated to true. (-> boolean)
+    @param maxBytes The memory budget in bytes, None for no limit. The system of linear equations is solved
+                    with a backend of poissonInsertMask that fits (the dense matrix needs 24 bytes per square
+                    of the number of mixed pixels, the sparse one about 200 bytes per mixed pixel).
     @return The reconstructed picture. None, if stopped.
+    @throws MemoryBudgetError if no backend fits into maxBytes
     '''
-    if type(seams) == np.ndarray:
-        seams = [seams]
+    if isHorizontal(seams):
+        res = removeSeamsInGradient(np.swapaxes(img, 0, 1), seams.transposed(), it, mixCount, progressFunc, stopFunc,
+                                    maxBytes)
+        return None if res is None else np.swapaxes(res, 0, 1)
+    stopFunc = asCancelToken(stopFunc)
+    progressFunc = asProgressReporter(progressFunc)
+    seams = asSeamArray(seams, img.shape[0])
+    h, w = img.shape[:2]
+    poissonBytes = None
+    if maxBytes is not None:
+        # The result, the mask and the removed channel, laplace_div needs about 420 bytes per pixel (FFT)
+        needed = 8 * np.size(img) + 8 * 4 * h * w + 420 * h * w
+        if needed > maxBytes:
+            raise MemoryBudgetError("removeSeamsInGradient", needed, maxBytes)
+        poissonBytes = maxBytes - needed
+    # The pixels around the seams are mixed, the nearer to a seam the more reconstructed.
+    # A pixel near several seams is reconstructed completely.
+    offsets = np.arange(-mixCount, mixCount)
+    weights = 1 - np.abs(offsets) * 1.0 / (mixCount + 1)
+    rows = np.arange(h)[:, None]
+    mask = np.zeros((h, w))
+    for seam in seams:
+        if stopFunc and stopFunc():
+            return None
+        cols = seam[:, None] + offsets
+        inside = (cols >= 0) & (cols < w)
+        r, c = np.broadcast_to(rows, cols.shape)[inside], cols[inside]
+        mask[r, c] = np.where(mask[r, c] == 0, np.broadcast_to(weights, cols.shape)[inside], 1)
+    mask = removeSeams(mask, seams)
+
     def removeGray(img, progressFunc):
-        h, w = img.shape
         img_div = removeSeams(laplace_div(img), seams)
         img_rem = removeSeams(img, seams)
-        mask = np.zeros((h, w))
-        for seam in seams:
-            for i in range(h):
-                pos = seam[i]
-                for k in range(-mixCount, mixCount):
-                    if stopFunc and stopFunc():
-                        return None
-                    if pos + k >= 0 and pos + k < w:
-                        if mask[i, pos + k] == 0:
-                            mask[i, pos + k] = 1 - abs(k) * 1.0 / (mixCount + 1)
-                        else:
-                            mask[i, pos + k] = 1  
-        mask = removeSeams(mask, seams)
-        return poissonInsertMask(img_rem, mask, img_div, it, progressFunc, stopFunc)
+        return poissonInsertMask(img_rem, mask, img_div, it, progressFunc, stopFunc, maxBytes=poissonBytes)
 
     if np.ndim(img) == 3:
-        h, w, p = img.shape
+        p = img.shape[2]
         res = np.zeros((h, w - len(seams), p))
-        nprogressFunc = None
+        stages = progressFunc.stages([1] * p) if progressFunc else [None] * p
         for i in range(p):
-            if progressFunc:
-                nprogressFunc = lambda k: progressFunc(i*100/p+k/p)
-            res[:, :, i] = removeGray(img[:, :, i], nprogressFunc)
+            channel = removeGray(img[:, :, i], stages[i])
+            if channel is None:
+                return None
+            res[:, :, i] = channel
         return res
     else:
         return removeGray(img, progressFunc)
 
 
-def duplicateSeams(img, seams):
+def duplicateSeams_Np(img, seams):
     """
       Duplicates and interpolates seams.
       @param img The Image
-      @param seams the list of seams.
+      @param seams the list of seams or a SeamSet.
     """
     if len(seams) == 0:
         return img
+    if isHorizontal(seams):
+        return np.swapaxes(duplicateSeams_Np(np.swapaxes(img, 0, 1), seams.transposed()), 0, 1)
     def duplicateGray(img):
         h, w = img.shape
-        toAdd = np.array([w * x for x in range(0, h)])
-        res = np.array([])
-        for seam in seams:
-            res = np.concatenate((res, seam + toAdd))
-        res = res.astype("int")
+        res = (asSeamArray(seams, h) + np.arange(h) * w).ravel()
         not_edge_right = ((res+1) % w != 0).astype("int") # Points at the left edge of the image => do not interpolate left
         not_edge_left = (res % w != 0).astype("int") # Points at the right edge => do not interpolate right
         img = img.flatten()
@@ -230,6 +844,12 @@ def duplicateSeams(img, seams):
         return duplicateGray(img)
 
 
+duplicateSeams = Backends.kernel("duplicateSeams", _pixels, _sampleSeams, duplicateSeams_Np.__doc__)
+duplicateSeams.register("numpy", duplicateSeams_Np)
+if Nb is not None:
+    duplicateSeams.register("numba", Nb.duplicateSeams)
+
+
 def resizeConventional(img, newWidth, newHeight):
     '''
     Scales the image with Nearest Neighbor
@@ -280,57 +900,103 @@ def seamEnergy(energy, seam):
     '''
     Summarizes the energy of every pixel, which the seam contains.
     @param energy the energy function (numpy array)
-    @param seam the seam
-    @return the energy of the seam.
+    @param seam the seam, a list of seams or a SeamSet
+    @return the energy of the seam. For several seams an array with the energy of every seam.
     '''
+    if isinstance(seam, SeamSet):
+        return seam.cost(energy)
+    if np.ndim(seam) == 2:
+        return SeamSet(seam, energy.shape).cost(energy)
     h, w = energy.shape
     toAdd = [r * w for r in range(h)]
     return energy.flatten()[seam + toAdd].sum()
 
 
-def retargetingImage(img, xCount, yCount, energyFactory, progressFunc=None, stopFunc = None):
+def retargetingImage(img, xCount, yCount, energyFactory, progressFunc=None, stopFunc = None, forward=False,
+                     previewFunc=None, maxBytes=None):
     '''
     Retargeting the image with optimal seam order.
     Resizes the image by finding the optimal order for deleting vertically or horizontally.
+    Only the images of the last row (or column, whichever is shorter) of steps are kept.
     @param img The image
     @param xCount The number of column to delete.
     @param yCount The number of rows to delete.
     @param energyFactory A function computing the energy function (numpy array) of an image (numpy image -> numpy image)
     @param progressFunc Will be called if progress happens. (int ->)
     @param stopFunc  Function, if stopFunc()==True then the algorithm stops. (-> boolean)
+    @param forward If True, the seams with the lowest forward energy are used (see findOptimalSeamForward)
+                   and energyFactory is not used.
+    @param previewFunc Will be called with every intermediate image. (numpy image ->)
+    @param maxBytes The memory budget in bytes, None for no limit. The seams are searched with a backend
+                    that fits into the memory left by the kept images (see findOptimalSeam).
     @return A image decreasing the width and height by xCount and yCount.
+    @throws MemoryBudgetError if the kept images do not fit into maxBytes
     '''
+    stopFunc = asCancelToken(stopFunc)
+    progressFunc = asProgressReporter(progressFunc)
     h = img.shape[0]
     w = img.shape[1]
+    transposed = yCount < xCount # The steps are computed column by column
+    outerCount, innerCount = (xCount, yCount) if transposed else (yCount, xCount)
+    seamBytes = None
+    if maxBytes is not None:
+        # The kept images, the copies of a step and the energy (with some temporary arrays)
+        needed = (innerCount + 4) * np.asarray(img).nbytes + 4 * 8 * h * w
+        if forward:
+            needed += 9 * h * w # Forward energy: The gray picture and the offsets
+        if needed > maxBytes:
+            raise MemoryBudgetError("retargetingImage", needed, maxBytes)
+        seamBytes = maxBytes - needed
+
+    def optimalSeam(img):
+        # Returns the optimal vertical seam and its energy
+        if forward:
+            gray = makeGray(img * 1.0)
+            seam = findOptimalSeamForward(gray, stopFunc=stopFunc)
+            return seam, None if seam is None else forwardSeamEnergy(gray, seam)
+        energyFunc = energyFactory(img)
+        seam = findOptimalSeam(energyFunc, stopFunc, maxBytes=seamBytes)
+        return seam, None if seam is None else seamEnergy(energyFunc, seam)
     costMatrix = np.zeros((yCount + 1, xCount + 1)) # Contains the cost of each step
-    imageMatrix = [[None for x in range(xCount + 1)] for y in range(yCount + 1)] # Contains all calculated images
-    imageMatrix[0][0] = img
-    for y in range(yCount + 1):
-        for x in range(xCount + 1):
+    # frontier[j] holds the image of the step j of the current row (or column) of steps if it is
+    # already computed, otherwise the image of the step j of the previous one.
+    frontier = [None] * (innerCount + 1)
+    frontier[0] = img
+    for i in range(outerCount + 1):
+        for j in range(innerCount + 1):
+            y, x = (j, i) if transposed else (i, j)
             if stopFunc and stopFunc():
                 return
+            if x == 0 and y == 0:
+                continue
+            imageAbove = frontier[j - 1] if transposed else frontier[j] # The image of the step (y - 1, x)
+            imageLeft = frontier[j] if transposed else frontier[j - 1] # The image of the step (y, x - 1)
             energyAbove = None #Energy by removing seam within image above in imageArray
             seamAbove = None # Seam for removing in the image above
             energyLeft = None # Energy by removing within image left
             seamLeft = None # Seam for that.
             if y > 0:
-                img = rotateMirror(imageMatrix[y - 1][x]) # Calculate horizontal seam
-                energyFunc = energyFactory(img)
-                seamAbove = findOptimalSeam(energyFunc)
-                energyAbove = costMatrix[y - 1, x] + seamEnergy(energyFunc, seamAbove)
+                img = rotateMirror(imageAbove) # Calculate horizontal seam
+                seamAbove, energy = optimalSeam(img)
+                energyAbove = None if energy is None else costMatrix[y - 1, x] + energy
             if x > 0:
-                img = imageMatrix[y][x - 1] # Calculate vertical seam
-                energyFunc = energyFactory(img)
-                seamLeft = findOptimalSeam(energyFunc)
-                energyLeft = costMatrix[y, x - 1] + seamEnergy(energyFunc, seamLeft)
+                img = imageLeft # Calculate vertical seam
+                seamLeft, energy = optimalSeam(img)
+                energyLeft = None if energy is None else costMatrix[y, x - 1] + energy
+            if stopFunc and stopFunc():
+                return
             if progressFunc:
-                progressFunc((x + (y * (xCount + 1))) * 100 / ((xCount + 1) * (yCount + 1)))
+                progressFunc((j + (i * (innerCount + 1))) * 100 / ((xCount + 1) * (yCount + 1)))
+            res = None
             if ((not energyAbove is None and not energyLeft is None and energyAbove <= energyLeft) or (
                 not energyAbove is None and energyLeft is None)): #  Better removing horizontal (less energy)
                 costMatrix[y, x] = energyAbove 
-                imageMatrix[y][x] = rotateMirror(removeSeams(rotateMirror(imageMatrix[y - 1][x]), seamAbove))
+                res = rotateMirror(removeSeams(rotateMirror(imageAbove), seamAbove))
             elif ((not energyAbove is None and not energyLeft is None and energyAbove > energyLeft) or (
                 not energyLeft is None and energyAbove is None)): # Better removing vertically
                 costMatrix[y, x] = energyLeft
-                imageMatrix[y][x] = removeSeams(imageMatrix[y][x - 1], seamLeft)
-    return imageMatrix[yCount][xCount] 
+                res = removeSeams(imageLeft, seamLeft)
+            frontier[j] = res
+            if previewFunc and res is not None:
+                previewFunc(res)
+    return frontier[innerCount]
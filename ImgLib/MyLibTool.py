@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import numpy as np
+from ImgLib.SeamSet import SeamSet
 def makeGray(img):
     '''
     Converts a picture (may already gray) into a grayscale picture.
@@ -18,36 +19,40 @@ def seamsToRealIndex(shape,seams):
     '''
     Returns the indexes of the seams in a flatten image.
     @param shape the shape of the image where the indexes should be calculated with.
-    @param seams A list of the seams
+    @param seams A list of the seams or a SeamSet
     @return An array of the indexes.
     '''
-    h,w = shape
-    allSeams = np.array([])
-    toAdd = np.array([w*x for x in range(h)])
-    for seam in seams:
-        allSeams = np.append(allSeams,seam+toAdd)
-    return allSeams.astype(np.int)
+    if not isinstance(seams, SeamSet):
+        seams = SeamSet(seams, shape)
+    return seams.flatIndices().ravel()
 
 def drawSeamsInImage(img, seams):
     '''
     Draws the seams into the picture
     @param img The picture
-    @param seams The seams
+    @param seams The seams (a list or a SeamSet)
     @return The picture where the seams are drawn in.
     '''
+    h, w = img.shape[:2]
+    mask = np.zeros(h * w, dtype=bool)
+    mask[seamsToRealIndex((h, w), seams)] = True
+    mask.shape = (h, w)
+    res = img.copy()
+    res[mask] = 255 - res[mask]
+    return res
 
-    def drawSeamGray(imgB, seamsB):
-        h, w = imgB.shape
-        allSeams = seamsToRealIndex(imgB.shape,seamsB)
-        imgR = imgB.flatten()
-        imgR[allSeams] = 255 - imgR[allSeams]
-        imgR.shape = (h, w)
-        return imgR
-
-    if (np.ndim(img) == 3):
-        h, w, p = img.shape
-        res = img.copy()
-        for i in range(p):
-            res[:, :, i] = drawSeamGray(img[:, :, i], seams)
-        return res
-    return drawSeamGray(img, seams)
+def downscale(img, step, reduce=np.mean):
+    '''
+    Reduces the size of a picture by an integer factor, every block of step x step pixels becomes one pixel.
+    @param img The picture (colored or gray)
+    @param step The factor
+    @param reduce The function combining the pixels of a block (e.g. np.mean or np.max for masks)
+    @return The picture with the size (h // step, w // step)
+    '''
+    h, w = img.shape[:2]
+    step = max(1, min(step, h, w))
+    if step == 1:
+        return img
+    h2, w2 = h // step, w // step
+    blocks = np.asarray(img)[:h2 * step, :w2 * step].reshape((h2, step, w2, step) + img.shape[2:])
+    return reduce(blocks, axis=(1, 3))
@@ -1,42 +1,49 @@
 cimport numpy as np
 import numpy as np
 cimport cython
+from libc.math cimport INFINITY
+from libc.string cimport memmove
+from cython.parallel cimport prange, parallel
+cimport openmp
 
 @cython.boundscheck(False)  # Deactivate bounds checking
 @cython.wraparound(False)   # Deactivate negative indexing.
-cpdef np.ndarray[np.int_t, ndim=1, mode='c'] findOptimalSeam(np.ndarray[np.float64_t, ndim=2, mode='c'] s, stopFunc=None): 
+cpdef np.ndarray[np.int64_t, ndim=1, mode='c'] findOptimalSeam(np.ndarray[np.float64_t, ndim=2, mode='c'] s, stopFunc=None): 
     """
     Finds optimal adjacent pixels in every row.
     These pixels minimize the energy s.
     @param s The energy function (a numpy array)
-    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked once per row.
     @return A vector M. The size of its elements are equal to the size of s rows.
             The value M[i] gives the best column of the pixel at the row i.
             If it is impossible to return a seam that has not the energy infinity or if
             the algorithm has stopped, None will be returned.
     """
-    cdef np.int_t c, r
-    cdef np.int_t M,N, left, right, j, minCol
-    cdef np.ndarray[np.int_t, ndim=3, mode='c'] Pointer
-    cdef np.ndarray[np.int_t, ndim=1] minPointer, seam
-    cdef np.int_t prevR, row
+    cdef np.int64_t c, r
+    cdef np.int64_t M,N, left, right, j, k, minCol
+    cdef np.ndarray[np.int64_t, ndim=3, mode='c'] Pointer
+    cdef np.ndarray[np.int64_t, ndim=1] minPointer, seam
+    cdef np.int64_t prevR, row
     cdef np.ndarray[np.float64_t, ndim=2, mode='c'] C
 
     M, N = s.shape[:2]
 
     C = np.zeros((M, N), dtype=np.float64)
-    Pointer = np.zeros((M, N, 2), dtype=np.int)
+    Pointer = np.zeros((M, N, 2), dtype=np.int64)
     # Fill first row with 0
     for c in range(0, N):
         C[0, c] = s[0, c]
     # Then compute for every column in every row the best neighbor above
     for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None
         for c in range(N):
-            if stopFunc and stopFunc():
-                return None
             left = max(c - 1, 0)
             right = min(N - 1, c + 1)
-            j = left + np.argmin(C[r - 1, left:right + 1])
+            j = left # The first minimum like np.argmin
+            for k in range(left + 1, right + 1):
+                if C[r - 1, k] < C[r - 1, j]:
+                    j = k
             # Set the energy
             C[r, c] = C[r - 1, j] + s[r, c]
             # Set the neighbor
@@ -47,7 +54,7 @@ cpdef np.ndarray[np.int_t, ndim=1, mode='c'] findOptimalSeam(np.ndarray[np.float
     if C[M - 1, minCol] == np.inf:
         return None
     # Creating the result
-    seam = np.zeros(M, dtype=np.int)
+    seam = np.zeros(M, dtype=np.int64)
     seam[M - 1] = minCol
     minPointer = Pointer[M - 1, minCol]
     for y in range(-M + 1, 0):
@@ -55,3 +62,353 @@ cpdef np.ndarray[np.int_t, ndim=1, mode='c'] findOptimalSeam(np.ndarray[np.float
         seam[prevR] = row
         minPointer = Pointer[prevR, row]
     return seam
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def findBandSeam(double[:, :] s, start, Py_ssize_t bandWidth, stopFunc=None):
+    """
+    Finds the optimal seam inside a band of columns. The band of row r
+    contains the columns start[r] ... start[r]+bandWidth-1.
+    Ties are resolved like findOptimalSeam (leftmost neighbor).
+    @param s The energy function (a numpy array)
+    @param start The first column of the band in every row (int array)
+    @param bandWidth The width of the band
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return (seam, cost). seam is None if there is no seam with finite energy or if stopped.
+    """
+    cdef Py_ssize_t M = s.shape[0]
+    cdef Py_ssize_t r, c, j, k, best, minCol
+    cdef double v, bestV
+    cdef np.int64_t[:] st = np.ascontiguousarray(start, dtype=np.int64)
+    cdef double[:] prev = np.empty(bandWidth, dtype=np.float64)
+    cdef double[:] cur = np.empty(bandWidth, dtype=np.float64)
+    cdef double[:] tmp
+    cdef np.int8_t[:, :] Pointer = np.zeros((M, bandWidth), dtype=np.int8)
+    cdef np.int64_t delta
+    for c in range(bandWidth):
+        prev[c] = s[0, st[0] + c]
+    for r in range(1, M):
+        if stopFunc and stopFunc():
+            return None, np.inf
+        delta = st[r] - st[r - 1]
+        for c in range(bandWidth):
+            best = 0
+            bestV = INFINITY
+            for k in range(3):
+                j = c + delta + k - 1
+                if j >= 0 and j < bandWidth and prev[j] < bestV:
+                    bestV = prev[j]
+                    best = k
+            cur[c] = bestV + s[r, st[r] + c]
+            Pointer[r, c] = best - 1
+        tmp = prev
+        prev = cur
+        cur = tmp
+    minCol = 0
+    for c in range(1, bandWidth):
+        if prev[c] < prev[minCol]:
+            minCol = c
+    if prev[minCol] == INFINITY:
+        return None, np.inf
+    seam = np.zeros(M, dtype=np.int64)
+    cdef np.int64_t[:] sm = seam
+    sm[M - 1] = st[M - 1] + minCol
+    for r in range(M - 1, 0, -1):
+        sm[r - 1] = sm[r] + Pointer[r, sm[r] - st[r]]
+    return seam, prev[minCol]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _seamRows(double[:, :] s, double[:, :] C, np.int8_t[:, :] Pointer, Py_ssize_t r0, Py_ssize_t r1,
+                    int numThreads, Py_ssize_t tileSize) noexcept nogil:
+    # Computes the rows r0..r1-1. Row r is stored in C[r % 2].
+    # Every thread computes tiles of tileSize columns of a row, the threads
+    # wait for each other at the end of every row (the next row reads the halo of neighbouring tiles).
+    cdef Py_ssize_t N = s.shape[1]
+    cdef Py_ssize_t r, c, j, left, right, best
+    cdef double bestV
+    r = r0 # Initialized, because the parallel block copies it into every thread (firstprivate)
+    with parallel(num_threads=numThreads):
+        for r in range(r0, r1):
+            for c in prange(N, schedule='static', chunksize=tileSize):
+                left = c - 1 if c > 0 else 0
+                right = c + 1 if c < N - 1 else N - 1
+                best = left
+                bestV = C[(r - 1) % 2, left]
+                for j in range(left + 1, right + 1):
+                    if C[(r - 1) % 2, j] < bestV:
+                        bestV = C[(r - 1) % 2, j]
+                        best = j
+                C[r % 2, c] = bestV + s[r, c]
+                Pointer[r, c] = best - c
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def findOptimalSeamParallel(double[:, :] s, int numThreads=0, Py_ssize_t tileSize=0, stopFunc=None,
+                            Py_ssize_t rowsPerCheck=256):
+    """
+    Like findOptimalSeam, but the columns of every row are computed by several threads (OpenMP, without the GIL).
+    Returns the same seams as findOptimalSeam.
+    @param s The energy function (a numpy array)
+    @param numThreads Number of threads. 0 uses all cores.
+    @param tileSize Number of adjacent columns computed by one thread at once. 0 splits a row into one tile per thread.
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked every rowsPerCheck rows.
+    @return The seam, None if stopped or if there is no seam with finite energy.
+    """
+    cdef Py_ssize_t M = s.shape[0]
+    cdef Py_ssize_t N = s.shape[1]
+    cdef Py_ssize_t r, r1, c, minCol
+    if numThreads <= 0:
+        numThreads = openmp.omp_get_max_threads()
+    if tileSize <= 0:
+        tileSize = (N + numThreads - 1) // numThreads
+    cdef double[:, :] C = np.empty((2, N), dtype=np.float64)
+    cdef np.int8_t[:, :] Pointer = np.zeros((M, N), dtype=np.int8)
+    for c in range(N):
+        C[0, c] = s[0, c]
+    r = 1
+    while r < M:
+        if stopFunc and stopFunc():
+            return None
+        r1 = min(M, r + rowsPerCheck)
+        with nogil:
+            _seamRows(s, C, Pointer, r, r1, numThreads, tileSize)
+        r = r1
+    minCol = 0
+    for c in range(1, N):
+        if C[(M - 1) % 2, c] < C[(M - 1) % 2, minCol]:
+            minCol = c
+    if C[(M - 1) % 2, minCol] == INFINITY:
+        return None
+    seam = np.zeros(M, dtype=np.int64)
+    cdef np.int64_t[:] sm = seam
+    sm[M - 1] = minCol
+    for r in range(M - 1, 0, -1):
+        sm[r - 1] = sm[r] + Pointer[r, sm[r]]
+    return seam
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _cumulativeCell(double[:, :] s, double[:, :] C, np.int8_t[:, :] Pointer,
+                                 Py_ssize_t r, Py_ssize_t c) noexcept nogil:
+    # C[r, c] and Pointer[r, c] from the row above (the leftmost minimum like findOptimalSeam)
+    cdef Py_ssize_t N = s.shape[1]
+    cdef Py_ssize_t j, best
+    cdef Py_ssize_t left = c - 1 if c > 0 else 0
+    cdef Py_ssize_t right = c + 1 if c < N - 1 else N - 1
+    best = left
+    for j in range(left + 1, right + 1):
+        if C[r - 1, j] < C[r - 1, best]:
+            best = j
+    C[r, c] = C[r - 1, best] + s[r, c]
+    Pointer[r, c] = best - c
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def cumulativeEnergy(double[:, :] s, stopFunc=None, Py_ssize_t rowsPerCheck=256):
+    """
+    Computes the table of the cumulative energy used by findOptimalSeam.
+    @param s The energy function (a numpy array)
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked every rowsPerCheck rows.
+    @return (C, Pointer). C[r, c] is the energy of the best seam from the first row to (r, c),
+            Pointer[r, c] the offset (-1, 0, 1) of its column in row r-1. None, if stopped.
+    """
+    cdef Py_ssize_t M = s.shape[0]
+    cdef Py_ssize_t N = s.shape[1]
+    cdef Py_ssize_t r, r1, c
+    C = np.empty((M, N), dtype=np.float64)
+    Pointer = np.zeros((M, N), dtype=np.int8)
+    cdef double[:, :] Cv = C
+    cdef np.int8_t[:, :] Pv = Pointer
+    Cv[0, :] = s[0, :]
+    r = 1
+    while r < M:
+        if stopFunc and stopFunc():
+            return None
+        r1 = min(M, r + rowsPerCheck)
+        with nogil:
+            for r in range(r, r1):
+                for c in range(N):
+                    _cumulativeCell(s, Cv, Pv, r, c)
+        r = r1
+    return C, Pointer
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def updateCumulativeEnergy(double[:, :] s, double[:, :] C, np.int8_t[:, :] Pointer, seam):
+    """
+    Updates the table of cumulative energy (see cumulativeEnergy) after the energy s was changed
+    only on the pixels of the seam. Only the columns that can have changed are recomputed:
+    in every row the columns next to the changed columns of the row above and the seam pixel.
+    @param s The changed energy function
+    @param C The cumulative energy (changed in place)
+    @param Pointer The offsets to the row above (changed in place)
+    @param seam The seam (column of every row) where s was changed
+    """
+    cdef Py_ssize_t M = s.shape[0]
+    cdef Py_ssize_t N = s.shape[1]
+    cdef np.int64_t[:] sm = np.ascontiguousarray(seam, dtype=np.int64)
+    cdef Py_ssize_t r, c, a, b, lo, hi
+    cdef double old
+    with nogil:
+        lo = sm[0]
+        hi = sm[0]
+        C[0, lo] = s[0, lo]
+        for r in range(1, M):
+            if lo <= hi:
+                a = max(lo - 1, 0)
+                b = min(hi + 1, N - 1)
+                a = min(a, sm[r])
+                b = max(b, sm[r])
+            else:
+                a = sm[r]
+                b = sm[r]
+            lo = N
+            hi = -1
+            for c in range(a, b + 1):
+                old = C[r, c]
+                _cumulativeCell(s, C, Pointer, r, c)
+                if C[r, c] != old:
+                    if c < lo:
+                        lo = c
+                    hi = c
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def claimPath(double[:, :] C, np.int8_t[:, :] Pointer, np.uint8_t[:, :] claimed, Py_ssize_t col, Py_ssize_t maxSteps):
+    """
+    Backtracks a seam from the column col of the last row and claims its pixels.
+    If the path leads to a claimed pixel, the unclaimed neighbor above with the lowest
+    cumulative energy is used instead. If there is none, the path goes back up to maxSteps rows
+    and tries the other neighbors there.
+    @param C The cumulative energy
+    @param Pointer The offsets to the row above
+    @param claimed The pixels used by other seams (1 = used, changed in place)
+    @param col The column in the last row (not claimed)
+    @param maxSteps The maximal number of steps back
+    @return The seam, None if the path cannot be repaired.
+    """
+    cdef Py_ssize_t h = C.shape[0]
+    cdef Py_ssize_t w = C.shape[1]
+    cdef Py_ssize_t r, c, n, best, pref, steps = 0
+    seam = np.zeros(h, dtype=np.int64)
+    cdef np.int64_t[:] sm = seam
+    cdef np.uint8_t[:] tried = np.zeros(h, dtype=np.uint8) # Bit k: neighbor c-1+k of row r-1 was tried
+    sm[h - 1] = col
+    r = h - 1
+    while r > 0:
+        c = sm[r]
+        best = -1
+        pref = c + Pointer[r, c]
+        if not (tried[r] & (1 << (pref - c + 1))) and not claimed[r - 1, pref]:
+            best = pref
+        else:
+            for n in range(max(0, c - 1), min(w, c + 2)):
+                if not (tried[r] & (1 << (n - c + 1))) and not claimed[r - 1, n] \
+                        and (best < 0 or C[r - 1, n] < C[r - 1, best]):
+                    best = n
+        if best < 0: # Dead end, go back
+            r += 1
+            steps += 1
+            if r >= h or steps > maxSteps:
+                return None
+            continue
+        tried[r] |= 1 << (best - c + 1)
+        sm[r - 1] = best
+        r -= 1
+        tried[r] = 0
+    for r in range(h):
+        claimed[r, sm[r]] = 1
+    return seam
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def findOptimalSeamForward(double[:, :] gray, energy=None, stopFunc=None, Py_ssize_t rowsPerCheck=256):
+    """
+    Finds the seam with the lowest forward energy, the energy of the new edges between
+    the pixels that become neighbors after removing the seam.
+    @param gray The grayscale picture
+    @param energy An additional energy of every pixel (numpy array) or None
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked every rowsPerCheck rows.
+    @return The seam, None if stopped or if there is no seam with finite energy.
+    """
+    cdef Py_ssize_t M = gray.shape[0]
+    cdef Py_ssize_t N = gray.shape[1]
+    cdef Py_ssize_t r, r1, c, k, best, minCol
+    cdef double cU, cand, bestV, left, right, up
+    cdef double[:, :] e
+    cdef bint hasEnergy = energy is not None
+    if hasEnergy:
+        e = np.ascontiguousarray(energy, dtype=np.float64)
+    cdef double[:, :] C = np.empty((2, N), dtype=np.float64)
+    cdef np.int8_t[:, :] Pointer = np.zeros((M, N), dtype=np.int8)
+    for c in range(N):
+        left = gray[0, c - 1] if c > 0 else gray[0, c]
+        right = gray[0, c + 1] if c < N - 1 else gray[0, c]
+        C[0, c] = abs(right - left) + (e[0, c] if hasEnergy else 0)
+    r = 1
+    while r < M:
+        if stopFunc and stopFunc():
+            return None
+        r1 = min(M, r + rowsPerCheck)
+        with nogil:
+            for r in range(r, r1):
+                for c in range(N):
+                    left = gray[r, c - 1] if c > 0 else gray[r, c]
+                    right = gray[r, c + 1] if c < N - 1 else gray[r, c]
+                    up = gray[r - 1, c]
+                    cU = abs(right - left)
+                    best = 0
+                    bestV = INFINITY
+                    for k in range(3): # Neighbor above left, above and above right
+                        if c + k - 1 < 0 or c + k - 1 >= N:
+                            continue
+                        cand = C[(r - 1) % 2, c + k - 1] + cU
+                        if k == 0:
+                            cand += abs(up - left)
+                        elif k == 2:
+                            cand += abs(up - right)
+                        if cand < bestV:
+                            bestV = cand
+                            best = k
+                    C[r % 2, c] = bestV + (e[r, c] if hasEnergy else 0)
+                    Pointer[r, c] = best - 1
+        r = r1
+    minCol = 0
+    for c in range(1, N):
+        if C[(M - 1) % 2, c] < C[(M - 1) % 2, minCol]:
+            minCol = c
+    if C[(M - 1) % 2, minCol] == INFINITY:
+        return None
+    seam = np.zeros(M, dtype=np.int64)
+    cdef np.int64_t[:] sm = seam
+    sm[M - 1] = minCol
+    for r in range(M - 1, 0, -1):
+        sm[r - 1] = sm[r] + Pointer[r, sm[r]]
+    return seam
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def shiftRowsLeft(unsigned char[:, ::1] rows, seam, Py_ssize_t width, Py_ssize_t pixelBytes):
+    """
+    Removes a vertical seam in place by moving the rest of every row one pixel to the left.
+    @param rows The picture as bytes, every row of the picture is one row of this array
+    @param seam The seam (column of every row)
+    @param width The current width of the picture (pixels behind are ignored)
+    @param pixelBytes The number of bytes of one pixel
+    """
+    cdef np.int64_t[:] sm = np.ascontiguousarray(seam, dtype=np.int64)
+    cdef Py_ssize_t r, c
+    with nogil:
+        for r in range(rows.shape[0]):
+            c = sm[r]
+            memmove(&rows[r, c * pixelBytes], &rows[r, (c + 1) * pixelBytes], (width - c - 1) * pixelBytes)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# Numba implementations of the hot kernels of MyLib (optional, needs numba).
+# They are registered as backend "numba" in MyLib (see Backends).
+import numpy as np
+import numba
+from ImgLib.SeamSet import isHorizontal, asSeamArray
+
+
+@numba.njit(cache=True)
+def _seamRows(s, C, Pointer, r0, r1):
+    # Computes the rows r0..r1-1 of the cumulative energy. C holds the previous row and is updated.
+    N = s.shape[1]
+    prev = C.copy()
+    for r in range(r0, r1):
+        for c in range(N):
+            left = c - 1 if c > 0 else 0
+            right = c + 1 if c < N - 1 else N - 1
+            best = left # The first minimum like np.argmin
+            for j in range(left + 1, right + 1):
+                if prev[j] < prev[best]:
+                    best = j
+            C[c] = prev[best] + s[r, c]
+            Pointer[r, c] = best - c
+        prev[:] = C
+
+
+@numba.njit(cache=True)
+def _backtrack(C, Pointer):
+    M = Pointer.shape[0]
+    seam = np.zeros(M, dtype=np.int64)
+    minCol = 0
+    for c in range(1, C.shape[0]):
+        if C[c] < C[minCol]:
+            minCol = c
+    if C[minCol] == np.inf:
+        return seam, False
+    seam[M - 1] = minCol
+    for r in range(M - 1, 0, -1):
+        seam[r - 1] = seam[r] + Pointer[r, seam[r]]
+    return seam, True
+
+
+def findOptimalSeam(s, stopFunc=None, rowsPerCheck=256):
+    """
+    Numba version of findOptimalSeam.
+    @param s The energy function (a numpy array)
+    @param stopFunc Function, stopFunc()==True stops the algorithm. It is checked every rowsPerCheck rows.
+    @return The seam, None if stopped or if there is no seam with finite energy.
+    """
+    s = np.asarray(s, dtype=np.float64)
+    M, N = s.shape
+    C = s[0].copy()
+    Pointer = np.zeros((M, N), dtype=np.int8)
+    for r0 in range(1, M, rowsPerCheck):
+        if stopFunc and stopFunc():
+            return None
+        _seamRows(s, C, Pointer, r0, min(M, r0 + rowsPerCheck))
+    seam, found = _backtrack(C, Pointer)
+    return seam if found else None
+
+
+@numba.njit(cache=True)
+def _absDivergence(img):
+    h, w = img.shape
+    res = np.empty((h, w))
+    for y in range(h):
+        for x in range(w):
+            # Like np.gradient: central differences inside, one-sided differences at the border
+            if y == 0:
+                gy = img[1, x] - img[0, x]
+            elif y == h - 1:
+                gy = img[h - 1, x] - img[h - 2, x]
+            else:
+                gy = (img[y + 1, x] - img[y - 1, x]) / 2.0
+            if x == 0:
+                gx = img[y, 1] - img[y, 0]
+            elif x == w - 1:
+                gx = img[y, w - 1] - img[y, w - 2]
+            else:
+                gx = (img[y, x + 1] - img[y, x - 1]) / 2.0
+            res[y, x] = abs(gy) + abs(gx)
+    return res
+
+
+def absDivergence(img):
+    '''
+    Numba version of absDivergence.
+    @param img The Image (grayscale)
+    @return Numpy array with the energy
+    '''
+    return _absDivergence(np.asarray(img, dtype=np.float64))
+
+
+@numba.njit(cache=True)
+def _removeSeams(img, seams):
+    # img: (h, w, p), seams: (k, h)
+    h, w, p = img.shape
+    k = seams.shape[0]
+    res = np.empty((h, w - k, p), dtype=img.dtype)
+    remove = np.zeros(w, dtype=np.bool_)
+    for r in range(h):
+        for i in range(k):
+            remove[seams[i, r]] = True
+        j = 0
+        for c in range(w):
+            if remove[c]:
+                remove[c] = False
+                continue
+            for q in range(p):
+                res[r, j, q] = img[r, c, q]
+            j += 1
+    return res
+
+
+def removeSeams(img, seams):
+    """
+    Numba version of removeSeams.
+    @param img The image
+    @param seams a list of seams, just one or a SeamSet.
+    @return A image where the seams are removed.
+    """
+    if isHorizontal(seams):
+        return np.swapaxes(removeSeams(np.swapaxes(img, 0, 1), seams.transposed()), 0, 1)
+    seams = asSeamArray(seams, img.shape[0])
+    if seams.size == 0:
+        return img.copy()
+    if np.ndim(img) == 3:
+        return _removeSeams(np.ascontiguousarray(img), seams)
+    return _removeSeams(np.ascontiguousarray(img)[:, :, None], seams)[:, :, 0]
+
+
+@numba.njit(cache=True)
+def _duplicateSeams(img, seams, res):
+    # img: (h, w, p), seams: (k, h), res: (h, w+k, p)
+    h, w, p = img.shape
+    k = seams.shape[0]
+    count = np.zeros(w, dtype=np.int64)
+    cast = np.empty(1, dtype=img.dtype) # Interpolated values are rounded like np.insert does (to the type of img)
+    for r in range(h):
+        for i in range(k):
+            count[seams[i, r]] += 1
+        j = 0
+        for c in range(w):
+            left = c - 1 if c > 0 else c
+            right = c + 1 if c < w - 1 else c
+            for n in range(count[c]): # Interpolated pixels are inserted before the pixel
+                for q in range(p):
+                    cast[0] = img[r, c, q] / 3 + img[r, left, q] / 3 + img[r, right, q] / 3
+                    res[r, j, q] = cast[0]
+                j += 1
+            count[c] = 0
+            for q in range(p):
+                res[r, j, q] = img[r, c, q]
+            j += 1
+
+
+def duplicateSeams(img, seams):
+    """
+    Numba version of duplicateSeams.
+    @param img The Image
+    @param seams the list of seams or a SeamSet.
+    """
+    if len(seams) == 0:
+        return img
+    if isHorizontal(seams):
+        return np.swapaxes(duplicateSeams(np.swapaxes(img, 0, 1), seams.transposed()), 0, 1)
+    seams = asSeamArray(seams, img.shape[0])
+    h, w = img.shape[:2]
+    if np.ndim(img) == 3:
+        res = np.zeros((h, w + len(seams), img.shape[2]))
+        _duplicateSeams(np.ascontiguousarray(img), seams, res)
+        return res
+    res = np.zeros((h, w + len(seams), 1), dtype=img.dtype)
+    _duplicateSeams(np.ascontiguousarray(img)[:, :, None], seams, res)
+    return res[:, :, 0]
@@ -2,6 +2,14 @@
 # Functions  for Poisson-Reconstruction
 import numpy as np
 from ImgLib.MyFilter import myfilter as filter
+import ImgLib.Backends as Backends
+from ImgLib.Progress import asCancelToken, asProgressReporter
+sparse = None
+try:
+    import scipy.sparse as sparse
+    import scipy.sparse.linalg
+except:
+    pass
 # Some explanations: http://eric-yuan.me/poisson-blending/
 
 def jacobi(A, b, N=25, x=None, progressFunc = None, stopFunc=None):
@@ -42,8 +50,47 @@ def laplace_div(array):
     return filter(array,kern)
 
 
+def _poissonSystem(mask, div):
+    '''
+    Sets up the equations of the Poisson reconstruction, one for every pixel in the mask.
+    @param mask The mask (see poissonInsertMask_Dense)
+    @param div The Laplace derivative
+    @return (r, c, b, rows, cols, Np): The row and column of the pixel of every equation, the right side,
+            the pairs of neighboring pixels in the mask (as indexes of the equations) and the number of
+            neighbors in the mask of every pixel.
+    '''
+    h, w = mask.shape
+    r, c = mask.nonzero()
+    N = len(r)
+    idx = np.full(mask.shape, -1, dtype=np.int64)
+    idx[r, c] = np.arange(N)
+    b = div[r, c].astype(np.float64)
+    rows, cols = [], []
+    Np = np.zeros(N)
+    for dy, dx in ((-1, 0), (0, -1), (1, 0), (0, 1)):
+        y, x = r + dy, c + dx
+        inside = (y >= 0) & (y < h) & (x >= 0) & (x < w)
+        q = np.full(N, -1, dtype=np.int64)
+        q[inside] = idx[y[inside], x[inside]]
+        neighbor = q >= 0
+        rows.append(np.nonzero(neighbor)[0])
+        cols.append(q[neighbor])
+        Np += neighbor
+    return r, c, b, np.concatenate(rows), np.concatenate(cols), Np
+
+
+def _poissonInsert(m, mask, r, c, x, iterations):
+    # Writes the solution x of the equations into the picture m
+    v = np.clip(m[r, c] - x, 0, 255)
+    if (iterations > 0): # mixing
+        m[r, c] = v * mask[r, c] + m[r, c] * (1 - mask[r, c])
+    else: # no mixing needed ?!
+        m[r, c] = v
+    return m
+
+
 # Inspired by http://pebbie.wordpress.com/2012/04/04/python-poisson-image-editing/
-def poissonInsertMask(m, mask, div, iterations=20, progressFunc = None, stopFunc=None):
+def poissonInsertMask_Dense(m, mask, div, iterations=20, progressFunc = None, stopFunc=None):
     '''
     Computes from the Laplace derivative div and the picture m 
     a new picture. That picture blends them together using Poisson.
@@ -55,68 +102,87 @@ def poissonInsertMask(m, mask, div, iterations=20, progressFunc = None, stopFunc
     @param iterations Number of iteration for solving the linear system of equations.
             iterations <=0 => Use the exact solution
     @param progressFunc A function for showing the progress.
-    @param stopFunc Function. Stopping when evaluated to true
-    @return the reconstructed picture.
+    @param stopFunc Function. Stopping when evaluated to true. It is checked once per iteration.
+    @return the reconstructed picture. None, if stopped.
     '''
-    h, w = mask.shape
-    r, c = mask.nonzero()  
+    stopFunc = asCancelToken(stopFunc)
+    progressFunc = asProgressReporter(progressFunc)
+    r, c, b_r, rows, cols, Np = _poissonSystem(mask, div)
     N = len(r)
-    idx = np.zeros(mask.shape, dtype=np.uint32)
-
-    for i in range(N):
-        idx.itemset((r.item(i), c.item(i)), i + 1)
-
-    b_r = np.zeros(N)
-
     A = np.zeros((N, N))
-    for i in range(N):
-        if (progressFunc):
-            progressFunc(i*100//(2*N))
-        if stopFunc and stopFunc():
-            return
-        y, x = r.item(i), c.item(i)  
-        b_r.itemset(i, div.item((y, x)))  
-        p = i 
-        Np = 0
-        if y > 0 and mask.item((y - 1, x)):  
-            q = idx.item((y - 1, x)) - 1  
-            A[p, q] = -1. 
-            Np += 1  
-        if x > 0 and mask.item((y, x - 1)):  
-            q = idx.item((y, x - 1)) - 1  
-            A[p, q] = -1.
-            Np += 1
-        if y < h - 1 and mask.item((y + 1, x)): 
-            q = idx.item((y + 1, x)) - 1
-            A[p, q] = -1.
-            Np += 1
-        if x < w - 1 and mask.item((y, x + 1)):  
-            q = idx.item((y, x + 1)) - 1
-            A[p, q] = -1
-            Np += 1
-        A[p, p] = Np * 1.  
-    guess = None
-    x = 0
+    A[rows, cols] = -1.
+    A[np.arange(N), np.arange(N)] = Np
+    if progressFunc:
+        progressFunc(50)
+    if stopFunc and stopFunc():
+        return None
     if (iterations <= 0):
         x = np.linalg.solve(A,b_r).astype("uint8")
     else: 
-        if (progressFunc):
-            x = jacobi(A, b_r, x=guess, N=iterations, progressFunc = lambda k:progressFunc(50+k/2),  stopFunc = stopFunc)  
-        else:
-            x = jacobi(A, b_r, x=guess, N=iterations,  stopFunc = stopFunc) 
+        x = jacobi(A, b_r, N=iterations, progressFunc=progressFunc and progressFunc.stage(50, 100),
+                   stopFunc=stopFunc)
     if stopFunc and stopFunc():
         return None
-    for i in range(N):
-        yy, xx = r.item(i), c.item(i)
-        v = m[yy, xx] - x[i]  
-        
-        if v < 0:
-            v = 0
-        elif v > 255:
-            v = 255
-        
-        if (iterations >0): # mixing
-          m[yy, xx] = v * mask[yy, xx] + m[yy, xx] * (1 - mask[yy, xx])
-        else: # no mixing needed ?!
-          m[yy, xx] = v
-    return m
+    return _poissonInsert(m, mask, r, c, x, iterations)
+
+
+def poissonInsertMask_Sparse(m, mask, div, iterations=20, progressFunc = None, stopFunc=None):
+    '''
+    Like poissonInsertMask_Dense, but with a sparse matrix (needs scipy).
+    The memory used grows with the number of pixels in the mask and not with its square.
+    @see poissonInsertMask_Dense
+    '''
+    stopFunc = asCancelToken(stopFunc)
+    progressFunc = asProgressReporter(progressFunc)
+    r, c, b_r, rows, cols, Np = _poissonSystem(mask, div)
+    N = len(r)
+    R = sparse.csr_matrix((-np.ones(len(rows)), (rows, cols)), shape=(N, N))
+    if progressFunc:
+        progressFunc(50)
+    if stopFunc and stopFunc():
+        return None
+    if (iterations <= 0):
+        A = (R + sparse.diags(Np)).tocsc()
+        x = scipy.sparse.linalg.spsolve(A, b_r).astype("uint8")
+    else:
+        x = np.zeros(N)
+        for i in range(iterations):
+            if (progressFunc):
+                progressFunc(50 + i * 50 / iterations)
+            if stopFunc and stopFunc():
+                return None
+            x = (b_r - R.dot(x)) / Np
+    if stopFunc and stopFunc():
+        return None
+    return _poissonInsert(m, mask, r, c, x, iterations)
+
+
+def _poissonSample(size):
+    # A square mask of about size pixels in a picture for calibrating the backends
+    n = max(2, int(np.sqrt(size)))
+    rnd = np.random.RandomState(0)
+    m = rnd.random_sample((n + 8, n + 8)) * 255
+    mask = np.zeros(m.shape)
+    mask[4:n + 4, 4:n + 4] = 1
+    return m, mask, laplace_div(m)
+
+
+# The dense matrix needs N^2 values, so the calibration is restricted to small masks.
+poissonInsertMask = Backends.kernel("poisson", lambda m, mask, *args, **kwargs: int(np.count_nonzero(mask)),
+                                    lambda size: _poissonSample(min(size, 2048)) + (20,),
+                                    poissonInsertMask_Dense.__doc__)
+def _denseMemory(m, mask, div, iterations=20, *args, **kwargs):
+    # The matrix, for the Jacobi method also the matrix without its diagonal and the diagonal matrix
+    N = int(np.count_nonzero(mask))
+    return (3 if iterations > 0 else 2) * 8 * N * N + 200 * N
+
+
+def _sparseMemory(m, mask, div, iterations=20, *args, **kwargs):
+    # About 4 entries per row of the matrix and some vectors (a guess for the factorization of the exact solution)
+    N = int(np.count_nonzero(mask))
+    return (200 if iterations > 0 else 1000) * N + 8 * mask.size
+
+
+poissonInsertMask.register("numpy", poissonInsertMask_Dense, memory=_denseMemory)
+if sparse is not None:
+    poissonInsertMask.register("scipy", poissonInsertMask_Sparse, memory=_sparseMemory)
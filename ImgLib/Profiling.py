@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# Measures where the time and memory of an effect goes.
+# The work is split into named stages: the functions listed in INSTRUMENTED and
+# every block inside "with stage(name):". While a Profile is active, the functions are
+# replaced by measuring wrappers in their modules, otherwise nothing is changed
+# (stage costs only a global lookup). So profiling costs nothing when disabled.
+# Functions stored elsewhere before (e.g. the energy function of an effect) are measured,
+# if they are called through profiled(func).
+import importlib
+import json
+import threading
+import time
+import tracemalloc
+
+# The functions measured as stages (module -> names of module attributes).
+# A name imported into another module has to be listed there, too.
+# References kept in other objects (e.g. the values of EnergyFunction.export) are not replaced, see profiled.
+INSTRUMENTED = {
+    'ImgLib.MyLib': ['absDivergence', 'findOptimalSeam', 'findOptimalSeamForward', 'findTopDisjointSeams',
+                     'removeSeams', 'duplicateSeams', 'removeSeamsInGradient', 'removeMaskedObject',
+                     'retargetingImage', 'rotateMirror', 'seamEnergy', 'forwardSeamEnergy',
+                     'poissonInsertMask', 'laplace_div', 'makeGray'],
+    'ImgLib.Poisson': ['poissonInsertMask', 'jacobi', 'laplace_div', 'filter'],
+    'ImgLib.MyFilter': ['myfilter'],
+    'EnergyFunction': ['absEnergyFunc', 'cornerHarrisFunc', 'preCornerDetectFunc', 'l2gradientFunc', 'laplaceFunc'],
+}
+
+_active = None # The running Profile
+
+
+class _Frame:
+    # A running stage
+    def __init__(self, name, memory):
+        self.name = name
+        self.children = 0. # Time spent in nested stages
+        self.start = time.perf_counter()
+        self.memory = memory # Traced memory at the start
+        self.peak = memory
+
+
+class Profile:
+    '''
+    Records wall time, call count and memory of every stage while active.
+    Use it as context manager:
+        with Profile() as profile:
+            ...
+        print(profile.toJson())
+    Only one Profile can be active at the same time.
+    '''
+
+    def __init__(self, memory=True):
+        '''
+        @param memory If True, the allocated memory is traced with tracemalloc (slower).
+        '''
+        self.memory = memory
+        self.stats = {}
+        self.total = 0.
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__patched = []
+        self.__wrappers = {} # Original function => measuring wrapper
+        self.__startedTracing = False
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("Another profile is already active")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__startedTracing = True
+        self.__patch()
+        _active = self
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        global _active
+        self.total += time.perf_counter() - self.__start
+        _active = None
+        self.__unpatch()
+        if self.__startedTracing:
+            tracemalloc.stop()
+            self.__startedTracing = False
+        return False
+
+    def __patch(self):
+        for moduleName, names in INSTRUMENTED.items():
+            try:
+                module = importlib.import_module(moduleName)
+            except ImportError:
+                continue
+            for name in names:
+                func = getattr(module, name, None)
+                if func is None or isinstance(func, _Profiled):
+                    continue
+                wrapper = self.__wrappers.get(func)
+                if wrapper is None:
+                    wrapper = self.__wrappers[func] = _Profiled(getattr(func, '__name__', name), func)
+                self.__patched.append((module, name, func))
+                setattr(module, name, wrapper)
+
+    def __unpatch(self):
+        for module, name, func in reversed(self.__patched):
+            setattr(module, name, func)
+        self.__patched = []
+        self.__wrappers = {}
+
+    def _wrapper(self, func):
+        try:
+            return self.__wrappers.get(func, func)
+        except TypeError: # Not hashable
+            return func
+
+    def _stack(self):
+        stack = getattr(self.__local, 'stack', None)
+        if stack is None:
+            stack = self.__local.stack = []
+        return stack
+
+    def _traced(self):
+        return tracemalloc.get_traced_memory() if self.memory and tracemalloc.is_tracing() else (0, 0)
+
+    def _enter(self, name):
+        stack = self._stack()
+        if any(frame.name == name for frame in stack):
+            return None # Recursive calls are part of the outer call
+        current, peak = self._traced()
+        if self.memory and tracemalloc.is_tracing():
+            # The peak is reset for the new stage, the running stages keep theirs
+            for frame in stack:
+                frame.peak = max(frame.peak, peak)
+            tracemalloc.reset_peak()
+        frame = _Frame(name, current)
+        stack.append(frame)
+        return frame
+
+    def _exit(self, frame):
+        duration = time.perf_counter() - frame.start
+        current, peak = self._traced()
+        frame.peak = max(frame.peak, peak)
+        stack = self._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+            stack[-1].peak = max(stack[-1].peak, frame.peak)
+        with self.__lock:
+            entry = self.stats.setdefault(frame.name, {'calls': 0, 'seconds': 0., 'selfSeconds': 0.,
+                                                       'peakBytes': 0, 'netBytes': 0})
+            entry['calls'] += 1
+            entry['seconds'] += duration
+            entry['selfSeconds'] += duration - frame.children
+            entry['peakBytes'] = max(entry['peakBytes'], frame.peak - frame.memory)
+            entry['netBytes'] += current - frame.memory
+
+    def report(self):
+        '''
+        @return A dict (JSON compatible) with the total time and for every stage: the number of calls, the
+                time (with and without nested stages), the highest additional memory use during one call and
+                the memory that is still allocated after the calls.
+        '''
+        with self.__lock:
+            stages = {name: dict(entry) for name, entry in self.stats.items()}
+        order = sorted(stages, key=lambda name: -stages[name]['selfSeconds'])
+        return {'seconds': self.total, 'stages': {name: stages[name] for name in order}}
+
+    def toJson(self):
+        '''
+        @return The report as JSON string
+        '''
+        return json.dumps(self.report(), indent=2)
+
+
+class _Profiled:
+    # Replaces a function while profiling. Other attributes are passed to the function (e.g. of Backends.Kernel).
+    def __init__(self, name, func):
+        self.__name__ = name
+        self.__doc__ = getattr(func, '__doc__', None)
+        self.__wrapped__ = func
+
+    def __call__(self, *args, **kwargs):
+        with stage(self.__name__):
+            return self.__wrapped__(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.__wrapped__, name)
+
+
+class _Stage:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.frame = self.profile._enter(self.name)
+
+    def __exit__(self, *args):
+        if self.frame is not None:
+            self.profile._exit(self.frame)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        return False
+
+_noStage = _NoStage()
+
+
+def stage(name):
+    '''
+    Measures a block as stage name, if a Profile is active:
+        with stage("energy"):
+            ...
+    @param name The name of the stage
+    @return A context manager
+    '''
+    if _active is None:
+        return _noStage
+    return _Stage(_active, name)
+
+
+def profiled(func):
+    '''
+    Returns the measuring wrapper of an instrumented function (see INSTRUMENTED) while a Profile is active.
+    For calling functions which were stored before the profile started (e.g. an energy function).
+    @param func The function
+    @return The wrapper or func itself (if it is not instrumented or no Profile is active)
+    '''
+    if _active is None:
+        return func
+    return _active._wrapper(func)
+
+
+def isProfiling():
+    '''
+    @return True if a Profile is active
+    '''
+    return _active is not None
+
+
+def summary(report, count=4):
+    '''
+    Describes the stages taking the most time (without nested stages) in one line.
+    @param report A report of Profile.report
+    @param count The number of stages shown
+    @return A string like "1.20s: findOptimalSeam 61%, absDivergence 20%, ..."
+    '''
+    total = report['seconds']
+    parts = ["%s %d%%" % (name, round(100 * entry['selfSeconds'] / total)) if total > 0 else name
+             for name, entry in list(report['stages'].items())[:count]]
+    return "%.2fs: %s" % (total, ", ".join(parts))
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Cancellation and progress reporting shared by the algorithms.
+# The algorithms take a stopFunc and a progressFunc. Both may be plain functions,
+# but a CancelToken and a ProgressReporter make checking and reporting cheap:
+# the kernels check the token once per row or iteration and the reporter passes
+# on at most one value every interval seconds.
+import time
+
+
+class CancelToken:
+    '''
+    A flag for stopping an algorithm. It is callable, so it can be passed as stopFunc.
+    '''
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        '''
+        Stops the algorithms using this token.
+        '''
+        self.cancelled = True
+
+    def reset(self):
+        self.cancelled = False
+
+    def __call__(self):
+        return self.cancelled
+
+
+class PollingCancelToken(CancelToken):
+    '''
+    A CancelToken for an arbitrary stop function. The function is called at most every interval seconds
+    and the token stays cancelled once it returned True.
+    '''
+
+    def __init__(self, stopFunc, interval=0.01):
+        '''
+        @param stopFunc Function, stopFunc()==True stops the algorithm. (-> boolean)
+        @param interval The minimal time between two calls of stopFunc in seconds
+        '''
+        CancelToken.__init__(self)
+        self.__stopFunc = stopFunc
+        self.interval = interval
+        self.__lastCheck = None
+
+    def __call__(self):
+        if not self.cancelled:
+            now = time.monotonic()
+            if self.__lastCheck is None or now - self.__lastCheck >= self.interval:
+                self.__lastCheck = now
+                self.cancelled = bool(self.__stopFunc())
+        return self.cancelled
+
+
+def asCancelToken(stopFunc):
+    '''
+    @param stopFunc None, a CancelToken or a function (-> boolean)
+    @return None or a CancelToken for stopFunc
+    '''
+    if stopFunc is None or isinstance(stopFunc, CancelToken):
+        return stopFunc
+    return PollingCancelToken(stopFunc)
+
+
+class ProgressReporter:
+    '''
+    Passes the progress (in percent) of an algorithm to a function.
+    An algorithm consisting of several steps gives every step its own reporter with stage or stages,
+    the progress of a step (0 to 100) is mapped to its part of the whole progress.
+    The function is called only if the progress (as int) has changed and at most every interval seconds
+    (except for 100 percent).
+    '''
+
+    def __init__(self, progressFunc=None, interval=0.05):
+        '''
+        @param progressFunc A function for showing the progress. (int -> )
+        @param interval The minimal time between two calls of progressFunc in seconds
+        '''
+        self.__progressFunc = progressFunc
+        self.interval = interval
+        self.__lastTime = None
+        self.__lastValue = None
+        self.__root = self
+        self.__offset = 0.
+        self.__scale = 1.
+
+    def __call__(self, value):
+        '''
+        Reports the progress of this stage.
+        @param value The progress in percent (may be a float)
+        '''
+        self.__root.__report(self.__offset + self.__scale * value)
+
+    def __report(self, value):
+        value = int(min(100, max(0, value)))
+        if self.__progressFunc is None or value == self.__lastValue:
+            return
+        now = time.monotonic()
+        if value < 100 and self.__lastTime is not None and now - self.__lastTime < self.interval:
+            return
+        self.__lastTime = now
+        self.__lastValue = value
+        self.__progressFunc(value)
+
+    def stage(self, start, end):
+        '''
+        Returns a reporter for a part of this stage.
+        @param start The progress of this stage (in percent) when the part begins
+        @param end The progress of this stage (in percent) when the part is done
+        @return The ProgressReporter for the part
+        '''
+        res = ProgressReporter.__new__(ProgressReporter)
+        res.__root = self.__root
+        res.__offset = self.__offset + self.__scale * start
+        res.__scale = self.__scale * (end - start) / 100.
+        return res
+
+    def stages(self, weights):
+        '''
+        Splits this stage into consecutive parts.
+        @param weights The relative duration of every part
+        @return A list with a ProgressReporter for every part
+        '''
+        total = float(sum(weights))
+        res = []
+        start = 0.
+        for weight in weights:
+            end = start + weight * 100. / total
+            res.append(self.stage(start, end))
+            start = end
+        return res
+
+
+def asProgressReporter(progressFunc):
+    '''
+    @param progressFunc None, a ProgressReporter or a function (int -> )
+    @return None or a ProgressReporter for progressFunc
+    '''
+    if progressFunc is None or isinstance(progressFunc, ProgressReporter):
+        return progressFunc
+    return ProgressReporter(progressFunc)
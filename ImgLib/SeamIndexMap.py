@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Seam index map (see "Seam Carving for Content-Aware Image Resizing", section 4.4):
+# The image is carved once down to a minimum width and the step at which every pixel
+# was removed is recorded. Every width between that minimum and the original width
+# can then be produced by a single mask and compact operation.
+import numpy as np
+import ImgLib.MyLib as ML
+from ImgLib.SeamSet import SeamSet
+
+
+def computeSeamIndexMap(img, minWidth, energyFactory, progressFunc=None, stopFunc=None):
+    '''
+    Removes vertical seams until the image has the width minWidth and records
+    for every pixel when it was removed.
+    @param img The image
+    @param minWidth The smallest width that should be possible
+    @param energyFactory A function computing the energy (numpy array) of an image (numpy image -> numpy image)
+    @param progressFunc A function for showing the progress. (int -> )
+    @param stopFunc Function, stopFunc()==True stops the algorithm. (-> boolean)
+    @return The index map (h x w). The value of a pixel is the number of the seam it belongs to,
+            pixels that are never removed have the value w-minWidth. None, if stopped.
+    '''
+    h, w = img.shape[:2]
+    if minWidth < 1 or minWidth > w:
+        raise ValueError("minWidth must be between 1 and %d" % w)
+    count = w - minWidth
+    dtype = np.uint16 if count < 2 ** 16 else np.uint32
+    indexMap = np.full((h, w), count, dtype=dtype)
+    positions = np.tile(np.arange(w, dtype=np.int64), (h, 1)) # Original column of every remaining pixel
+    rows = np.arange(h)
+    res = img
+    for i in range(count):
+        if stopFunc and stopFunc():
+            return None
+        if progressFunc:
+            progressFunc(i * 100 / count)
+        seam = ML.findOptimalSeam(np.ascontiguousarray(energyFactory(res), dtype=np.float64), stopFunc)
+        if seam is None:
+            return None
+        indexMap[rows, positions[rows, seam]] = i
+        positions = ML.removeSeams(positions, seam)
+        res = ML.removeSeams(res, seam)
+    return indexMap
+
+
+def minimalWidth(indexMap):
+    '''
+    Returns the smallest width that can be produced with the index map.
+    @param indexMap The index map
+    @return The width
+    '''
+    row = indexMap[0] # Every row contains the same number of remaining pixels
+    return int((row == row.max()).sum())
+
+
+def resizeWithIndexMap(img, indexMap, width):
+    '''
+    Removes the first w-width seams recorded in the index map.
+    @param img The image which was used to compute the index map
+    @param indexMap The index map (see computeSeamIndexMap)
+    @param width The new width. minimalWidth(indexMap) <= width <= w
+    @return The image with the new width
+    '''
+    h, w = indexMap.shape
+    if img.shape[:2] != (h, w):
+        raise ValueError("The index map does not fit to the image")
+    if width > w or width < minimalWidth(indexMap):
+        raise ValueError("width must be between %d and %d" % (minimalWidth(indexMap), w))
+    keep = (indexMap >= w - width).ravel()
+    flat = np.ascontiguousarray(img).reshape((h * w,) + img.shape[2:])
+    return np.compress(keep, flat, axis=0).reshape((h, width) + img.shape[2:])
+
+
+def removedPixels(indexMap, width):
+    '''
+    Returns the pixels removed by resizeWithIndexMap.
+    @param indexMap The index map (see computeSeamIndexMap)
+    @param width The new width
+    @return A SeamSet with the removed columns of every row (in ascending order)
+    '''
+    h, w = indexMap.shape
+    return SeamSet(np.nonzero(indexMap < w - width)[1].reshape((h, w - width)).T, (h, w))
+
+
+def indexMapFilename(imageFilename):
+    '''
+    Returns the filename of the index map belonging to an image file.
+    @param imageFilename The filename of the image
+    @return The filename of the index map
+    '''
+    return imageFilename + ".seams.npz"
+
+
+def saveSeamIndexMap(filename, indexMap):
+    '''
+    Saves the index map compressed.
+    @param filename The filename (see indexMapFilename)
+    @param indexMap The index map
+    '''
+    with open(filename, "wb") as f:
+        np.savez_compressed(f, indexMap=indexMap)
+
+
+def loadSeamIndexMap(filename):
+    '''
+    Loads an index map saved with saveSeamIndexMap.
+    @param filename The filename
+    @return The index map
+    '''
+    with np.load(filename) as data:
+        return data['indexMap']
+
+
+def precomputeSeamIndexMap(imageFilename, minWidth, energyFactory, progressFunc=None, stopFunc=None):
+    '''
+    Computes the index map of an image file and saves it next to the image.
+    @param imageFilename The filename of the image
+    @param minWidth The smallest width that should be possible
+    @param energyFactory A function computing the energy of an image
+    @return The filename of the index map. None, if stopped.
+    '''
+    from ImgLib.ImageIO import readImage
+    indexMap = computeSeamIndexMap(readImage(imageFilename), minWidth, energyFactory, progressFunc, stopFunc)
+    if indexMap is None:
+        return None
+    filename = indexMapFilename(imageFilename)
+    saveSeamIndexMap(filename, indexMap)
+    return filename
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# A set of seams of one picture, stored in one contiguous array.
+# The functions of MyLib and MyLibTool that take seams accept a SeamSet as well
+# as a single seam or a list of seams.
+import numpy as np
+
+
+class SeamSet:
+    '''
+    A set of seams of a picture with the shape (h, w).
+    The seams are stored in the (k, n) array self.array (int16 if the positions fit, int32 otherwise).
+    Vertical seams have one column for every row (n = h), horizontal seams one row for every column (n = w).
+    It can be used like a list of seams (len, iteration, indexing) and like an array (np.asarray).
+    '''
+
+    def __init__(self, seams, shape, vertical=True):
+        '''
+        @param seams The seams: a (k, n) array, a list of seams, a single seam or a SeamSet
+        @param shape The shape of the picture (h, w), further dimensions are ignored
+        @param vertical True for seams from the top to the bottom, False for seams from the left to the right
+        '''
+        h, w = shape[:2]
+        self.shape = (int(h), int(w))
+        self.vertical = vertical
+        length, size = (h, w) if vertical else (w, h)
+        dtype = np.int16 if size <= np.iinfo(np.int16).max + 1 else np.int32
+        self.array = np.ascontiguousarray(np.asarray(seams).reshape((-1, length)), dtype=dtype)
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __getitem__(self, index):
+        '''
+        @return The seam for an integer index, otherwise a SeamSet with the selected seams
+        '''
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            return self.array[index]
+        return SeamSet(self.array[index], self.shape, self.vertical)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.array
+        return self.array.astype(dtype)
+
+    def __repr__(self):
+        return "SeamSet(%d %s seams, shape=%s)" % (len(self), "vertical" if self.vertical else "horizontal", self.shape)
+
+    def transposed(self):
+        '''
+        @return The same seams as seams of the transposed picture (the orientation changes)
+        '''
+        return SeamSet(self.array, (self.shape[1], self.shape[0]), not self.vertical)
+
+    def flatIndices(self):
+        '''
+        Returns the indexes of the seam pixels in the flattened picture.
+        @return A (k, n) int64 array
+        '''
+        h, w = self.shape
+        if self.vertical:
+            return self.array + np.arange(h, dtype=np.int64) * w
+        return self.array.astype(np.int64) * w + np.arange(w, dtype=np.int64)
+
+    def mask(self):
+        '''
+        @return A boolean (h, w) array, True for the pixels of the seams
+        '''
+        res = np.zeros(self.shape[0] * self.shape[1], dtype=bool)
+        res[self.flatIndices()] = True
+        return res.reshape(self.shape)
+
+    def cost(self, energy):
+        '''
+        Summarizes the energy of the pixels of every seam.
+        @param energy The energy function (numpy array with the shape of the picture)
+        @return Array with the energy of every seam
+        '''
+        return np.asarray(energy).ravel()[self.flatIndices()].sum(axis=1)
+
+    def sorted(self, energy=None):
+        '''
+        Sorts the seams.
+        @param energy If given, the seams are sorted by their energy (see cost), otherwise by their mean position.
+        @return A sorted SeamSet
+        '''
+        key = self.cost(energy) if energy is not None else self.array.mean(axis=1)
+        return self[np.argsort(key, kind="stable")]
+
+    def save(self, file):
+        '''
+        Saves the seams (compressed).
+        @param file A filename or a file object
+        '''
+        np.savez_compressed(file, seams=self.array, shape=np.array(self.shape), vertical=self.vertical)
+
+    @staticmethod
+    def load(file):
+        '''
+        Loads seams saved with save.
+        @param file A filename or a file object
+        @return The SeamSet
+        '''
+        with np.load(file) as data:
+            return SeamSet(data['seams'], tuple(data['shape']), bool(data['vertical']))
+
+
+def isHorizontal(seams):
+    '''
+    @return True if seams is a SeamSet of horizontal seams
+    '''
+    return isinstance(seams, SeamSet) and not seams.vertical
+
+
+def asSeamArray(seams, length):
+    '''
+    Converts seams (a SeamSet, a list of seams or a single seam) into a (k, length) int64 array.
+    @param seams The seams
+    @param length The length of the seams
+    @return The array
+    '''
+    if isinstance(seams, SeamSet):
+        seams = seams.array
+    return np.asarray(seams, dtype=np.int64).reshape((-1, length))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Seam carving for images that do not fit into memory.
+# The image is read and written in chunks of rows. The backpointers of the seam search
+# are spilled to a temporary file (one byte per pixel), so the memory used is bounded
+# by the chunk size and not by the size of the image.
+import os
+import tempfile
+import numpy as np
+import ImgLib.MyLib as ML
+from ImgLib.MyLibTool import makeGray
+
+
+def openRaw(filename, shape, dtype=np.uint8, mode="r"):
+    '''
+    Opens a raw image file (rows of pixels without header) as memory map.
+    @param filename The filename
+    @param shape The shape of the image, (h,w) or (h,w,p)
+    @param dtype The type of the pixels
+    @param mode "r" for reading, "r+" for changing, "w+" for creating
+    @return The np.memmap
+    '''
+    return np.memmap(filename, dtype=dtype, mode=mode, shape=tuple(shape))
+
+
+def _defaultEnergy(img):
+    return ML.absDivergence(makeGray(img))
+
+
+def _findSeamStreaming(img, width, pointer, chunkRows, energyFactory, halo, stopFunc):
+    '''
+    Finds the optimal vertical seam of img[:, :width]. Like findOptimalSeam, but the energy
+    is computed chunk by chunk and the backpointers are stored in pointer (memory map).
+    @return The seam or None if stopped or if there is no seam with finite energy.
+    '''
+    h = img.shape[0]
+    cols = np.arange(width)
+    ext = np.full(width + 2, np.inf) # The cost of the previous row, padded with inf
+    windows = np.lib.stride_tricks.sliding_window_view(ext, width)
+    for r0 in range(0, h, chunkRows):
+        if stopFunc and stopFunc():
+            return None
+        r1 = min(h, r0 + chunkRows)
+        a0 = max(0, r0 - halo)
+        a1 = min(h, r1 + halo)
+        energy = energyFactory(np.asarray(img[a0:a1, :width], dtype=np.float64))[r0 - a0:r1 - a0]
+        ptr = np.zeros((r1 - r0, width), dtype=np.int8)
+        for r in range(r0, r1):
+            if r == 0:
+                ext[1:width + 1] = energy[0]
+                continue
+            cand = windows[0:3] # Neighbor above left, above and above right
+            k = cand.argmin(axis=0)
+            ext[1:width + 1] = cand[k, cols] + energy[r - r0]
+            ptr[r - r0] = k - 1
+        pointer[r0:r1, :width] = ptr
+    C = ext[1:width + 1]
+    minCol = C.argmin()
+    if C[minCol] == np.inf:
+        return None
+    seam = np.zeros(h, dtype=np.int64)
+    col = minCol
+    for r0 in reversed(range(0, h, chunkRows)): # Backtracking in reverse chunk order
+        r1 = min(h, r0 + chunkRows)
+        ptr = np.asarray(pointer[r0:r1, :width])
+        for r in range(r1 - 1, r0 - 1, -1):
+            seam[r] = col
+            col += ptr[r - r0, col]
+    return seam
+
+
+def _removeSeamChunked(img, width, seam, chunkRows):
+    '''
+    Removes the seam from img[:, :width] in place. Afterwards img[:, :width-1] is the result.
+    '''
+    h = img.shape[0]
+    for r0 in range(0, h, chunkRows):
+        r1 = min(h, r0 + chunkRows)
+        chunk = np.asarray(img[r0:r1, :width])
+        keep = np.ones((r1 - r0, width), dtype=bool)
+        keep[np.arange(r1 - r0), seam[r0:r1]] = False
+        img[r0:r1, :width - 1] = chunk[keep].reshape((r1 - r0, width - 1) + chunk.shape[2:])
+
+
+def removeSeamsStreaming(src, dst, count=1, chunkRows=1024, energyFactory=None, halo=2,
+                         tmpDir=None, progressFunc=None, stopFunc=None):
+    '''
+    Removes count vertical seams (one after another, like RemoveSeamImage) from a big image.
+    Only chunkRows rows are in memory at the same time.
+    @param src The image, e.g. a np.memmap (see openRaw). It is not changed.
+    @param dst The result with the shape (h, w-count[, p]), e.g. a np.memmap. None creates a
+               temporary memory map (removed when it is not used anymore).
+    @param count Number of seams to remove
+    @param chunkRows Number of rows that are processed at once
+    @param energyFactory A function computing the energy (numpy array) of an image chunk.
+           Default: absDivergence of the grayscale chunk.
+    @param halo Number of rows above and below a chunk that are used for computing the energy.
+    @param tmpDir Directory for the temporary files
+    @param progressFunc A function for showing the progress. (int -> )
+    @param stopFunc Function, stopFunc()==True stops the algorithm. (-> boolean)
+    @return dst or None if stopped.
+    '''
+    if energyFactory is None:
+        energyFactory = _defaultEnergy
+    h, w = src.shape[:2]
+    outShape = (h, w - count) + src.shape[2:]
+    if count < 0 or count >= w:
+        raise ValueError("count must be between 0 and %d" % (w - 1))
+    if dst is None:
+        dst = np.memmap(tempfile.TemporaryFile(dir=tmpDir), dtype=src.dtype, mode="w+", shape=outShape)
+    elif dst.shape != outShape:
+        raise ValueError("dst must have the shape %s" % (outShape,))
+    with tempfile.TemporaryDirectory(dir=tmpDir) as tmp:
+        work = np.memmap(os.path.join(tmp, "image"), dtype=src.dtype, mode="w+", shape=src.shape)
+        pointer = np.memmap(os.path.join(tmp, "pointer"), dtype=np.int8, mode="w+", shape=(h, w))
+        for r0 in range(0, h, chunkRows):
+            work[r0:r0 + chunkRows] = src[r0:r0 + chunkRows]
+        for i in range(count):
+            if progressFunc:
+                progressFunc(i * 100 / count)
+            seam = _findSeamStreaming(work, w - i, pointer, chunkRows, energyFactory, halo, stopFunc)
+            if seam is None:
+                return None
+            _removeSeamChunked(work, w - i, seam, chunkRows)
+        for r0 in range(0, h, chunkRows):
+            dst[r0:r0 + chunkRows] = work[r0:r0 + chunkRows, :w - count]
+        if isinstance(dst, np.memmap):
+            dst.flush()
+        del work, pointer
+    return dst
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# The undo history of the pictures, limited by the memory it uses (not by the number of steps).
+# Only the current picture is kept as it is. Removing seams (or any pixels, e.g. by the interactive resize)
+# is stored as the removed pixels and their positions, every other step as compressed picture.
+# Undo and redo rebuild the pictures on demand from these entries.
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ImgLib.SeamSet import SeamSet
+
+# Default memory budget of the history in bytes
+defaultMaxBytes = 512 * 2 ** 20
+
+_chunkSize = 1 << 22 # The pictures are compressed in chunks of 4 MiB, in parallel (zlib releases the GIL)
+_pool = None
+
+
+def _map(func, items):
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(os.cpu_count() or 1)
+    return list(_pool.map(func, items))
+
+
+def _pixelView(img):
+    # img as (h, w) array with one element per pixel (indexing whole pixels is much faster than single values)
+    img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    return img.view(np.dtype((np.void, img.itemsize * (img.size // max(1, h * w))))).reshape((h, w))
+
+
+def _removeMasked(img, mask):
+    # img without the pixels of mask (the same number of pixels in every row)
+    h, w = mask.shape
+    res = _pixelView(img)[~mask]
+    return res.view(img.dtype).reshape((h, w - int(mask.sum()) // h) + img.shape[2:])
+
+
+def _insertMasked(img, mask, values):
+    # Inverse of _removeMasked (values are the removed pixels, see _pixelView)
+    res = np.empty(mask.shape + img.shape[2:], dtype=img.dtype)
+    pixels = _pixelView(res)
+    pixels[mask] = values
+    pixels[~mask] = _pixelView(img).reshape(-1)
+    return res
+
+
+class _Snapshot:
+    # A whole picture, compressed with zlib when it is not the current picture anymore
+    def __init__(self, img, level):
+        self.__img = img
+        self.__level = level
+        self.__chunks = None
+        self.__shape = img.shape
+        self.__dtype = img.dtype
+        self.__storedDtype = img.dtype
+
+    @property
+    def nbytes(self):
+        return 0 if self.__chunks is None else sum(len(chunk) for chunk in self.__chunks)
+
+    def release(self):
+        '''
+        Compresses the picture (called when it is not the current one anymore).
+        '''
+        if self.__chunks is not None:
+            return
+        img = np.ascontiguousarray(self.__img)
+        if img.dtype.kind == 'f': # Most effects return floats, often with the values of an uint8 picture
+            img8 = img.astype(np.uint8)
+            if np.array_equal(img8, img):
+                img = img8
+        self.__storedDtype = img.dtype
+        data = memoryview(img.reshape(-1)).cast('B')
+        self.__chunks = _map(lambda start: zlib.compress(data[start:start + _chunkSize], self.__level),
+                             range(0, len(data), _chunkSize))
+        self.__img = None
+
+    def image(self):
+        if self.__img is not None:
+            return self.__img
+        res = np.empty(self.__shape, dtype=self.__storedDtype)
+        data = res.reshape(-1).view(np.uint8)
+
+        def decompress(i):
+            chunk = np.frombuffer(zlib.decompress(self.__chunks[i]), dtype=np.uint8)
+            data[i * _chunkSize:i * _chunkSize + len(chunk)] = chunk
+
+        _map(decompress, range(len(self.__chunks)))
+        return res if self.__storedDtype == self.__dtype else res.astype(self.__dtype)
+
+
+class _SeamDelta:
+    # A picture of which some pixels (e.g. seams) of the previous picture are removed.
+    # Only the positions (a SeamSet) and the values of the removed pixels are stored.
+    def __init__(self, seams, values):
+        self.seams = seams
+        self.values = values
+
+    @property
+    def nbytes(self):
+        return self.seams.array.nbytes + self.values.nbytes
+
+    def release(self):
+        pass
+
+    @staticmethod
+    def create(previous, img, seams):
+        '''
+        @return The _SeamDelta from previous to img or None if img is not previous without the pixels of seams
+        '''
+        seams = SeamSet(seams, previous.shape) if not isinstance(seams, SeamSet) else seams
+        if seams.shape != previous.shape[:2] or len(seams) == 0:
+            return None
+        mask = seams.mask()
+        if not seams.vertical:
+            previous, img, mask = np.swapaxes(previous, 0, 1), np.swapaxes(img, 0, 1), mask.T
+        n = mask.shape[0]
+        if mask.sum() != len(seams) * n or img.shape != (n, mask.shape[1] - len(seams)) + previous.shape[2:]:
+            return None # The seams are not disjoint or do not fit to img
+        if not np.array_equal(_removeMasked(previous, mask), img):
+            return None # img was changed otherwise, too
+        return _SeamDelta(seams, _pixelView(previous)[mask])
+
+    def forward(self, previous):
+        '''
+        @return The picture of this entry built from the previous one
+        '''
+        mask = self.seams.mask()
+        if self.seams.vertical:
+            return _removeMasked(previous, mask)
+        return np.ascontiguousarray(np.swapaxes(_removeMasked(np.swapaxes(previous, 0, 1), mask.T), 0, 1))
+
+    def backward(self, img):
+        '''
+        @return The previous picture built from the picture of this entry
+        '''
+        mask = self.seams.mask()
+        if self.seams.vertical:
+            return _insertMasked(img, mask, self.values)
+        return np.ascontiguousarray(np.swapaxes(_insertMasked(np.swapaxes(img, 0, 1), mask.T, self.values), 0, 1))
+
+
+class UndoHistory:
+    '''
+    The history of a picture for undo and redo.
+    The entries are removed from the oldest one on, if the stored data needs more than maxBytes
+    (the current picture itself is not counted, it is always kept).
+    '''
+
+    def __init__(self, maxBytes=defaultMaxBytes, level=1):
+        '''
+        @param maxBytes The memory budget in bytes
+        @param level The zlib compression level of the pictures (1: fast, 9: small)
+        '''
+        self.__maxBytes = maxBytes
+        self.__level = level
+        self.__entries = []
+        self.__current = None
+        self.__index = -1
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def maxBytes(self):
+        return self.__maxBytes
+
+    def setMaxBytes(self, maxBytes):
+        '''
+        Sets the memory budget, old entries are removed if needed.
+        @param maxBytes The memory budget in bytes
+        '''
+        self.__maxBytes = maxBytes
+        self.__shrink()
+
+    def nbytes(self):
+        '''
+        @return The memory used by the stored entries in bytes (without the current picture)
+        '''
+        return sum(entry.nbytes for entry in self.__entries)
+
+    def current(self):
+        '''
+        @return The current picture or None
+        '''
+        return self.__current
+
+    def canUndo(self):
+        return self.__index > 0
+
+    def canRedo(self):
+        return self.__index + 1 < len(self.__entries)
+
+    def clear(self):
+        self.__entries = []
+        self.__current = None
+        self.__index = -1
+
+    def push(self, img, seams=None):
+        '''
+        Adds a picture as new current picture (the entries for redo are removed).
+        @param img The picture (numpy array, it must not be changed afterwards)
+        @param seams If img is the current picture without some pixels, e.g. removed seams,
+                     a SeamSet (or list of vertical seams) of these pixels in the current picture.
+                     Then only these pixels are stored. Otherwise (or if img differs in other pixels) img is stored.
+        '''
+        entry = None
+        if seams is not None and self.__current is not None:
+            entry = _SeamDelta.create(self.__current, img, seams)
+        if entry is None:
+            entry = _Snapshot(img, self.__level)
+        del self.__entries[self.__index + 1:]
+        if self.__entries:
+            self.__entries[-1].release()
+        self.__entries.append(entry)
+        self.__index = len(self.__entries) - 1
+        self.__current = img
+        self.__shrink()
+
+    def undo(self):
+        '''
+        Goes one step back.
+        @return The previous picture (now the current one) or None if there is none
+        '''
+        if not self.canUndo():
+            return None
+        entry = self.__entries[self.__index]
+        if isinstance(entry, _SeamDelta):
+            img = entry.backward(self.__current)
+        else:
+            img = self.__rebuild(self.__index - 1)
+        entry.release()
+        self.__index -= 1
+        self.__current = img
+        self.__shrink() # The released entry is stored compressed now
+        return img
+
+    def redo(self):
+        '''
+        Goes one step forward.
+        @return The next picture (now the current one) or None if there is none
+        '''
+        if not self.canRedo():
+            return None
+        entry = self.__entries[self.__index + 1]
+        if isinstance(entry, _SeamDelta):
+            img = entry.forward(self.__current)
+        else:
+            img = entry.image()
+        self.__entries[self.__index].release()
+        self.__index += 1
+        self.__current = img
+        self.__shrink()
+        return img
+
+    def __rebuild(self, index):
+        # The picture of an entry (from the last picture stored as a whole before it)
+        start = index
+        while isinstance(self.__entries[start], _SeamDelta):
+            start -= 1
+        img = self.__entries[start].image()
+        for entry in self.__entries[start + 1:index + 1]:
+            img = entry.forward(img)
+        return img
+
+    def __shrink(self):
+        # Removes the entries for redo and then the oldest entries until the budget is kept
+        # (the current entry is never removed)
+        while self.canRedo() and self.nbytes() > self.__maxBytes:
+            del self.__entries[-1]
+        while self.__index > 0 and self.nbytes() > self.__maxBytes:
+            if isinstance(self.__entries[1], _SeamDelta): # The first entry has to be a whole picture
+                if self.__index == 1:
+                    snapshot = _Snapshot(self.__current, self.__level)
+                else:
+                    snapshot = _Snapshot(self.__entries[1].forward(self.__entries[0].image()), self.__level)
+                    snapshot.release()
+                self.__entries[1] = snapshot
+            del self.__entries[0]
+            self.__index -= 1
@@ -8,9 +8,13 @@ except:
 
     guig = gui
     from PyQt4 import QtCore
+import time
 import numpy as np
 import ImgLib.MyLib as ML
 import ImgLib.MyLibTool as MLT
+from ImgLib.CarvingBuffer import CarvingBuffer
+from ImgLib.Progress import CancelToken, ProgressReporter
+from ImgLib.Profiling import Profile, stage, profiled
 import matplotlib
 
 from abc import ABCMeta, abstractmethod
@@ -24,10 +28,16 @@ class StdEffect(QtCore.QObject):
     Things to do for implementing an effect:
     - Making a subclass
     - Generate some graphical elements (see self._addWdg, self.lay, self._addStretch, self._addDiscription)
+    - Give the widgets holding the settings a name (see self._addWdg, self._addParameter),
+      so the effect can also be configured without the gui (see self.setParameters).
+      Read them with self._value, so numbers of seams or pixels are scaled for previews.
     - For working with energy functions use self.getEnergyFunction
     - Implementing _applyImage(...)
         - Make use of the progress signal and use them for your effect
         - self._haveToQuit() return true if the effect should stop.
+          Pass self._cancelToken as stopFunc to the algorithms.
+        - If the result is the picture without some of its pixels (e.g. removed seams),
+          set self.removedSeams, so the undo history stores only these pixels.
     '''
     _metaclass__ = ABCMeta
     '''
@@ -48,6 +58,23 @@ class StdEffect(QtCore.QObject):
     '''
     started = QtCore.pyqtSignal([])
 
+    '''
+        Signal with an intermediate result (a downsampled uint8 numpy array), 
+        emitted by long running effects at most every previewInterval seconds.
+    '''
+    preview = QtCore.pyqtSignal(['PyQt_PyObject'])
+
+    '''
+        Signal with the report of a profiled run (a dict, see Profiling.Profile.report).
+        It is emitted before finished if data['profile'] is true.
+    '''
+    profiled = QtCore.pyqtSignal(['PyQt_PyObject'])
+
+    '''
+        Signal notifies that a named parameter was changed in the gui (e.g. for updating a preview).
+    '''
+    parametersChanged = QtCore.pyqtSignal([])
+
     def __init__(self, title):
         '''
         @param title the title of the effect
@@ -58,20 +85,40 @@ class StdEffect(QtCore.QObject):
         self.mainWdg.setLayout(self.lay)
         self.__title = title
         self.__energyfunction = self.__stdEnergyFunction
-        self.__quitting = False
+        self.__energyCache = None
+        self._cancelToken = CancelToken()
+        self.__progressReporter = ProgressReporter()
+        self.__parameters = {}
+        self.__scales = {} # Parameter name => 'x' or 'y' (see _addParameter)
+        self.__scale = (1., 1.) # Scale of the picture of the current run in x and y
+        self.__size = None # Size (w, h) of the picture of the current run
+        self.previewInterval = 0.5 # Seconds between two previews, <= 0 disables them
+        self.previewSize = 512 # Maximal width and height of a preview
+        self.__lastPreview = 0
+        self.lastProfile = None # The report of the last profiled run
+        # SeamSet of the pixels of data['img'] removed by the last run, if the result consists of the other pixels
+        self.removedSeams = None
 
     def quit(self):
         '''
             Set a flag for cancel work. 
         '''
-        self.__quitting = True
+        self._cancelToken.cancel()
 
     def _haveToQuit(self):
         '''
             Returns true when the effect should cancel.
             @return true if yes, false otherwise.
         '''
-        return self.__quitting
+        return self._cancelToken()
+
+    def setCancelToken(self, token):
+        '''
+            Sets the token which cancels the effect, e.g. a PollingCancelToken
+            checking the messages of another process. It is reset when the effect starts.
+            @param token The CancelToken
+        '''
+        self._cancelToken = token
 
     def getEnergyFunction(self, img): # Delete and pass through argument by apply_image?
         '''
@@ -79,7 +126,11 @@ class StdEffect(QtCore.QObject):
             @param img The picture for building the energy-function.
             @return A numpy-array hopefully with the size of img
         '''
-        return self.__energyfunction(img)
+        with stage("energy"):
+            func = profiled(self.__energyfunction) # Measured as its own stage while profiling
+            if self.__energyCache is not None:
+                return self.__energyCache(func, img)
+            return func(img)
 
 
     def setEnergyBuildFunction(self, func):  
@@ -89,6 +140,13 @@ class StdEffect(QtCore.QObject):
         '''
         self.__energyfunction = func
 
+    def setEnergyCache(self, cache):
+        '''
+            Sets a cache sharing the energy maps with other effects (see ImgLib.EnergyCache).
+            @param cache The EnergyCache or None
+        '''
+        self.__energyCache = cache
+
     def __stdEnergyFunction(self, img):
         img_g = img
         if (np.ndim(img) == 3):
@@ -134,16 +192,118 @@ class StdEffect(QtCore.QObject):
         return self.mainWdg
 
 
-    def _addWdg(self, title, wdg):
+    def _addWdg(self, title, wdg, name=None, scale=None):
         '''
             Adds a widget with text.
             @param title The title text
             @param wdg The widget
+            @param name If given, the value of the widget is registered as parameter with this name.
+            @param scale See _addParameter
+            @see _addParameter
         '''        
         lay2 = gui.QHBoxLayout()
         lay2.addWidget(gui.QLabel(title))
         lay2.addWidget(wdg)
         self.lay.addLayout(lay2)
+        if name is not None:
+            self._addParameter(name, wdg, scale)
+
+    def _addParameter(self, name, wdg, scale=None):
+        '''
+            Registers a widget (QSpinBox or QCheckBox) as a named parameter of this effect.
+            @param name The name of the parameter
+            @param wdg The widget holding the value
+            @param scale 'x' or 'y' if the value is a number of seams or pixels in this direction
+                         (e.g. vertical seams: 'x'). It is scaled, if the effect is applied to
+                         a downscaled picture (see _value and data['scale'] of applyEffect).
+        '''
+        self.__parameters[name] = wdg
+        if scale is not None:
+            self.__scales[name] = scale
+        if isinstance(wdg, gui.QCheckBox):
+            wdg.toggled.connect(lambda checked: self.parametersChanged.emit())
+        else:
+            wdg.valueChanged.connect(lambda value: self.parametersChanged.emit())
+
+    def _value(self, name):
+        '''
+            Returns the value of a named parameter for the current run.
+            Values with a scale (see _addParameter) are scaled to the size of the picture.
+            @param name The name of the parameter
+            @return The value. A scaled positive value is at least 1 and at most the size of the
+                    picture in its direction (unless the value is above the size of the whole picture).
+        '''
+        wdg = self.__parameters[name]
+        if isinstance(wdg, gui.QCheckBox):
+            return wdg.isChecked()
+        value = wdg.value()
+        scale = self.__scales.get(name)
+        if scale is None or value <= 0:
+            return value
+        axis = 0 if scale == 'x' else 1
+        factor = self.__scale[axis]
+        if factor == 1:
+            return value
+        res = max(1, int(round(value * factor)))
+        if self.__size is not None and value <= self.__size[axis] / factor: # Not enlarging
+            res = min(res, self.__size[axis])
+        return res
+
+    def parameters(self):
+        '''
+            Returns the current values of the named parameters.
+            @return A map name => value
+        '''
+        res = {}
+        for name, wdg in self.__parameters.items():
+            if isinstance(wdg, gui.QCheckBox):
+                res[name] = wdg.isChecked()
+            else:
+                res[name] = wdg.value()
+        return res
+
+    def setParameters(self, params):
+        '''
+            Sets the named parameters of this effect (e.g. for using it without the gui).
+            Values above the maximum of a spinbox will enlarge its range.
+            @param params A map name => value
+        '''
+        for name, value in params.items():
+            if not name in self.__parameters:
+                raise ValueError("Effect '%s' has no parameter '%s' (known: %s)"
+                                 % (self.__title, name, ", ".join(sorted(self.__parameters))))
+            wdg = self.__parameters[name]
+            if isinstance(wdg, gui.QCheckBox):
+                wdg.setChecked(bool(value))
+                continue
+            value = int(value)
+            if value < wdg.minimum():
+                raise ValueError("Parameter '%s' of effect '%s' must be at least %d"
+                                 % (name, self.__title, wdg.minimum()))
+            if value > wdg.maximum():
+                wdg.setMaximum(value)
+            wdg.setValue(value)
+
+    def _emitProgress(self, value):
+        '''
+            Emits the progress signal (at most every 50ms).
+            @param value The progress in percent (may be a float)
+        '''
+        self.__progressReporter(value)
+
+    def _emitPreview(self, img):
+        '''
+            Emits the preview signal, if the last preview is at least previewInterval seconds ago.
+            @param img The intermediate picture or a function returning it (only called if a preview is emitted)
+        '''
+        if self.previewInterval <= 0 or time.monotonic() - self.__lastPreview < self.previewInterval:
+            return
+        self.__lastPreview = time.monotonic()
+        if callable(img):
+            img = img()
+        step = max(1, -(-max(img.shape[:2]) // self.previewSize))
+        self.preview.emit(np.ascontiguousarray(np.clip(img[::step, ::step], 0, 255).astype(np.uint8)))
+
     @QtCore.pyqtSlot('PyQt_PyObject')
     def applyEffect(self, data):
         '''
@@ -155,15 +315,35 @@ class StdEffect(QtCore.QObject):
         @param data A map of the data for this functions. 
                 E.g. data['img'] contains the Image 
                 and data['mask'] contains an optional mask used for isolate the effect area.
+                If data['profile'] is true, the time and memory of every stage is measured
+                (see self.lastProfile and the profiled signal).
+                data['scale'] = (x, y) tells that the picture is a downscaled one (e.g. for a preview),
+                the parameters are scaled with it (see _value).
+        @return The resulting image (the same which is emitted by finished)
         '''
-        self.__quitting = False
+        self._cancelToken.reset()
+        self.removedSeams = None
+        self.__progressReporter = ProgressReporter(self.progress.emit)
+        self.__lastPreview = time.monotonic() # The first preview after previewInterval
         self.started.emit()
-        QtCore.QCoreApplication.processEvents()
         res = data['img']
+        profile = Profile() if data.get('profile') else None
+        self.__scale = data.get('scale', (1., 1.))
+        self.__size = (res.shape[1], res.shape[0]) if np.ndim(res) >= 2 else None
         try:
-            res = self._applyImage(data)
+            if profile is None:
+                res = self._applyImage(data)
+            else:
+                with profile:
+                    res = self._applyImage(data)
         finally:
+            self.__scale = (1., 1.)
+            self.__size = None
+            if profile is not None:
+                self.lastProfile = profile.report()
+                self.profiled.emit(self.lastProfile)
             self.finished.emit(res)
+        return res
 
     @abstractmethod
     def _applyImage(self,data):
@@ -195,6 +375,9 @@ class BWEffect(StdEffect):
         lay.addWidget(self.chB)
         self.chG = gui.QCheckBox("Green")
         lay.addWidget(self.chG)
+        self._addParameter("red", self.chR)
+        self._addParameter("blue", self.chB)
+        self._addParameter("green", self.chG)
         self._addDiscription("Convert the picture into a grayscale one.")
         self._addStretch()
 
@@ -250,8 +433,12 @@ class ShowSeams(StdEffect):
         self.sbox = gui.QSpinBox()
         self.sbox.setMaximum(100)
         self.sbox.setMinimum(0)
-        self._addWdg("Seamcount:", self.sbox)
-        self._addDiscription("Calculate and show the seams with the current energy function.")
+        self._addWdg("Seamcount:", self.sbox, "seams", 'x')
+        self.approxBox = gui.QCheckBox("Approximate (faster)")
+        self.lay.addWidget(self.approxBox)
+        self._addParameter("approximate", self.approxBox)
+        self._addDiscription("Calculate and show the seams with the current energy function. "
+                             + "Approximate finds all seams with one search, but they are not always optimal.")
         self._addStretch()
 
     def _findSeams(self, img, mask):
@@ -271,7 +458,7 @@ class ShowSeams(StdEffect):
         efunc = efunc * h * w
         efunc[mask > 0] = -abs(efunc.max()) * h * w
 
-        return ML.findTopDisjointSeams( efunc, diff, lambda s: self.progress.emit(s),stopFunc=self._haveToQuit)
+        return ML.findTopDisjointSeams( efunc, diff, self._emitProgress,stopFunc=self._cancelToken)
 
     def _applyImage(self, data):
         img = data['img']
@@ -288,9 +475,10 @@ class ShowSeams(StdEffect):
             seams = self._findSeams(img, mask)
             if (not len(seams) == 0):
                 return MLT.drawSeamsInImage(img, seams)  # Let's use the drawing area.
-        diff = self.sbox.value()
+        diff = self._value("seams")
         s = self.getEnergyFunction(img)
-        seams = ML.findTopDisjointSeams(s, diff, lambda s: self.progress.emit(s),stopFunc=self._haveToQuit)
+        seams = ML.findTopDisjointSeams(s, diff, self._emitProgress,stopFunc=self._cancelToken,
+                                        approximate=self.approxBox.isChecked())
         return MLT.drawSeamsInImage(img, seams)
 
 class ContentAmplification(StdEffect):
@@ -304,20 +492,21 @@ class ContentAmplification(StdEffect):
         self.ybox.setValue(1)
         self.ybox.setMaximum(100)
         self.ybox.setMinimum(0)
-        self._addWdg("Amplification X", self.xbox)
-        self._addWdg("Amplification Y",self.ybox)
+        self._addWdg("Amplification X", self.xbox, "x", 'x')
+        self._addWdg("Amplification Y", self.ybox, "y", 'y')
         self._addDiscription("Content Amplification."+
                              "Resize the important areas of the picture by increasing the  "
                              +"image with nearest neighbor and decreasing with seam carving to the original size")
         self._addStretch()
     def _applyImage(self,data):
         img = data['img']
-        xCount = self.xbox.value()
-        yCount = self.ybox.value()
+        xCount = self._value("x")
+        yCount = self._value("y")
         h = img.shape[0]
         w = img.shape[1]
         img2 = ML.resizeConventional(img,w+xCount,h+yCount)
-        return ML.retargetingImage(img2,xCount,yCount,self.getEnergyFunction,lambda k: self.progress.emit(k),stopFunc=self._haveToQuit)
+        return ML.retargetingImage(img2,xCount,yCount,self.getEnergyFunction,self._emitProgress,stopFunc=self._cancelToken,
+                                   previewFunc=self._emitPreview)
 
 class BiggerImage(StdEffect):
     def __init__(self):
@@ -325,13 +514,17 @@ class BiggerImage(StdEffect):
         self.sbox = gui.QSpinBox()
         self.sbox.setMaximum(100)
         self.sbox.setMinimum(0)
-        self._addWdg("Seamcount:", self.sbox)
-        self._addDiscription("Increase the picture by duplicating (and interpolating) low energy seams")
+        self._addWdg("Seamcount:", self.sbox, "seams", 'x')
+        self.approxBox = gui.QCheckBox("Approximate (faster)")
+        self.lay.addWidget(self.approxBox)
+        self._addParameter("approximate", self.approxBox)
+        self._addDiscription("Increase the picture by duplicating (and interpolating) low energy seams. "
+                             + "Approximate finds all seams with one search, but they are not always optimal.")
         self._addStretch()
 
     def _applyImage(self, data):
         img = data['img']
-        diff = self.sbox.value()
+        diff = self._value("seams")
         h, w = (0, 0)
         if (np.ndim(img) == 3):
             h, w, p = img.shape
@@ -340,7 +533,9 @@ class BiggerImage(StdEffect):
         else:
             return None  # Picture cannot be edit
         s = self.getEnergyFunction(img)
-        seams = ML.findTopDisjointSeams(s, diff, lambda s: self.progress.emit(s),stopFunc=self._haveToQuit)
+        seams = ML.findTopDisjointSeams(s, diff, self._emitProgress,stopFunc=self._cancelToken,
+                                        approximate=self.approxBox.isChecked(),
+                                        previewFunc=lambda found: self._emitPreview(lambda: MLT.drawSeamsInImage(img, found)))
         return ML.duplicateSeams(img, seams)
 
 
@@ -351,27 +546,36 @@ class RemoveSeamImage(StdEffect):
         self.sbox.setValue(1)
         self.sbox.setMaximum(100)
         self.sbox.setMinimum(0)
-        self._addWdg("Seamcount:", self.sbox)
+        self._addWdg("Seamcount:", self.sbox, "seams", 'x')
+        self.forwardBox = gui.QCheckBox("Forward energy")
+        self.lay.addWidget(self.forwardBox)
+        self._addParameter("forward", self.forwardBox)
+        self.objectBox = gui.QCheckBox("Fast object removal")
+        self.lay.addWidget(self.objectBox)
+        self._addParameter("object", self.objectBox)
         self._addDiscription("Remove low energy seams."
                              +"The number of seams in seamcount will be use. "
                              +"But if there is something drawn seamcount will be ignored " 
-                             +"and the marked area will be removed.")
+                             +"and the marked area will be removed. "
+                             +"Forward energy chooses the seams by the edges they create (the energy function is not used). "
+                             +"Fast object removal removes the marked area with vertical or horizontal seams (whichever are fewer), "
+                             +"several at once and searched only near the area (not with forward energy).")
         self._addStretch()
 
     def _applyImage(self, data):
         img = data['img']
-        diff = self.sbox.value()
+        diff = self._value("seams")
         res = None
         if 'mask'  in data:
             mask = data['mask']
-            res = self._maskremove(img, mask, ML.removeSeams)
+            res = self._maskremove(img, mask)
         if res is None:
-            res = self._wholeremove(img, diff, ML.removeSeams)
-        if len(res) == 0:
+            res = self._wholeremove(img, diff)
+        if res is None or len(res) == 0: # Stopped
             return None
         return res
 
-    def _maskremove(self, img, mask, removeAction):
+    def _maskremove(self, img, mask):
         diff = mask.sum(axis=0)
         diff = (diff > 0).sum().astype("int")
         if (diff == 0):
@@ -383,21 +587,37 @@ class RemoveSeamImage(StdEffect):
             h, w = img.shape
         else:
             return None  # Picture cannot be edit
-        efunc = self.getEnergyFunction(img)
-        efunc[mask > 0] = -abs(efunc.max()) * h * w # Be as little as possible so it cannot be reached otherwise.
+        forward = self.forwardBox.isChecked()
+        if self.objectBox.isChecked() and not forward:
+            res = ML.removeMaskedObject(img, mask, self.getEnergyFunction, self._emitProgress, self._cancelToken)
+            return [] if res is None else res
+        if forward:
+            gray = MLT.makeGray(img * 1.0)
+            efunc = np.zeros((h, w))
+            efunc[mask > 0] = -(2 * h * (gray.max() - gray.min()) + 1) # Lower than the forward energy of every seam
+        else:
+            efunc = self.getEnergyFunction(img)
+            efunc[mask > 0] = -abs(efunc.max()) * h * w # Be as little as possible so it cannot be reached otherwise.
 
-        res = img
+        res = CarvingBuffer(img, efunc, trackPositions=True) # The seams are removed in place
+        if forward:
+            grayBuf = CarvingBuffer(gray)
         for i in range(diff):
-            self.progress.emit(i * 100 / diff)
-            QtCore.QCoreApplication.processEvents()
-            seam = ML.findOptimalSeam(efunc,stopFunc=self._haveToQuit)
+            self._emitProgress(i * 100 / diff)
+            if forward:
+                seam = ML.findOptimalSeamForward(grayBuf.image(), res.energy(), stopFunc=self._cancelToken)
+            else:
+                seam = ML.findOptimalSeam(res.energy(),stopFunc=self._cancelToken)
             if (self._haveToQuit()):
                 return []
-            res = removeAction(res, seam)
-            efunc = ML.removeSeams(efunc, seam)
-        return res
-
-    def _wholeremove(self, img, diffcount, removeAction):
+            res.removeSeam(seam)
+            if forward:
+                grayBuf.removeSeam(seam)
+            self._emitPreview(res.image)
+        self.removedSeams = res.removedPixels()
+        return np.ascontiguousarray(res.image())
+
+    def _wholeremove(self, img, diffcount):
         h, w = (0, 0)
         if (np.ndim(img) == 3):
             h, w, p = img.shape
@@ -405,17 +625,30 @@ class RemoveSeamImage(StdEffect):
             h, w = img.shape
         else:
             return None  # Picture cannot be edit
-        res = img
-        s = self.getEnergyFunction(img)
+        res = CarvingBuffer(img, trackPositions=True) # The seams are removed in place
+        forward = self.forwardBox.isChecked()
+        if forward: # The forward energy needs only the grayscale picture, from which the seams are removed too
+            grayBuf = CarvingBuffer(MLT.makeGray(img * 1.0))
+        else:
+            res.setEnergy(self.getEnergyFunction(img))
         for i in range(diffcount):
             if (self._haveToQuit()):
                 return
-            self.progress.emit(i * 100 / diffcount)
-            QtCore.QCoreApplication.processEvents()
-            seam = ML.findOptimalSeam(s,stopFunc=self._haveToQuit)
-            res = removeAction(res, seam)
-            s = self.getEnergyFunction(res)
-        return res
+            self._emitProgress(i * 100 / diffcount)
+            if forward:
+                seam = ML.findOptimalSeamForward(grayBuf.image(), stopFunc=self._cancelToken)
+            else:
+                seam = ML.findOptimalSeam(res.energy(),stopFunc=self._cancelToken)
+            if seam is None:
+                return
+            res.removeSeam(seam)
+            if forward:
+                grayBuf.removeSeam(seam)
+            else: # Only the energy next to the seam changes
+                res.refreshEnergy(self.getEnergyFunction, seam)
+            self._emitPreview(res.image)
+        self.removedSeams = res.removedPixels()
+        return np.ascontiguousarray(res.image())
 
 class RetargetingImage(StdEffect):
     def __init__(self):
@@ -428,17 +661,22 @@ class RetargetingImage(StdEffect):
         self.ybox.setValue(1)
         self.ybox.setMaximum(100)
         self.ybox.setMinimum(0)
-        self._addWdg("Removing in X", self.xbox)
-        self._addWdg("Removing in Y",self.ybox)
+        self._addWdg("Removing in X", self.xbox, "x", 'x')
+        self._addWdg("Removing in Y", self.ybox, "y", 'y')
+        self.forwardBox = gui.QCheckBox("Forward energy")
+        self.lay.addWidget(self.forwardBox)
+        self._addParameter("forward", self.forwardBox)
         self._addDiscription("Retargeting with optimal seam order. "
-                             +"Decrease the image by finding an optimal order (vertical or horizontal) to remove seams.")
+                             +"Decrease the image by finding an optimal order (vertical or horizontal) to remove seams. "
+                             +"Forward energy chooses the seams by the edges they create (the energy function is not used).")
         self._addStretch()
 
     def _applyImage(self,data):
         img = data['img']
-        xCount = self.xbox.value()
-        yCount = self.ybox.value()
-        return ML.retargetingImage(img,xCount,yCount,self.getEnergyFunction,lambda k: self.progress.emit(k),stopFunc=self._haveToQuit)
+        xCount = self._value("x")
+        yCount = self._value("y")
+        return ML.retargetingImage(img,xCount,yCount,self.getEnergyFunction,self._emitProgress,stopFunc=self._cancelToken,
+                                   forward=self.forwardBox.isChecked(), previewFunc=self._emitPreview)
 
 
 
@@ -458,9 +696,9 @@ class RemoveSeamGradient(ShowSeams):
         self.olbox.setValue(15)
         self.olbox.setMinimum(3)
         self.olbox.setMaximum(100)
-        self._addWdg("Seamcount:", self.sbox)
-        self._addWdg("Iterations:", self.itbox)
-        self._addWdg("Overlapping:", self.olbox)
+        self._addWdg("Seamcount:", self.sbox, "seams", 'x')
+        self._addWdg("Iterations:", self.itbox, "iterations")
+        self._addWdg("Overlapping:", self.olbox, "overlap", 'x')
         self._addDiscription("Remove seams with the lowest energy from the gradient and "
                              +"reconstruct the picture from that gradient. "
                              + "The number of seams will be set with Seamcount "
@@ -472,8 +710,8 @@ class RemoveSeamGradient(ShowSeams):
 
     def _applyImage(self, data):
         img = data['img']
-        itera = self.itbox.value()
-        overl = self.olbox.value()
+        itera = self._value("iterations")
+        overl = self._value("overlap")
 
         seams = []
         if 'mask' in data:
@@ -482,7 +720,7 @@ class RemoveSeamGradient(ShowSeams):
         if self._haveToQuit():
             return None
         if (len(seams) == 0): # No Masking
-            diff = self.sbox.value()
+            diff = self._value("seams")
             h, w = (0, 0)
             if (np.ndim(img) == 3):
                 h, w, p = img.shape
@@ -492,13 +730,13 @@ class RemoveSeamGradient(ShowSeams):
                 return None # Picture cannot be edit
             res = img
             s = self.getEnergyFunction(img)
-            seams = ML.findTopDisjointSeams(s, diff, lambda i: self.progress.emit(i),stopFunc=self._haveToQuit)
+            seams = ML.findTopDisjointSeams(s, diff, self._emitProgress,stopFunc=self._cancelToken)
             if (self._haveToQuit()):
                 return None
-            res = ML.removeSeamsInGradient(res, seams, itera, overl,progressFunc=lambda i: self.progress.emit(i),stopFunc=self._haveToQuit)
+            res = ML.removeSeamsInGradient(res, seams, itera, overl,progressFunc=self._emitProgress,stopFunc=self._cancelToken)
             return res
         else:
-            return ML.removeSeamsInGradient(img, seams, itera, overl,progressFunc=lambda i: self.progress.emit(i),stopFunc=self._haveToQuit)
+            return ML.removeSeamsInGradient(img, seams, itera, overl,progressFunc=self._emitProgress,stopFunc=self._cancelToken)
 
 
 class HistoEqu(StdEffect):
@@ -574,15 +812,15 @@ class ResizingNormal(StdEffect):
         self.sboxH = gui.QSpinBox()
         self.sboxH.setMaximum(3000)
         self.sboxH.setMinimum(50)
-        self._addWdg("Width:", self.sboxW)
-        self._addWdg("Height:", self.sboxH)
+        self._addWdg("Width:", self.sboxW, "width", 'x')
+        self._addWdg("Height:", self.sboxH, "height", 'y')
         self._addDiscription("Resize the picture using Nearest Neighbor.")
         self._addStretch()
 
     def _applyImage(self, data):
         img = data['img']
-        width = self.sboxW.value()
-        height = self.sboxH.value()
+        width = self._value("width")
+        height = self._value("height")
         return ML.resizeConventional(img, width, height)
 
 
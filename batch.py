@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Applies an effect or a recipe of several effects (see EffectRunner.Pipeline) to many pictures without the gui.
+# E.g.: python3 batch.py "Remove Seams" photos/ -o out/ -p seams=40 -e L2Gradient -j 8
+#       python3 batch.py --recipe recipe.json photos/ -o out/
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+imageExtensions = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+# State of a worker process (see __initWorker)
+__worker = {}
+
+
+def collectImages(inputs):
+    '''
+    Expands directories and glob patterns to a list of image files.
+    @param inputs List of files, directories or glob patterns
+    @return Sorted list of filenames
+    '''
+    files = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            candidates = [os.path.join(entry, name) for name in os.listdir(entry)]
+        elif os.path.exists(entry):
+            candidates = [entry]
+        else:
+            candidates = glob.glob(entry, recursive=True)
+        for name in candidates:
+            if os.path.isfile(name) and name.lower().endswith(imageExtensions):
+                files.append(name)
+    return sorted(set(files))
+
+
+def parseParameters(values):
+    '''
+    Parses the effect parameters given as name=value.
+    @param values List of strings
+    @return A map name => int or bool
+    '''
+    params = {}
+    for value in values:
+        if not "=" in value:
+            raise ValueError("Parameter '%s' must have the form name=value" % value)
+        name, val = value.split("=", 1)
+        if val.lower() in ("true", "yes", "on"):
+            params[name] = True
+        elif val.lower() in ("false", "no", "off"):
+            params[name] = False
+        else:
+            params[name] = int(val)
+    return params
+
+
+def __initWorker(recipe, outDir, suffix, maxSize=None):
+    import EffectRunner
+    __worker['pipeline'] = EffectRunner.Pipeline(recipe)
+    __worker['outDir'] = outDir
+    __worker['suffix'] = suffix
+    __worker['maxSize'] = maxSize
+
+
+def __processImage(filename):
+    '''
+    Loads, processes and saves one picture inside a worker.
+    Only the filename is transferred to the worker, not the pixels.
+    @return (filename, seconds, input shape, output shape, error message or None)
+    '''
+    from ImgLib.ImageIO import readImage, writeImage
+    start = time.perf_counter()
+    try:
+        img = readImage(filename, __worker['maxSize'])
+        res = __worker['pipeline'].run(img)
+        if res is None:
+            raise RuntimeError("effect returned no image")
+        base, ext = os.path.splitext(os.path.basename(filename))
+        writeImage(os.path.join(__worker['outDir'], base + __worker['suffix'] + ext), res)
+        return filename, time.perf_counter() - start, img.shape, res.shape, None
+    except Exception as e:
+        return filename, time.perf_counter() - start, None, None, "%s: %s" % (type(e).__name__, e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Applies a SeamEater effect to many pictures.")
+    parser.add_argument("effect", nargs="?", help="Title or class name of the effect (see --list), "
+                                                  "omitted with --recipe")
+    parser.add_argument("inputs", nargs="*", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="out", help="Output directory (default: out)")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="Parameter of the effect, e.g. seams=40 (repeatable)")
+    parser.add_argument("-e", "--energy", default=None, help="Name of the energy function")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--suffix", default="", help="Appended to the output file names")
+    parser.add_argument("--max-size", type=int, default=None, metavar="PIXELS",
+                        help="Load the pictures reduced to about this width and height (JPEGs are decoded "
+                             "directly at 1/2, 1/4 or 1/8 of their size, e.g. for thumbnails)")
+    parser.add_argument("-r", "--recipe", default=None, metavar="FILE",
+                        help="Applies the effects of a recipe (JSON, e.g. saved in the pipeline of the gui) "
+                             "one after another instead of a single effect")
+    parser.add_argument("--list", action="store_true", help="List effects, parameters and energy functions")
+    args = parser.parse_args(argv)
+
+    if args.list or (args.effect is None and args.recipe is None):
+        import EffectRunner
+        for title in EffectRunner.effectTitles():
+            params = EffectRunner.createEffect(title).parameters()
+            print("%s: %s" % (title, ", ".join("%s=%s" % (k, v) for k, v in params.items())))
+        print("Energy functions: %s" % ", ".join(EffectRunner.energyNames()))
+        return 0
+
+    inputs = args.inputs
+    if args.recipe is not None:
+        if args.param or args.energy:
+            print("--param and --energy are part of the recipe", file=sys.stderr)
+            return 2
+        if args.effect is not None: # No effect name with a recipe, it is the first input
+            inputs = [args.effect] + inputs
+    else:
+        try:
+            params = parseParameters(args.param)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+    files = collectImages(inputs)
+    if len(files) == 0:
+        print("No images found", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+    try:  # Fail early on unknown effects, parameters or energy functions
+        if args.recipe is not None:
+            import EffectRunner
+            recipe = EffectRunner.Pipeline.load(args.recipe).recipe()
+        else:
+            recipe = {'steps': [{'effect': args.effect, 'params': params, 'energy': args.energy}]}
+        __initWorker(recipe, args.output, args.suffix, args.max_size)
+    except (ValueError, OSError) as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    failed = 0
+    pixels = 0
+    # spawn: the parent already owns a QApplication which must not be forked
+    pool = multiprocessing.get_context("spawn").Pool(max(1, args.jobs), initializer=__initWorker,
+                                                     initargs=(recipe, args.output, args.suffix, args.max_size))
+    try:
+        for filename, seconds, inShape, outShape, error in pool.imap_unordered(__processImage, files):
+            if error is None:
+                pixels += inShape[0] * inShape[1]
+                print("%s: %.3fs %dx%d -> %dx%d" % (filename, seconds, inShape[1], inShape[0], outShape[1], outShape[0]))
+            else:
+                failed += 1
+                print("%s: failed after %.3fs (%s)" % (filename, seconds, error), file=sys.stderr)
+    finally:
+        pool.close()
+        pool.join()
+    total = time.perf_counter() - start
+    done = len(files) - failed
+    print("%d images (%d failed) in %.2fs: %.2f images/s, %.2f MP/s with %d processes"
+          % (done, failed, total, done / total, pixels / total / 1e6, max(1, args.jobs)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
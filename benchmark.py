@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# Measures the hot paths on synthetic pictures and appends the results to a history,
+# so that the timings of different commits can be compared on one machine.
+# E.g.: python3 benchmark.py --sizes 0.3,2 -k Seam
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import ImgLib.Backends as Backends
+import ImgLib.MyLib as ML
+import ImgLib.Poisson as Poisson
+from ImgLib.SeamSet import SeamSet
+import EnergyFunction as Functions
+
+try:
+    from gui import QtTool
+except:
+    QtTool = None
+
+# Megapixels of the synthetic pictures (4:3)
+defaultSizes = (0.3, 2, 12, 40)
+
+
+def syntheticImage(megapixels, channels, seed=0):
+    '''
+    Creates a reproducible picture with smooth areas, edges and noise.
+    @param megapixels The size of the picture
+    @param channels 1 for a grayscale picture (2D array), 3 for RGB
+    @param seed The seed of the noise
+    @return The uint8 picture
+    '''
+    w = int(round(np.sqrt(megapixels * 1e6 * 4 / 3)))
+    h = int(round(w * 3 / 4))
+    rnd = np.random.RandomState(seed)
+    y = np.linspace(0, 1, h, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, w, dtype=np.float32)[None, :]
+    planes = []
+    for c in range(channels):
+        plane = 128 + 50 * np.sin(2 * np.pi * (3 * x + 2 * y + c / 3.))
+        for k in range(8): # Some objects with sharp edges
+            cy, cx, r = rnd.uniform(0.1, 0.9), rnd.uniform(0.1, 0.9), rnd.uniform(0.03, 0.12)
+            plane = np.where((y - cy) ** 2 + (x - cx) ** 2 < r * r, rnd.uniform(0, 255), plane)
+        plane += rnd.normal(0, 8, (h, w)).astype(np.float32)
+        planes.append(np.clip(plane, 0, 255).astype(np.uint8))
+    return planes[0] if channels == 1 else np.dstack(planes)
+
+
+def syntheticSeams(h, w, count, seed=0):
+    '''
+    Creates pairwise disjoint vertical seams (random walks, each one in its own stripe of columns).
+    @return SeamSet with count seams
+    '''
+    rnd = np.random.RandomState(seed)
+    stripe = w // count
+    steps = rnd.randint(-1, 2, (count, h))
+    steps[:, 0] = 0
+    walk = np.clip(np.cumsum(steps, axis=1), -(stripe // 3), stripe // 3)
+    seams = (np.arange(count) * stripe + stripe // 2)[:, None] + walk
+    return SeamSet(seams, (h, w))
+
+
+def gradientMask(img, seams, mixCount=15):
+    # A mask like the one of removeSeamsInGradient (the pixels next to the seams)
+    h, w = img.shape[:2]
+    mask = np.zeros((h, w))
+    cols = seams.array[:, :, None] + np.arange(-mixCount, mixCount)
+    mask[np.arange(h)[None, :, None], np.clip(cols, 0, w - 1)] = 1
+    return ML.removeSeams(mask, seams)
+
+
+def cases(maxBytes):
+    '''
+    Returns the benchmarks.
+    @param maxBytes The memory budget of the Poisson reconstruction (the dense matrix may not fit otherwise)
+    @return A list of (name, maximal megapixels, channels or None for all, setup).
+            setup(img) prepares the input (not measured) and returns the function measured.
+    '''
+    def energyOf(img):
+        return Functions.absEnergyFunc(img)
+
+    res = [
+        ("findOptimalSeam[python]", 0.3, 1, lambda img: (lambda e: lambda: ML.findOptimalSeam_Py(e))(energyOf(img))),
+        ("findOptimalSeam", None, 1, lambda img: (lambda e: lambda: ML.findOptimalSeam(e))(energyOf(img))),
+        ("findTopDisjointSeams[50]", 12, 1, lambda img: (lambda e: lambda: ML.findTopDisjointSeams(e, 50))(energyOf(img))),
+        ("removeSeams[50]", None, None,
+         lambda img: (lambda s: lambda: ML.removeSeams(img, s))(syntheticSeams(img.shape[0], img.shape[1], 50))),
+        ("duplicateSeams[50]", None, None,
+         lambda img: (lambda s: lambda: ML.duplicateSeams(img, s))(syntheticSeams(img.shape[0], img.shape[1], 50))),
+        ("removeSeamsInGradient[5]", 2, None,
+         lambda img: (lambda s: lambda: ML.removeSeamsInGradient(img * 1.0, s, maxBytes=maxBytes))(
+             syntheticSeams(img.shape[0], img.shape[1], 5))),
+        ("poissonInsertMask", 2, 1, lambda img: __poissonSetup(img, maxBytes)),
+        ("retargetingImage[3x3]", 0.3, None, lambda img: lambda: ML.retargetingImage(img, 3, 3, energyOf)),
+        ("resizeConventional", 0.3, None,
+         lambda img: lambda: ML.resizeConventional(img, img.shape[1] * 3 // 4, img.shape[0] * 3 // 4)),
+    ]
+    if ML.Cy is not None:
+        res.insert(1, ("findOptimalSeam[cython]", None, 1,
+                       lambda img: (lambda e: lambda: ML.findOptimalSeam_Cy(e))(energyOf(img))))
+    for name, func in Functions.export.items():
+        res.append(("energy[%s]" % name, None, None, (lambda func: lambda img: lambda: func(img))(func)))
+    if QtTool is not None:
+        res.append(("numpy2qimage", None, None, lambda img: lambda: QtTool.numpy2qimage(img)))
+        res.append(("qimage2numpy", None, None,
+                    lambda img: (lambda q: lambda: QtTool.qimage2numpy(q))(QtTool.numpy2qimage(img))))
+    return res
+
+
+def __poissonSetup(img, maxBytes):
+    seams = syntheticSeams(img.shape[0], img.shape[1], 5)
+    m = ML.removeSeams(img * 1.0, seams)
+    div = ML.removeSeams(Poisson.laplace_div(img * 1.0), seams)
+    mask = gradientMask(img, seams)
+    return lambda: Poisson.poissonInsertMask(m.copy(), mask, div, 20, maxBytes=maxBytes)
+
+
+def measure(func, repeat, memory=True):
+    '''
+    Measures a function. The first call (also a warm up) traces the memory.
+    @param func The function
+    @param repeat Number of timed calls
+    @param memory If False, the memory is not traced
+    @return (seconds of the fastest call, peak of the traced memory in bytes or None)
+    '''
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    else:
+        func()
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best, peak
+
+
+def commitId():
+    '''
+    @return The current git commit (with "-dirty" for uncommitted changes) or None
+    '''
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def historyFilename():
+    '''
+    @return The default history file (one per machine, next to the backend calibration)
+    '''
+    return os.path.join(os.path.dirname(Backends.cacheFilename()), "benchmarks-%s.json" % platform.node())
+
+
+def loadHistory(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the hot paths of SeamEater on synthetic pictures.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in defaultSizes),
+                        help="Megapixels of the pictures (default: %(default)s)")
+    parser.add_argument("--channels", default="1,3", help="1 (grayscale) and/or 3 (RGB) (default: %(default)s)")
+    parser.add_argument("-k", "--filter", default="", help="Only benchmarks whose name contains this text")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed calls, the fastest counts (default: 3)")
+    parser.add_argument("--history", default=None, help="The JSON history (default: %s)" % historyFilename())
+    parser.add_argument("--no-save", action="store_true", help="Do not append the results to the history")
+    parser.add_argument("--no-memory", action="store_true", help="Do not trace the memory (faster)")
+    parser.add_argument("--no-limits", action="store_true",
+                        help="Also run slow benchmarks (e.g. the python seam search) on big pictures")
+    parser.add_argument("--max-bytes", type=float, default=4 * 2 ** 30,
+                        help="Memory budget of the Poisson reconstruction (default: 4 GiB)")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks")
+    args = parser.parse_args(argv)
+
+    selected = [case for case in cases(int(args.max_bytes)) if args.filter.lower() in case[0].lower()]
+    if args.list:
+        for name, maxSize, channels, setup in selected:
+            print("%s (up to %s MP%s)" % (name, "any" if maxSize is None else maxSize,
+                                          "" if channels is None else ", %d channel" % channels))
+        return 0
+    sizes = [float(s) for s in args.sizes.split(",")]
+    channelCounts = [int(c) for c in args.channels.split(",")]
+    historyFile = args.history or historyFilename()
+    history = loadHistory(historyFile)
+    previous = {}
+    for run in history: # The latest result of every benchmark
+        for entry in run["results"]:
+            previous[(entry["name"], entry["megapixels"], entry["channels"])] = entry
+
+    results = []
+    for size in sizes:
+        for channels in channelCounts:
+            img = syntheticImage(size, channels)
+            for name, maxSize, caseChannels, setup in selected:
+                if caseChannels is not None and caseChannels != channels:
+                    continue
+                if maxSize is not None and size > maxSize and not args.no_limits:
+                    continue
+                entry = {"name": name, "megapixels": size, "channels": channels, "shape": list(img.shape)}
+                try:
+                    entry["seconds"], entry["peakBytes"] = measure(setup(img), args.repeat, not args.no_memory)
+                except MemoryError as e:
+                    entry["error"] = "%s: %s" % (type(e).__name__, e)
+                    print("%-28s %5.1f MP %d ch  skipped (%s)" % (name, size, channels, entry["error"]))
+                    results.append(entry)
+                    continue
+                before = previous.get((name, size, channels))
+                change = ""
+                if before is not None and before.get("seconds"):
+                    change = "%+6.1f%%" % (100 * (entry["seconds"] / before["seconds"] - 1))
+                print("%-28s %5.1f MP %d ch %9.4fs %9s %s" % (
+                    name, size, channels, entry["seconds"],
+                    "" if entry["peakBytes"] is None else "%.1f MB" % (entry["peakBytes"] / 2 ** 20), change))
+                sys.stdout.flush()
+                results.append(entry)
+            del img
+
+    if not args.no_save and results:
+        history.append({
+            "commit": commitId(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "machine": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "backends": {name: kernel.lastBackend for name, kernel in Backends.kernels().items()},
+            "results": results,
+        })
+        os.makedirs(os.path.dirname(os.path.abspath(historyFile)), exist_ok=True)
+        with open(historyFile, "w") as f:
+            json.dump(history, f, indent=1)
+        print("Results appended to %s" % historyFile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
-# Converting QImage <=> NumPy 
+# Converting QImage <=> NumPy
+# Both directions share the pixel buffer if possible: qimage2numpy returns a read-only view
+# of the QImage (use copy=True or np.array(...) for a writable array) and numpy2qimage wraps
+# uint8 arrays (RGB, RGBA or grayscale) without copying them.
+import sys
 import numpy as np
 qt_ver=5
 try:
@@ -9,73 +13,116 @@ except:
     from PyQt4.QtGui import QImage, qRgb, QColor
     qt_ver=4
 
+_littleEndian = sys.byteorder == "little"
+# Index of the channels R, G, B and A in the memory of a pixel of a 32 bit format (0xAARRGGBB)
+_argbOrder = (2, 1, 0, 3) if _littleEndian else (1, 2, 3, 0)
+_withGrayscale8 = hasattr(QImage, "Format_Grayscale8") # Since Qt 5.5
+_withRGBA8888 = hasattr(QImage, "Format_RGBA8888") # Since Qt 5.2
 
-def qimage2numpy(qimg):
-    h = qimg.height()
-    w = qimg.width()
-    ow = qimg.bytesPerLine() * 8 // qimg.depth()
-    d = 0
-    if qimg.format() in (QImage.Format_ARGB32_Premultiplied,
-                           QImage.Format_ARGB32,
-                           QImage.Format_RGB32):
-        d = 4
-    elif qimg.format() == QImage.Format_Indexed8:
-        d = 1
-    else:
-        raise ValueError("unsupported qimage format")
 
-    if (qt_ver==4):
-        buf = qimg.bits().asstring(qimg.numBytes())
-    else:
-        buf = qimg.bits().asstring(qimg.byteCount())
+class _QImageBuffer:
+    # The pixels of a QImage as array interface. The arrays using it keep the QImage alive.
+    def __init__(self, qimg, channels):
+        ptr = qimg.constBits() if hasattr(qimg, "constBits") else qimg.bits()
+        self.qimage = qimg
+        self.__array_interface__ = {
+            'shape': (qimg.height(), qimg.width(), channels),
+            'strides': (qimg.bytesPerLine(), channels, 1),
+            'typestr': '|u1',
+            'data': (int(ptr), True), # Read-only
+            'version': 3,
+        }
+
+
+def _pixels(qimg, channels):
+    # A read-only (h, w, channels) view of the pixels of qimg (without the padding of the rows)
+    return np.asarray(_QImageBuffer(qimg, channels))
 
-    res = np.frombuffer(buf, 'uint8')
-    res = res.reshape((h,ow,d)).copy()
-    if w != ow:
-        res = res[:,:w]
-    if d >= 3:
-        if qimg.format() == QImage.Format_RGB32:
-            res = res[:,:,:3]
-        tmp = res[:,:,0].copy()
-        res[:,:,0] = res[:,:,2]
-        res[:,:,2] = tmp
+
+def qimage2numpy(qimg, copy=False):
+    '''
+    Returns the pixels of a QImage.
+    @param qimg The QImage
+    @param copy If False, the result is a read-only view of the buffer of qimg (no copy at all).
+                If True, it is a writable contiguous copy.
+    @return A (h, w, 3) RGB array, (h, w, 4) RGBA array for images with alpha channel
+            or (h, w) array for grayscale images (uint8)
+    '''
+    fmt = qimg.format()
+    if fmt == QImage.Format_RGB32:
+        res = _pixels(qimg, 4)[:, :, list(_argbOrder[:3])] if not _littleEndian else _pixels(qimg, 4)[:, :, 2::-1]
+    elif fmt in (QImage.Format_ARGB32_Premultiplied, QImage.Format_ARGB32):
+        if fmt == QImage.Format_ARGB32_Premultiplied:
+            qimg = qimg.convertToFormat(QImage.Format_ARGB32)
+        if _withRGBA8888:
+            qimg = qimg.convertToFormat(QImage.Format_RGBA8888) # Only swaps the channels
+            res = _pixels(qimg, 4)
+        else:
+            res = _pixels(qimg, 4)[:, :, list(_argbOrder)]
+    elif fmt == QImage.Format_RGB888:
+        res = _pixels(qimg, 3)
+    elif _withRGBA8888 and fmt == QImage.Format_RGBA8888:
+        res = _pixels(qimg, 4)
+    elif _withRGBA8888 and fmt == QImage.Format_RGBX8888:
+        res = _pixels(qimg, 4)[:, :, :3]
+    elif _withGrayscale8 and fmt == QImage.Format_Grayscale8:
+        res = _pixels(qimg, 1)[:, :, 0]
+    elif fmt == QImage.Format_Indexed8 and qimg.isGrayscale() and _withGrayscale8:
+        res = _pixels(qimg.convertToFormat(QImage.Format_Grayscale8), 1)[:, :, 0]
+    else:
+        res = _pixels(qimg.convertToFormat(QImage.Format_RGB888), 3)
+    if copy:
+        return np.array(res, order='C')
     return res
 
+
+def qimageAlpha(qimg):
+    '''
+    Returns the alpha channel of a QImage (e.g. of a painting).
+    @param qimg The QImage (ARGB32, converted if needed)
+    @return A read-only (h, w) uint8 view of the alpha channel
+    '''
+    if qimg.format() != QImage.Format_ARGB32:
+        qimg = qimg.convertToFormat(QImage.Format_ARGB32)
+    return _pixels(qimg, 4)[:, :, _argbOrder[3]]
+
+
 def numpy2qimage(array):
+    '''
+    Creates a QImage showing a picture. A contiguous uint8 picture (RGB, RGBA or grayscale)
+    is used as buffer of the QImage without copying it, so it must not be changed while the QImage is used.
+    @param array The picture: (h, w), (h, w, 1), (h, w, 3) or (h, w, 4) array.
+                 Other types than uint8 are converted.
+    @return The QImage
+    '''
+    if np.ndim(array) == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
     if np.ndim(array) == 2:
-        img = np.zeros([array.shape[0],array.shape[1],3], dtype=np.uint8)
-        img[:,:,0] = array
-        img[:,:,1] = array
-        img[:,:,2] = array
-        array = img
-    if np.ndim(array) == 3:
-        h,w,d = array.shape
-        nd = d
-        if nd == 3: nd = 4
-        if nd == 1: nd = 3
-        img = np.zeros([h,w,nd],np.uint8, 'C')
-        if d == 1:
-            img[:,:,0] = array[:,:,0]
-            img[:,:,1] = array[:,:,0]
-            img[:,:,2] = array[:,:,0]
+        if _withGrayscale8:
+            img = np.ascontiguousarray(array, dtype=np.uint8)
+            fmt = QImage.Format_Grayscale8
         else:
-            img[:,:,:3] = array[:,:,(2,1,0)]
-            if d == 4:
-                img[:,:,3] = array[:,:,3]
-            else:
-                img[:,:,3] = 255
+            img = np.repeat(np.asarray(array, dtype=np.uint8)[:, :, None], 3, axis=2)
+            fmt = QImage.Format_RGB888
+    elif np.ndim(array) == 3:
+        d = array.shape[2]
+        if d == 3:
+            img = np.ascontiguousarray(array, dtype=np.uint8)
+            fmt = QImage.Format_RGB888
+        elif d == 4 and _withRGBA8888:
+            img = np.ascontiguousarray(array, dtype=np.uint8)
+            fmt = QImage.Format_RGBA8888
+        elif d == 4:
+            img = np.ascontiguousarray(np.asarray(array, dtype=np.uint8)[:, :, (2, 1, 0, 3) if _littleEndian else (3, 0, 1, 2)])
+            fmt = QImage.Format_ARGB32
+        else:
+            raise ValueError("unsupported image depth")
     else:
         raise ValueError("can only convert 2D and 3D arrays")
 
-    if img.shape[2] == 3:
-        fmt = QImage.Format_RGB32
-    elif img.shape[2] == 4:
-        fmt = QImage.Format_ARGB32
-    else:
-        raise ValueError("unsupported image depth")
-
-    res = QImage(img.data, img.shape[1], img.shape[0], fmt)
+    h, w = img.shape[:2]
+    if not img.flags.writeable: # QImage needs a writable buffer
+        img = img.copy()
+    res = QImage(img.data, w, h, img.strides[0], fmt)
     res.ndarray = img
     return res
-
-
@@ -9,21 +9,48 @@ except:
 
     guig = gui
     from PyQt4 import QtCore
+import sys
+import numpy as np
+import EffectRunner
+import ImgLib.MyLibTool as MLT
 
 
 class ActionWdg(gui.QWidget):
-    def __init__(self, imgGetFunc, imgSetFunc, progressFunc, imgMaskGetFunc):
+    def __init__(self, imgGetFunc, imgSetFunc, progressFunc, imgMaskGetFunc, imgShowFunc=None, imgClearFunc=None,
+                 profileFunc=None, viewSizeFunc=None):
         '''
           imgGetFunc: -> NPArray => Where to get the picture
-          imgSetFunc: NPArray -> => Where to set the picture
+          imgSetFunc: NPArray, seams=None -> => Where to set the picture
+                      (seams: the pixels removed from the old picture, see StdEffect.removedSeams)
           progressFunc : int -> => How to emit progress
           imgMaskGetFunc: -> NPArray => Where to get the mask
+          imgShowFunc: NPArray -> => Where to show intermediate results of an effect (without undo entry)
+          imgClearFunc: -> => Shows the current picture again (after a cancelled effect)
+          profileFunc: dict -> => Where to show the report of a profiled effect (see setProfiling)
+          viewSizeFunc: -> (int, int) => The size (w, h) the picture is shown with (the size of live previews)
         '''
         gui.QWidget.__init__(self)
         self.imgGetFunc = imgGetFunc
         self.imgSetFunc = imgSetFunc
+        self.imgShowFunc = imgShowFunc
+        self.imgClearFunc = imgClearFunc
         self.imgMaskGetFunc = imgMaskGetFunc
         self.progressFunc = progressFunc
+        self.profileFunc = profileFunc
+        self.viewSizeFunc = viewSizeFunc
+        self.__profiling = False
+        self.__processPool = None # Not None: the effects run in worker processes (see setProcessMode)
+        self.__jobs = []
+        self.__jobTimer = QtCore.QTimer(self)
+        self.__jobTimer.setInterval(30)
+        self.__jobTimer.timeout.connect(self.__pollJobs)
+        self.__previewEffect = None # The effect computing a live preview (queued or running)
+        self.__previewPending = False
+        self.__queuedRuns = [] # True (preview) or False (apply) for every run queued in the worker thread
+        self.__previewTimer = QtCore.QTimer(self)
+        self.__previewTimer.setSingleShot(True)
+        self.__previewTimer.setInterval(300) # Waits until the parameters are not changed anymore
+        self.__previewTimer.timeout.connect(self.__runPreview)
         lay = gui.QVBoxLayout()
         self.stackWdg = gui.QStackedWidget()
         self.setLayout(lay)
@@ -38,6 +65,11 @@ class ActionWdg(gui.QWidget):
         lay2.addWidget(self.__actionBox)
         lay2.addWidget(applyButton)
         lay.addLayout(lay2)
+        self.previewBox = gui.QCheckBox("Live preview")
+        self.previewBox.setToolTip("Applies the effect to a smaller picture (the size it is shown with) "
+                                   "whenever a parameter changes. Apply works on the whole picture.")
+        self.previewBox.toggled.connect(self.__previewToggled)
+        lay.addWidget(self.previewBox)
         lay.addWidget(self.stackWdg)
         self.__selectedEnergyFunction = None
         self.effects = []
@@ -46,15 +78,97 @@ class ActionWdg(gui.QWidget):
     def selectedEnergyFunction(self):
         return self.__selectedEnergyFunction
 
+    def currentEffect(self):
+        '''
+        @return The selected effect or None
+        '''
+        if not self.effects:
+            return None
+        return self.effects[self.stackWdg.currentIndex()]
+
     def setCurrentEnergyFunction(self, func):
         self.__selectedEnergyFunction = func
+        self.__schedulePreview()
+
+    def setProfiling(self, enabled):
+        '''
+        If enabled, the time and memory of every stage of the effects is measured
+        and the report is given to profileFunc.
+        '''
+        self.__profiling = enabled
+
+    def setProcessMode(self, enabled, processes=None):
+        '''
+        If enabled, the effects of StdEffects run in worker processes (see EffectRunner.EffectProcessPool),
+        so they do not slow down the gui and several effects can run at the same time.
+        Other effects and energy functions still run in the worker thread.
+        @param processes The maximal number of processes (default: number of CPUs)
+        '''
+        if enabled and self.__processPool is None:
+            self.__processPool = EffectRunner.EffectProcessPool(processes)
+            gui.QApplication.instance().aboutToQuit.connect(self.__processPool.shutdown)
+        elif not enabled and self.__processPool is not None:
+            for job in self.__jobs:
+                job.cancel()
+            self.__pollJobs()
+            self.__processPool.shutdown()
+            self.__processPool = None
 
     def __actionBoxChanged(self, inx):
         self.stackWdg.setCurrentIndex(inx)
+        self.__schedulePreview()
+
+    def __previewToggled(self, enabled):
+        if enabled:
+            self.__schedulePreview()
+        else:
+            self.__previewTimer.stop()
+            self.__previewPending = False
+            if self.__previewEffect is not None:
+                self.__previewEffect.quit()
+            elif self.imgClearFunc:
+                self.imgClearFunc()
+
+    def __schedulePreview(self):
+        if self.previewBox.isChecked():
+            self.__previewTimer.start()
+
+    def __runPreview(self):
+        '''
+        Applies the current effect to the picture downscaled to the size it is shown with.
+        The numbers of seams or pixels of the effect are scaled accordingly (see StdEffect._value).
+        '''
+        if not self.previewBox.isChecked() or not self.effects:
+            return
+        if self.__currentEffect is not None or self.__previewEffect is not None:
+            # Another run first (an old preview is cancelled)
+            if self.__previewEffect is not None:
+                self.__previewEffect.quit()
+            self.__previewPending = True
+            return
+        wdg = self.effects[self.stackWdg.currentIndex()]
+        npimg = self.imgGetFunc()
+        if npimg is None:
+            return
+        maskImg = self.imgMaskGetFunc()
+        if (not self.__selectedEnergyFunction is None):
+            wdg.setEnergyBuildFunction(self.__selectedEnergyFunction)
+        viewW, viewH = self.viewSizeFunc() if self.viewSizeFunc else (512, 512)
+        h, w = npimg.shape[:2]
+        step = int(np.ceil(max(w / max(1., viewW), h / max(1., viewH))))
+        proxy = MLT.downscale(npimg, step)
+        datamap = {'img': proxy, 'scale': (proxy.shape[1] / float(w), proxy.shape[0] / float(h))}
+        if maskImg is not None:
+            datamap['mask'] = MLT.downscale(maskImg, step, np.max)
+        self.__previewEffect = wdg
+        self.applyButton.setEnabled(False) # Until the preview is done
+        self.__queuedRuns.append(True)
+        QtCore.QMetaObject.invokeMethod(wdg, "applyEffect", QtCore.Qt.QueuedConnection,
+                                        QtCore.Q_ARG("PyQt_PyObject", datamap))
 
     def __applyEffect(self):
         wdg = self.effects[self.stackWdg.currentIndex()]
-        if (wdg is None):
+        if (wdg is None) or self.__currentEffect is not None or self.__previewEffect is not None:
             return
         npimg = self.imgGetFunc()
         maskImg = self.imgMaskGetFunc()
@@ -62,8 +176,20 @@ class ActionWdg(gui.QWidget):
             wdg.setEnergyBuildFunction(self.__selectedEnergyFunction)
         if (npimg is None):
             return
+        effectName = EffectRunner.effectName(wdg)
+        if self.__processPool is not None and effectName is not None:
+            energy = None
+            if self.__selectedEnergyFunction is not None:
+                energy = EffectRunner.energyName(self.__selectedEnergyFunction)
+            if energy is not None or self.__selectedEnergyFunction is None:
+                self.__jobs.append(self.__processPool.submit(effectName, npimg, maskImg, wdg.parameters(),
+                                                             energy, self.__profiling))
+                self.__jobTimer.start()
+                return
         self.__currentEffect = wdg
-        datamap = {'img': npimg, 'mask': maskImg}
+        self.applyButton.setEnabled(False)
+        self.__queuedRuns.append(False)
+        datamap = {'img': npimg, 'mask': maskImg, 'profile': self.__profiling}
         QtCore.QMetaObject.invokeMethod(wdg, "applyEffect", QtCore.Qt.QueuedConnection,
                                         QtCore.Q_ARG("PyQt_PyObject", datamap))
 
@@ -71,17 +197,66 @@ class ActionWdg(gui.QWidget):
         self.applyButton.setEnabled(False)
 
     def _unlock(self, res):
-        if (not res is None):
-            self.imgSetFunc(res)
+        # The runs finish in the order they were queued
+        preview = self.__queuedRuns.pop(0) if self.__queuedRuns else None
+        if preview:
+            self.__previewEffect = None
+            if res is not None and self.imgShowFunc and self.previewBox.isChecked():
+                self.imgShowFunc(res)
+            elif self.imgClearFunc:
+                self.imgClearFunc()
+        elif preview is not None and res is not None:
+            self.imgSetFunc(res, seams=self.__currentEffect.removedSeams)
+            self.__currentEffect = None
+        else:
+            if self.imgClearFunc:
+                self.imgClearFunc()
+            self.__currentEffect = None
+            if preview is None: # The worker thread was restarted, no run is left
+                self.__previewEffect = None
+        if self.__currentEffect is not None or self.__previewEffect is not None:
+            return
         self.applyButton.setEnabled(True)
         self.progressFunc(0)
-        self.__currentEffect = None
+        if self.__previewPending:
+            self.__previewPending = False
+            self.__runPreview()
 
     def __updateProgess(self, prog):
         self.progressFunc(prog)
 
+    def __showPreview(self, img):
+        if self.imgShowFunc and (not self.__currentEffect is None or not self.__previewEffect is None):
+            self.imgShowFunc(img)
+
+    def __showProfile(self, report):
+        if self.profileFunc:
+            self.profileFunc(report)
+
+    def __pollJobs(self):
+        for job in list(self.__jobs):
+            for event in job.poll():
+                if event[0] == 'progress':
+                    self.progressFunc(event[1])
+                elif event[0] == 'preview' and self.imgShowFunc:
+                    self.imgShowFunc(event[1])
+                elif event[0] == 'profile':
+                    self.__showProfile(event[1])
+                elif event[0] == 'error':
+                    sys.stderr.write(event[1])
+                elif event[0] == 'finished':
+                    self.__jobs.remove(job)
+                    if event[1] is not None:
+                        self.imgSetFunc(event[1], seams=event[2])
+                    elif self.imgClearFunc and not self.__jobs:
+                        self.imgClearFunc()
+        if not self.__jobs:
+            self.__jobTimer.stop()
+            self.progressFunc(0)
+
     def __restartThread(self):
         self.workerThread.deleteLater()
+        self.__queuedRuns = []
         self._unlock(None)
         self.workerThread = QtCore.QThread(self)
         self.workerThread.finished.connect(self.__restartThread, type=QtCore.Qt.QueuedConnection)
@@ -90,12 +265,19 @@ class ActionWdg(gui.QWidget):
     def stopAction(self):
        if (not self.__currentEffect is None):
            self.__currentEffect.quit()
+       if (not self.__previewEffect is None):
+           self.__previewEffect.quit()
+       for job in self.__jobs:
+           job.cancel()
 
     def addActionWdg(self, actionWdg):
         actionWdg.moveToThread(self.workerThread)
         actionWdg.started.connect(self._lock, type=QtCore.Qt.QueuedConnection)
         actionWdg.finished.connect(self._unlock, type=QtCore.Qt.QueuedConnection)
         actionWdg.progress.connect(self.__updateProgess, type=QtCore.Qt.QueuedConnection)
+        actionWdg.preview.connect(self.__showPreview, type=QtCore.Qt.QueuedConnection)
+        actionWdg.profiled.connect(self.__showProfile, type=QtCore.Qt.QueuedConnection)
+        actionWdg.parametersChanged.connect(self.__schedulePreview)
         self.stackWdg.addWidget(actionWdg.getWdg())
         self.effects.append(actionWdg)
         self.__actionBox.addItem(actionWdg.title())
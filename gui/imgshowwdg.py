@@ -20,33 +20,7 @@ except:
 
     withGL = True
 import gui.QtTool as tool
-
-
-class ImgEntry:
-    def __init__(self):
-        self.pixmap = None
-        self.paintingPixmap = None
-        self.imgNP = None
-
-    def getPixmap(self):
-        return self.pixmap
-
-    def getNPArray(self):
-        if self.imgNP is None:
-            return tool.qimage2numpy(self.pixmap.toImage())
-        return self.imgNP
-
-    def setPixmap(self, pixmap):
-        self.pixmap = pixmap
-
-    def setNpArray(self, array):
-        self.imgNP = array
-
-    def setPaintingPixmap(self, pixmap):
-        self.paintingPixmap = pixmap
-
-    def getPaintingPixmap(self):
-        return self.paintingPixmap
+from ImgLib.UndoHistory import UndoHistory, defaultMaxBytes
 
 
 class PainableItem(gui.QGraphicsPixmapItem):
@@ -91,7 +65,10 @@ class PainableItem(gui.QGraphicsPixmapItem):
 class ImgShowWdg(gui.QGraphicsView):
     sizeChanged = QtCore.pyqtSignal(['int', 'int'])  
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, undoBytes=defaultMaxBytes):
+        '''
+        @param undoBytes The memory budget of the undo history in bytes (see UndoHistory)
+        '''
         gui.QGraphicsView.__init__(self, parent)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
@@ -104,106 +81,102 @@ class ImgShowWdg(gui.QGraphicsView):
         if withGL:
             self.setViewport(gl.QGLWidget())
         gui.QApplication.instance().aboutToQuit.connect(self.deleteLater)
-        self.__undoCount = 10
-        self.__imgEntries = []
-        self.__currentImgEntry = -1
+        self.__history = UndoHistory(undoBytes)
+        self.__pixmap = None
+        self.__paintingPixmap = None
 
     def resizeEvent(self, ev):
         gui.QGraphicsView.resizeEvent(self, ev)
         self.fitInView(self.__pixmapItem, QtCore.Qt.KeepAspectRatio)
 
-    def __currentEntry(self):
-        if self.__currentImgEntry < 0:
-            return None
-        return self.__imgEntries[self.__currentImgEntry]
-
-    def __newEntry(self):
-        self.__imgEntries = self.__imgEntries[:self.__currentImgEntry + 1]  
-        entry = ImgEntry()
-        self.__imgEntries.append(entry)
-        self.__currentImgEntry += 1
-        diff = len(self.__imgEntries) - self.__undoCount
-        if diff > 0:
-            self.__imgEntries = self.__imgEntries[diff:]
-            self.__currentImgEntry -= diff
-        return entry
+    def viewSize(self):
+        '''
+        @return The size (w, h) of the area showing the picture
+        '''
+        return self.viewport().width(), self.viewport().height()
+
+    def undoHistory(self):
+        '''
+        @return The UndoHistory (e.g. for changing its memory budget with setMaxBytes)
+        '''
+        return self.__history
 
     def undo(self):
-        if self.__currentImgEntry > 0:
-            self.__currentImgEntry = self.__currentImgEntry - 1
-            self.__emitSizeChanged()
-            self.updatePixmaps()
+        img = self.__history.undo()
+        if img is not None:
+            self.__setPixmap(guig.QPixmap.fromImage(tool.numpy2qimage(img)))
 
     def redo(self):
-        if self.__currentImgEntry + 1 >= len(self.__imgEntries):
-            return
-        self.__currentImgEntry = self.__currentImgEntry + 1
-        self.__emitSizeChanged()
+        img = self.__history.redo()
+        if img is not None:
+            self.__setPixmap(guig.QPixmap.fromImage(tool.numpy2qimage(img)))
+
+    def showPreview(self, image):
+        '''
+        Shows an image temporarily without creating an undo entry.
+        The current entry will be shown again with clearPreview (or any other change).
+        @param image A numpy array or a QImage
+        '''
+        if not isinstance(image, guig.QImage):
+            image = tool.numpy2qimage(image)
+        self.__maskPixmapItem.setVisible(False)
+        self.__pixmapItem.setPixmap(guig.QPixmap.fromImage(image))
+        self.fitInView(self.__pixmapItem, QtCore.Qt.KeepAspectRatio)
+
+    def clearPreview(self):
+        '''
+        Shows the current entry again after showPreview.
+        '''
         self.updatePixmaps()
 
     def updatePixmaps(self):
-        entry = self.__currentEntry()
-        if entry:
-            self.__pixmapItem.setPixmap(entry.getPixmap())
-            self.__maskPixmapItem.setInternPixmap(entry.getPaintingPixmap())
+        self.__maskPixmapItem.setVisible(True)
+        if self.__pixmap:
+            self.__pixmapItem.setPixmap(self.__pixmap)
+            self.__maskPixmapItem.setInternPixmap(self.__paintingPixmap)
             self.fitInView(self.__pixmapItem, QtCore.Qt.KeepAspectRatio)
 
     def getPixmap(self):
-        entry = self.__currentEntry()
-        if entry is None:
-            return None
-        return entry.getPixmap()
+        return self.__pixmap
 
     def getNPArray(self):
-        entry = self.__currentEntry()
-        if entry is None:
-            return None
-        nparray = entry.getNPArray()
-        if nparray is None:
-            return tool.qimage2numpy(entry.getPixmap().toImage())
-        return nparray
-
-    def setImageFromNP(self, nparray, entry=None):
-        if entry is None:
-            entry = self.__newEntry()
-        self.setQImage(tool.numpy2qimage(nparray), entry)
-        entry.setNpArray(nparray)
-
-    def setQImage(self, image, entry=None):
-        if entry is None:
-            entry = self.__newEntry()
-        self.setPixmap(guig.QPixmap.fromImage(image), entry)
-        entry.setNpArray(None)
+        return self.__history.current()
+
+    def setImageFromNP(self, nparray, seams=None):
+        '''
+        Shows a new picture and adds it to the undo history.
+        @param nparray The picture
+        @param seams If nparray is the current picture without some pixels (e.g. removed seams),
+                     a SeamSet of these pixels. Then the undo history stores only them.
+        '''
+        self.__history.push(nparray, seams)
+        self.__setPixmap(guig.QPixmap.fromImage(tool.numpy2qimage(nparray)))
+
+    def setQImage(self, image):
+        self.__history.push(tool.qimage2numpy(image))
+        self.__setPixmap(guig.QPixmap.fromImage(image))
 
     def __clearPaintingPixmap(self):
-        entry = self.__currentEntry()
-        if entry is None:
-            return
-        if entry.getPixmap():
-            pixmap = guig.QPixmap(entry.getPixmap().width(), entry.getPixmap().height())
+        if self.__pixmap:
+            pixmap = guig.QPixmap(self.__pixmap.width(), self.__pixmap.height())
             pixmap.fill(guig.QColor(0, 0, 0, 1)) 
-            entry.setPaintingPixmap(pixmap)
+            self.__paintingPixmap = pixmap
             self.__maskPixmapItem.setInternPixmap(pixmap)
         else:
             print ("No Pixmap __clearPaintintPixmap-ImgShowWdg")
-            entry.setPaintingPixmap(None)
+            self.__paintingPixmap = None
 
     def clearPaintingPixmap(self):
         self.__clearPaintingPixmap()
         self.updatePixmaps()
 
     def getPaintingPixmap(self):
-        entry = self.__currentEntry()
-        if entry is None:
-            return None
-        return entry.getPaintingPixmap()
+        return self.__paintingPixmap
 
     def getPaintintNPImage(self):
-        entry = self.__currentEntry()
-        if entry is None or entry.getPaintingPixmap() is None:
+        if self.__paintingPixmap is None:
             return None
-        npimg = tool.qimage2numpy(entry.getPaintingPixmap().toImage().convertToFormat(guig.QImage.Format_ARGB32))
-        return (npimg[:, :, 3] > 1).astype("uint8")
+        return (tool.qimageAlpha(self.__paintingPixmap.toImage()) > 1).astype("uint8")
 
     def setPainterRadius(self, rad=5):
         self.__maskPixmapItem.setRadius(rad)
@@ -212,15 +185,17 @@ class ImgShowWdg(gui.QGraphicsView):
         return self.__maskPixmapItem.getRadius()
 
     def __emitSizeChanged(self):
-        entry = self.__currentEntry()
-        if entry and entry.getPixmap():
-            self.sizeChanged.emit(entry.getPixmap().width(), entry.getPixmap().height())
-
-    def setPixmap(self, pixmap, entry=None):
-        if entry is None:
-            entry = self.__newEntry()
-        entry.setPixmap(pixmap)
+        if self.__pixmap:
+            self.sizeChanged.emit(self.__pixmap.width(), self.__pixmap.height())
+
+    def setPixmap(self, pixmap):
+        self.__history.push(tool.qimage2numpy(pixmap.toImage()))
+        self.__setPixmap(pixmap)
+
+    def __setPixmap(self, pixmap):
+        # Shows the pixmap of the current picture (the painting is cleared)
+        self.__pixmap = pixmap
         self.__pixmapItem.setPixmap(pixmap)
-        self.__emitSizeChanged()
         self.__clearPaintingPixmap()
         self.updatePixmaps()
+        self.__emitSizeChanged()
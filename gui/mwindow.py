@@ -8,15 +8,22 @@ except:
 
     qtver = 4
     guig = gui
+try:
+    from PyQt5 import QtCore
+except:
+    from PyQt4 import QtCore
 from gui.imgshowwdg import ImgShowWdg
 from gui.actionWdg import ActionWdg
+from gui.resizeWdg import InteractiveResizeWdg
+from gui.pipelineWdg import PipelineWdg
+from ImgLib.Profiling import summary
+from ImgLib.ImageIO import readImage, saveInBackground
 import numpy as np
 
-# from imageio import imread
-from imageio import imsave as imwrite
-
 
 class MainWindow(gui.QMainWindow):
+    saved = QtCore.pyqtSignal(['QString', 'QString']) # filename, error message (empty if saved)
+
     def __init__(self):
         gui.QMainWindow.__init__(self)
         self.setWindowTitle("SeamEater")
@@ -30,8 +37,11 @@ class MainWindow(gui.QMainWindow):
         mwdg.setLayout(lay)
         lay.addWidget(self.imgwdg)
         self.addDockWidget(0x2, self.__initDockWidget())
+        self.addDockWidget(0x2, self.__initResizeDockWidget())
+        self.addDockWidget(0x2, self.__initPipelineDockWidget())
         self.__initToolBar()
         self.__energyFunctions = {}
+        self.saved.connect(self.__onSaved, type=QtCore.Qt.QueuedConnection)
 
     def getEnergyFactoryMap(self):
         return self.__energyFunctions
@@ -62,10 +72,28 @@ class MainWindow(gui.QMainWindow):
     def __initDockWidget(self):
         actionDockWdg = gui.QDockWidget("Actions")
         self.actionWdg = ActionWdg(self.imgwdg.getNPArray, self.imgwdg.setImageFromNP, self.__updateProgress,
-                                   self.imgwdg.getPaintintNPImage)
+                                   self.imgwdg.getPaintintNPImage, self.imgwdg.showPreview, self.imgwdg.clearPreview,
+                                   self.__showProfile, self.imgwdg.viewSize)
         actionDockWdg.setWidget(self.actionWdg)
         return actionDockWdg
 
+    def __initResizeDockWidget(self):
+        resizeDockWdg = gui.QDockWidget("Interactive resize")
+        self.resizeWdg = InteractiveResizeWdg(self.imgwdg.getNPArray, self.imgwdg.setImageFromNP,
+                                              self.imgwdg.showPreview, self.imgwdg.clearPreview,
+                                              self.actionWdg.selectedEnergyFunction, self.__updateProgress)
+        self.imgwdg.sizeChanged.connect(lambda w, h: self.resizeWdg.invalidate())
+        resizeDockWdg.setWidget(self.resizeWdg)
+        return resizeDockWdg
+
+    def __initPipelineDockWidget(self):
+        pipelineDockWdg = gui.QDockWidget("Pipeline")
+        self.pipelineWdg = PipelineWdg(self.imgwdg.getNPArray, self.imgwdg.setImageFromNP,
+                                       self.imgwdg.getPaintintNPImage, self.actionWdg.currentEffect,
+                                       self.actionWdg.selectedEnergyFunction, self.__updateProgress)
+        pipelineDockWdg.setWidget(self.pipelineWdg)
+        return pipelineDockWdg
+
     def __initToolBar(self):
         toolbar = self.addToolBar("main")
         currentStyle = gui.QApplication.instance().style()
@@ -86,7 +114,16 @@ class MainWindow(gui.QMainWindow):
         toolbar = self.addToolBar("Functions")
         self.__choosenFunctionBox = gui.QComboBox()
         toolbar.addWidget(self.__choosenFunctionBox)
-        toolbar.addAction(currentStyle.standardIcon(gui.QStyle.SP_BrowserStop),"Stop",self.actionWdg.stopAction)
+        toolbar.addAction(currentStyle.standardIcon(gui.QStyle.SP_BrowserStop),"Stop",self.__stop)
+        profileAction = toolbar.addAction("Profile")
+        profileAction.setCheckable(True)
+        profileAction.setToolTip("Measure the time of every stage of the next effects")
+        profileAction.toggled.connect(self.actionWdg.setProfiling)
+        processAction = toolbar.addAction("Processes")
+        processAction.setCheckable(True)
+        processAction.setToolTip("Run the effects in worker processes (the window stays responsive, "
+                                 "several effects can run at once)")
+        processAction.toggled.connect(self.actionWdg.setProcessMode)
         self.__choosenFunctionBox.currentIndexChanged.connect(
             lambda idx: self.actionWdg.setCurrentEnergyFunction(self.__energyFunctions[idx]))
 
@@ -97,9 +134,16 @@ class MainWindow(gui.QMainWindow):
         statusBar.addPermanentWidget(self.__infoText)
         statusBar.addPermanentWidget(self.__progressBar)
 
+    def __stop(self):
+        self.actionWdg.stopAction()
+        self.pipelineWdg.stop()
+
     def __updateProgress(self, p):
         self.__progressBar.setValue(p)
 
+    def __showProfile(self, report):
+        self.statusBar().showMessage(summary(report))
+
     def __onLoadImage(self):
         filename = gui.QFileDialog.getOpenFileName(self)
         if (qtver == 5):
@@ -111,13 +155,16 @@ class MainWindow(gui.QMainWindow):
         self.loadImage(filename)
 
     def loadImage(self, filename):
-        ## Use Qt for image loading
-        img = guig.QImage(filename)
-        self.imgwdg.setQImage(img)
-        ## Use Scipy for image loading
-        # img = imread(filename)
-        # self.imgwdg.setImageFromNP(img)
-
+        try:
+            # Decoded directly into an uint8 array (no QImage conversion)
+            self.imgwdg.setImageFromNP(readImage(filename))
+        except Exception:
+            ## Use Qt for the formats only Qt can read
+            img = guig.QImage(filename)
+            if img.isNull():
+                gui.QMessageBox.critical(self, "Error", "Cannot load {}".format(filename))
+                return
+            self.imgwdg.setQImage(img)
 
     def __onSaveImage(self):
         filename = gui.QFileDialog.getSaveFileName()
@@ -127,8 +174,18 @@ class MainWindow(gui.QMainWindow):
             filename = str(filename)
         if (len(filename) == 0):
             return
-        #self.imgwdg.getPixmap().save(filename) # Use Qt for saving images.
-        try:
-            imwrite(filename, self.imgwdg.getNPArray()) # Use Scipy for saving images.
-        except Exception as e:
-            gui.QMessageBox.critical(self, "Exception", "An error is thrown while saving: {}".format(e))
+        img = self.imgwdg.getNPArray()
+        if img is None:
+            return
+        # The pictures of the undo history are never changed, so img can be written in the background
+        future = saveInBackground(filename, img)
+        future.add_done_callback(
+            lambda f: self.saved.emit(filename, "" if f.exception() is None else str(f.exception())))
+        self.statusBar().showMessage("Saving {}...".format(filename))
+
+    def __onSaved(self, filename, error):
+        if error:
+            self.statusBar().clearMessage()
+            gui.QMessageBox.critical(self, "Exception", "An error is thrown while saving: {}".format(error))
+        else:
+            self.statusBar().showMessage("Saved {}".format(filename), 3000)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+try:
+    from PyQt5 import QtGui as guig
+    from PyQt5 import QtWidgets as gui
+    from PyQt5 import QtCore
+except:
+    from PyQt4 import QtGui as gui
+
+    guig = gui
+    from PyQt4 import QtCore
+import EffectRunner
+
+
+class PipelineWorker(QtCore.QObject):
+    '''
+    Runs a pipeline in a worker thread.
+    '''
+    progress = QtCore.pyqtSignal(['int'])
+    finished = QtCore.pyqtSignal(['PyQt_PyObject'])
+
+    @QtCore.pyqtSlot('PyQt_PyObject')
+    def run(self, data):
+        '''
+        @param data A map with the pipeline, the image (img) and the mask (mask, may be None)
+        The finished signal emits the pair (data, result).
+        '''
+        res = None
+        try:
+            res = data['pipeline'].run(data['img'], data['mask'], self.progress.emit)
+        finally:
+            self.finished.emit((data, res))
+
+
+class PipelineWdg(gui.QWidget):
+    '''
+    Composes several effects and applies them one after another in one run
+    (only the result is shown and added to the undo history, see EffectRunner.Pipeline).
+    The pipeline can be saved as recipe and used again, e.g. with batch.py --recipe.
+    '''
+
+    def __init__(self, imgGetFunc, imgSetFunc, imgMaskGetFunc, effectGetFunc, energyGetFunc, progressFunc):
+        '''
+          imgGetFunc: -> NPArray => Where to get the picture
+          imgSetFunc: NPArray, seams=None -> => Where to set the result (creates an undo entry)
+          imgMaskGetFunc: -> NPArray => Where to get the mask
+          effectGetFunc: -> StdEffect => The effect which is added to the pipeline
+          energyGetFunc: -> (NPArray -> NPArray) => The current energy function
+          progressFunc : int -> => How to emit progress
+        '''
+        gui.QWidget.__init__(self)
+        self.imgGetFunc = imgGetFunc
+        self.imgSetFunc = imgSetFunc
+        self.imgMaskGetFunc = imgMaskGetFunc
+        self.effectGetFunc = effectGetFunc
+        self.energyGetFunc = energyGetFunc
+        self.progressFunc = progressFunc
+        self.__pipeline = EffectRunner.Pipeline()
+        self.__running = None
+
+        lay = gui.QVBoxLayout()
+        self.setLayout(lay)
+        self.stepList = gui.QListWidget()
+        lay.addWidget(self.stepList)
+        lay2 = gui.QHBoxLayout()
+        self.addButton = gui.QPushButton("Add effect")
+        self.addButton.setToolTip("Appends the selected effect with its current settings and energy function")
+        self.addButton.clicked.connect(self.__addEffect)
+        self.removeButton = gui.QPushButton("Remove")
+        self.removeButton.clicked.connect(self.__removeStep)
+        lay2.addWidget(self.addButton)
+        lay2.addWidget(self.removeButton)
+        lay.addLayout(lay2)
+        lay3 = gui.QHBoxLayout()
+        self.loadButton = gui.QPushButton("Load...")
+        self.loadButton.clicked.connect(self.__load)
+        self.saveButton = gui.QPushButton("Save...")
+        self.saveButton.clicked.connect(self.__save)
+        lay3.addWidget(self.loadButton)
+        lay3.addWidget(self.saveButton)
+        lay.addLayout(lay3)
+        lay4 = gui.QHBoxLayout()
+        self.runButton = gui.QPushButton("Run")
+        self.runButton.clicked.connect(self.run)
+        self.stopButton = gui.QPushButton("Stop")
+        self.stopButton.setEnabled(False)
+        self.stopButton.clicked.connect(self.stop)
+        lay4.addWidget(self.runButton)
+        lay4.addWidget(self.stopButton)
+        lay.addLayout(lay4)
+
+        self.worker = PipelineWorker()
+        self.workerThread = QtCore.QThread(self)
+        self.worker.moveToThread(self.workerThread)
+        self.worker.progress.connect(self.progressFunc, type=QtCore.Qt.QueuedConnection)
+        self.worker.finished.connect(self.__finished, type=QtCore.Qt.QueuedConnection)
+        self.workerThread.start()
+        gui.QApplication.instance().aboutToQuit.connect(self.__stopThread)
+        self.__updateSteps()
+
+    def __stopThread(self):
+        self.stop()
+        self.workerThread.quit()
+        self.workerThread.wait()
+
+    def pipeline(self):
+        return self.__pipeline
+
+    def setPipeline(self, pipeline):
+        if self.__running is not None:
+            return
+        self.__pipeline = pipeline
+        self.__updateSteps()
+
+    def __updateSteps(self):
+        self.stepList.clear()
+        for step in self.__pipeline.steps():
+            params = ", ".join("%s=%s" % (k, v) for k, v in sorted(step['params'].items()))
+            self.stepList.addItem("%s (%s) [%s]" % (step['effect'], params, step['energy']))
+        idle = self.__running is None
+        for button in (self.addButton, self.removeButton, self.loadButton):
+            button.setEnabled(idle)
+        self.saveButton.setEnabled(len(self.__pipeline) > 0)
+        self.runButton.setEnabled(idle and len(self.__pipeline) > 0)
+        self.stopButton.setEnabled(not idle)
+
+    def __addEffect(self):
+        effect = self.effectGetFunc()
+        if effect is None:
+            return
+        try:
+            self.__pipeline.addEffect(effect, self.energyGetFunc())
+        except ValueError as e:
+            gui.QMessageBox.warning(self, "Pipeline", str(e))
+        self.__updateSteps()
+
+    def __removeStep(self):
+        row = self.stepList.currentRow()
+        if row < 0:
+            row = len(self.__pipeline) - 1
+        if row >= 0:
+            self.__pipeline.removeStep(row)
+        self.__updateSteps()
+
+    def __load(self):
+        filename = gui.QFileDialog.getOpenFileName(self, "Load recipe", "", "Recipes (*.json)")
+        if isinstance(filename, tuple):
+            filename = filename[0]
+        filename = str(filename)
+        if len(filename) == 0:
+            return
+        try:
+            self.setPipeline(EffectRunner.Pipeline.load(filename))
+        except (ValueError, OSError) as e:
+            gui.QMessageBox.critical(self, "Pipeline", "Cannot load the recipe: {}".format(e))
+
+    def __save(self):
+        filename = gui.QFileDialog.getSaveFileName(self, "Save recipe", "", "Recipes (*.json)")
+        if isinstance(filename, tuple):
+            filename = filename[0]
+        filename = str(filename)
+        if len(filename) == 0:
+            return
+        try:
+            self.__pipeline.save(filename)
+        except OSError as e:
+            gui.QMessageBox.critical(self, "Pipeline", "Cannot save the recipe: {}".format(e))
+
+    def run(self):
+        '''
+        Applies the pipeline to the current picture in the worker thread.
+        '''
+        img = self.imgGetFunc()
+        if img is None or self.__running is not None or len(self.__pipeline) == 0:
+            return
+        self.__running = {'pipeline': self.__pipeline, 'img': img, 'mask': self.imgMaskGetFunc()}
+        self.__updateSteps()
+        QtCore.QMetaObject.invokeMethod(self.worker, "run", QtCore.Qt.QueuedConnection,
+                                        QtCore.Q_ARG("PyQt_PyObject", self.__running))
+
+    def stop(self):
+        if self.__running is not None:
+            self.__running['pipeline'].cancel()
+
+    def __finished(self, result):
+        data, res = result
+        if not data is self.__running:
+            return
+        self.__running = None
+        self.progressFunc(0)
+        self.__updateSteps()
+        if res is not None:
+            self.imgSetFunc(res, seams=data['pipeline'].removedSeams)
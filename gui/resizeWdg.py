@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+try:
+    from PyQt5 import QtGui as guig
+    from PyQt5 import QtWidgets as gui
+    from PyQt5 import QtCore
+except:
+    from PyQt4 import QtGui as gui
+
+    guig = gui
+    from PyQt4 import QtCore
+import numpy as np
+import ImgLib.MyLib as ML
+import ImgLib.MyLibTool as MLT
+import ImgLib.SeamIndexMap as SIM
+import gui.QtTool as tool
+
+
+class IndexMapWorker(QtCore.QObject):
+    '''
+    Computes the seam index map in a worker thread.
+    '''
+    progress = QtCore.pyqtSignal(['int'])
+    finished = QtCore.pyqtSignal(['PyQt_PyObject'])
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.__quitting = False
+
+    def quit(self):
+        self.__quitting = True
+
+    def _haveToQuit(self):
+        return self.__quitting
+
+    @QtCore.pyqtSlot('PyQt_PyObject')
+    def compute(self, data):
+        '''
+        @param data A map with the image (img), the minimal width (minWidth)
+                    and the energy function (energyFactory)
+        The finished signal emits the pair (data, index map).
+        '''
+        self.__quitting = False
+        res = None
+        try:
+            res = SIM.computeSeamIndexMap(data['img'], data['minWidth'], data['energyFactory'],
+                                          lambda k: self.progress.emit(int(k)), self._haveToQuit)
+        finally:
+            self.finished.emit((data, res))
+
+
+class InteractiveResizeWdg(gui.QWidget):
+    '''
+    Resizes the picture live with a slider.
+    The order in which the pixels are removed is computed once in the background (see SeamIndexMap),
+    afterwards every width is only a selection from that order.
+    '''
+
+    def __init__(self, imgGetFunc, imgSetFunc, imgShowFunc, imgClearFunc, energyGetFunc, progressFunc):
+        '''
+          imgGetFunc: -> NPArray => Where to get the picture
+          imgSetFunc: NPArray, seams=None -> => Where to set the picture (creates an undo entry,
+                      seams: the removed pixels)
+          imgShowFunc: QImage -> => Where to show a picture temporarily
+          imgClearFunc: -> => Shows the current picture again
+          energyGetFunc: -> (NPArray -> NPArray) => The current energy function
+          progressFunc : int -> => How to emit progress
+        '''
+        gui.QWidget.__init__(self)
+        self.imgGetFunc = imgGetFunc
+        self.imgSetFunc = imgSetFunc
+        self.imgShowFunc = imgShowFunc
+        self.imgClearFunc = imgClearFunc
+        self.energyGetFunc = energyGetFunc
+        self.progressFunc = progressFunc
+        self.__img = None
+        self.__packed = None
+        self.__indexMap = None
+        self.__format = None
+        self.__pending = None
+
+        lay = gui.QVBoxLayout()
+        self.setLayout(lay)
+        self.minBox = gui.QSpinBox()
+        self.minBox.setRange(1, 99)
+        self.minBox.setValue(50)
+        self.minBox.setSuffix(" %")
+        lay2 = gui.QHBoxLayout()
+        lay2.addWidget(gui.QLabel("Minimal width:"))
+        lay2.addWidget(self.minBox)
+        self.prepareButton = gui.QPushButton("Prepare")
+        self.prepareButton.clicked.connect(self.__prepare)
+        lay2.addWidget(self.prepareButton)
+        lay.addLayout(lay2)
+        self.slider = gui.QSlider(QtCore.Qt.Horizontal)
+        self.slider.setEnabled(False)
+        self.slider.valueChanged.connect(self.__showWidth)
+        self.slider.sliderReleased.connect(self.__showWidth)
+        self.widthLabel = gui.QLabel()
+        lay3 = gui.QHBoxLayout()
+        lay3.addWidget(self.slider)
+        lay3.addWidget(self.widthLabel)
+        lay.addLayout(lay3)
+        lay4 = gui.QHBoxLayout()
+        self.applyButton = gui.QPushButton("Apply")
+        self.applyButton.setEnabled(False)
+        self.applyButton.clicked.connect(self.__apply)
+        self.resetButton = gui.QPushButton("Reset")
+        self.resetButton.setEnabled(False)
+        self.resetButton.clicked.connect(self.invalidate)
+        lay4.addWidget(self.applyButton)
+        lay4.addWidget(self.resetButton)
+        lay.addLayout(lay4)
+        lay.addStretch()
+
+        self.worker = IndexMapWorker()
+        self.workerThread = QtCore.QThread(self)
+        self.worker.moveToThread(self.workerThread)
+        self.worker.progress.connect(self.progressFunc, type=QtCore.Qt.QueuedConnection)
+        self.worker.finished.connect(self.__prepared, type=QtCore.Qt.QueuedConnection)
+        self.workerThread.start()
+        gui.QApplication.instance().aboutToQuit.connect(self.__stopThread)
+
+    def __stopThread(self):
+        self.worker.quit()
+        self.workerThread.quit()
+        self.workerThread.wait()
+
+    def invalidate(self):
+        '''
+        Forgets the index map, e.g. because the picture was changed.
+        '''
+        if self.__indexMap is None and self.__img is None:
+            return
+        self.worker.quit()
+        self.__img = None
+        self.__packed = None
+        self.__indexMap = None
+        self.__pending = None
+        self.slider.setEnabled(False)
+        self.applyButton.setEnabled(False)
+        self.resetButton.setEnabled(False)
+        self.prepareButton.setEnabled(True)
+        self.widthLabel.setText("")
+        self.imgClearFunc()
+
+    def __prepare(self):
+        img = self.imgGetFunc()
+        if img is None:
+            return
+        self.invalidate()
+        self.__img = img
+        energyFactory = self.energyGetFunc()
+        if energyFactory is None:
+            energyFactory = lambda img: ML.absDivergence(MLT.makeGray(img * 1.0))
+        minWidth = max(1, img.shape[1] * self.minBox.value() // 100)
+        self.prepareButton.setEnabled(False)
+        self.resetButton.setEnabled(True)
+        self.__pending = {'img': img, 'minWidth': minWidth, 'energyFactory': energyFactory}
+        QtCore.QMetaObject.invokeMethod(self.worker, "compute", QtCore.Qt.QueuedConnection,
+                                        QtCore.Q_ARG("PyQt_PyObject", self.__pending))
+
+    def __prepared(self, result):
+        data, indexMap = result
+        if not data is self.__pending:  # Result of an invalidated run
+            return
+        self.__pending = None
+        self.progressFunc(0)
+        if indexMap is None:
+            self.prepareButton.setEnabled(True)
+            return
+        self.__indexMap = indexMap
+        # Pack every pixel into one 32 bit value (the memory layout of QImage), so one frame
+        # is a single compress of h*width values which can be shown without converting.
+        img = np.clip(self.__img, 0, 255).astype(np.uint8)
+        if np.ndim(img) == 2:
+            img = img[:, :, None]
+        if img.shape[2] != 4: # RGBA (one 32 bit value per pixel) instead of RGB or grayscale
+            img = np.dstack((np.broadcast_to(img, img.shape[:2] + (3,)), np.full(img.shape[:2], 255, np.uint8)))
+        qimg = tool.numpy2qimage(img)
+        self.__format = qimg.format()
+        self.__packed = qimg.ndarray.view(np.uint32).reshape(indexMap.shape)
+        w = indexMap.shape[1]
+        self.slider.blockSignals(True)
+        self.slider.setRange(SIM.minimalWidth(indexMap), w)
+        self.slider.setValue(w)
+        self.slider.blockSignals(False)
+        self.slider.setEnabled(True)
+        self.applyButton.setEnabled(True)
+        self.__showWidth()
+
+    def __frame(self, width):
+        h, w = self.__indexMap.shape
+        keep = (self.__indexMap >= w - width).ravel()
+        frame = np.compress(keep, self.__packed.ravel())
+        res = guig.QImage(frame.data, width, h, 4 * width, self.__format)
+        res.ndarray = frame
+        return res
+
+    def __showWidth(self):
+        if self.__indexMap is None:
+            return
+        width = self.slider.value()
+        self.widthLabel.setText("w: %d" % width)
+        self.imgShowFunc(self.__frame(width))
+
+    def __apply(self):
+        if self.__indexMap is None:
+            return
+        width = self.slider.value()
+        res = SIM.resizeWithIndexMap(self.__img, self.__indexMap, width)
+        seams = SIM.removedPixels(self.__indexMap, width)
+        self.invalidate()
+        self.imgSetFunc(res, seams=seams)
@@ -9,13 +9,14 @@ import StdEffects as Effects
 import EnergyFunction as Functions
 from gui.mwindow import MainWindow
 
-app = qgui.QApplication(sys.argv)
-app.setWindowIcon(guig.QIcon("pic/logo.png"))
-win = MainWindow()
-for effectWdg in Effects.export:
-    win.addActionWdg(effectWdg())
-win.setEnergyFactoryMap(Functions.export)
-win.resize(600,300)
-win.show()
-win.loadImage("pic/logo.png")
-app.exec_()
+if __name__ == "__main__": # The worker processes (see EffectRunner.EffectProcessPool) import this module
+    app = qgui.QApplication(sys.argv)
+    app.setWindowIcon(guig.QIcon("pic/logo.png"))
+    win = MainWindow()
+    for effectWdg in Effects.export:
+        win.addActionWdg(effectWdg())
+    win.setEnergyFactoryMap(Functions.export)
+    win.resize(600,300)
+    win.show()
+    win.loadImage("pic/logo.png")
+    app.exec_()
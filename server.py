@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+# A small HTTP service for content aware resizing.
+# E.g.: python3 server.py --port 8080
+#       curl --data-binary @in.png "http://localhost:8080/resize?width=300&height=200" > out.png
+#       curl http://localhost:8080/metrics
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+import ImgLib.MyLib as ML
+from ImgLib.ImageIO import readImage, writeImage
+import EnergyFunction as Functions
+
+
+class RequestError(Exception):
+    '''
+    Error which is reported to the client with the given HTTP status.
+    '''
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class Job:
+    '''
+    One resize operation. Identical requests share the same job.
+    '''
+
+    def __init__(self, key, body, params):
+        self.key = key
+        self.body = body
+        self.params = params
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.cancelled = False
+        self.created = time.perf_counter()
+
+    def stopFunc(self):
+        '''
+        Used as stopFunc of the algorithms. True if nobody waits for the result anymore.
+        '''
+        return self.cancelled
+
+
+def resizeImage(img, width, height, operation, energyFactory, stopFunc=None):
+    '''
+    Resizes the image with seam carving.
+    @param img The image
+    @param width The new width
+    @param height The new height
+    @param operation "retarget" (retargetingImage), "remove" (removeSeams) or "duplicate" (duplicateSeams)
+    @param energyFactory The energy function (image -> numpy array)
+    @param stopFunc Function, stopFunc()==True stops the algorithm.
+    @return The resized image, None if stopped.
+    '''
+    h, w = img.shape[:2]
+    if operation == "retarget":
+        if width > w or height > h:
+            raise RequestError(400, "retarget can only decrease the size")
+        return ML.retargetingImage(img, w - width, h - height, energyFactory, stopFunc=stopFunc)
+    if height != h:
+        raise RequestError(400, "%s can only change the width" % operation)
+    if operation == "remove":
+        if width > w:
+            raise RequestError(400, "remove can only decrease the width")
+        seams = ML.findTopDisjointSeams(energyFactory(img), w - width, stopFunc=stopFunc)
+        if stopFunc and stopFunc():
+            return None
+        return ML.removeSeams(img, seams)
+    if operation == "duplicate":
+        if width < w:
+            raise RequestError(400, "duplicate can only increase the width")
+        seams = ML.findTopDisjointSeams(energyFactory(img), width - w, stopFunc=stopFunc)
+        if stopFunc and stopFunc():
+            return None
+        return ML.duplicateSeams(img, seams)
+    raise RequestError(400, "unknown operation '%s'" % operation)
+
+
+class RetargetingService:
+    '''
+    Runs the resize jobs in an executor.
+    At most `workers` jobs run at the same time, at most `queueSize` jobs wait.
+    Further requests are rejected (backpressure) until the queue has space again.
+    '''
+
+    def __init__(self, workers=2, queueSize=16, maxPixels=40 * 10 ** 6):
+        self.workers = workers
+        self.maxPixels = maxPixels
+        self.__queue = asyncio.Queue(queueSize)
+        self.__executor = ThreadPoolExecutor(workers)
+        self.__inFlight = {}
+        self.__tasks = []
+        self.__latencies = []
+        self.__counter = {'requests': 0, 'completed': 0, 'failed': 0, 'cancelled': 0,
+                          'rejected': 0, 'coalesced': 0}
+        self.__running = 0
+
+    def start(self):
+        for i in range(self.workers):
+            self.__tasks.append(asyncio.ensure_future(self.__work()))
+
+    async def stop(self):
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__executor.shutdown(wait=False)
+
+    def metrics(self):
+        '''
+        @return A map with the queue depth, the number of running jobs, counters and latencies in seconds.
+        '''
+        lat = np.array(self.__latencies[-1000:])
+        res = dict(self.__counter)
+        res['queueDepth'] = self.__queue.qsize()
+        res['queueSize'] = self.__queue.maxsize
+        res['running'] = self.__running
+        res['inFlight'] = len(self.__inFlight)
+        if len(lat) > 0:
+            res['latency'] = {'mean': float(lat.mean()), 'p50': float(np.percentile(lat, 50)),
+                              'p95': float(np.percentile(lat, 95)), 'max': float(lat.max())}
+        return res
+
+    def submit(self, body, params):
+        '''
+        Returns the job for the request, shares a running job for an identical request.
+        @param body The encoded image
+        @param params The map of request parameters
+        @return The job
+        '''
+        self.__counter['requests'] += 1
+        key = hashlib.sha1(body + json.dumps(params, sort_keys=True).encode()).hexdigest()
+        job = self.__inFlight.get(key)
+        if job is not None and not job.cancelled:
+            self.__counter['coalesced'] += 1
+        else:
+            job = Job(key, body, params)
+            try:
+                self.__queue.put_nowait(job)
+            except asyncio.QueueFull:
+                self.__counter['rejected'] += 1
+                raise RequestError(503, "queue is full")
+            self.__inFlight[key] = job
+        job.waiters += 1
+        return job
+
+    def release(self, job):
+        '''
+        Called when a client does not wait for the job anymore.
+        The job will be cancelled when nobody waits for it.
+        '''
+        job.waiters -= 1
+        if job.waiters <= 0 and not job.future.done():
+            job.cancelled = True
+            if self.__inFlight.get(job.key) is job:
+                del self.__inFlight[job.key]
+
+    async def __work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.__queue.get()
+            try:
+                if job.cancelled:
+                    self.__counter['cancelled'] += 1
+                    continue
+                self.__running += 1
+                try:
+                    res = await loop.run_in_executor(self.__executor, self.__process, job)
+                finally:
+                    self.__running -= 1
+                if job.cancelled:
+                    self.__counter['cancelled'] += 1
+                    continue
+                self.__counter['completed'] += 1
+                self.__latencies.append(time.perf_counter() - job.created)
+                if len(self.__latencies) > 10000:
+                    self.__latencies = self.__latencies[-1000:]
+                job.future.set_result(res)
+            except Exception as e:
+                self.__counter['failed'] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                if self.__inFlight.get(job.key) is job:
+                    del self.__inFlight[job.key]
+                self.__queue.task_done()
+
+    def __process(self, job):
+        params = job.params
+        try:
+            img = readImage(io.BytesIO(job.body))
+        except Exception as e:
+            raise RequestError(400, "cannot decode image: %s" % e)
+        if img.shape[0] * img.shape[1] > self.maxPixels:
+            raise RequestError(413, "image is too large")
+        if np.ndim(img) == 3 and img.shape[2] == 4:
+            img = img[:, :, :3]
+        h, w = img.shape[:2]
+        res = resizeImage(img, params.get('width', w), params.get('height', h), params['op'],
+                          Functions.export[params['energy']], job.stopFunc)
+        if res is None:
+            return None
+        out = io.BytesIO()
+        writeImage(out, res, format="png")
+        return out.getvalue()
+
+
+def parseParams(query):
+    '''
+    Parses the query of a resize request.
+    @param query The query string, e.g. width=300&height=200&op=retarget&energy=AbsDiv
+    @return A map of parameters
+    '''
+    query = parse_qs(query)
+    params = {'op': query.get('op', ['retarget'])[0],
+              'energy': query.get('energy', [list(Functions.export.keys())[0]])[0]}
+    if not params['op'] in ("retarget", "remove", "duplicate"):
+        raise RequestError(400, "unknown operation '%s'" % params['op'])
+    if not params['energy'] in Functions.export:
+        raise RequestError(400, "unknown energy function '%s'" % params['energy'])
+    for name in ('width', 'height'):
+        if name in query:
+            try:
+                params[name] = int(query[name][0])
+            except ValueError:
+                raise RequestError(400, "%s must be an integer" % name)
+            if params[name] <= 0:
+                raise RequestError(400, "%s must be positive" % name)
+    return params
+
+
+__reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+             413: "Payload Too Large", 499: "Client Closed Request", 500: "Internal Server Error",
+             503: "Service Unavailable"}
+
+
+def __response(writer, status, body, contentType="text/plain", headers=None):
+    head = "HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: close\r\n" \
+           % (status, __reasons.get(status, ""), contentType, len(body))
+    for name, value in (headers or {}).items():
+        head += "%s: %s\r\n" % (name, value)
+    writer.write(head.encode() + b"\r\n" + body)
+
+
+async def handleClient(service, reader, writer, maxBody=200 * 2 ** 20):
+    '''
+    Handles one HTTP connection (one request).
+    POST /resize with the encoded picture as body, GET /metrics for the metrics.
+    '''
+    try:
+        requestLine = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(requestLine) < 2:
+            raise RequestError(400, "malformed request")
+        method, target = requestLine[0], urlsplit(requestLine[1])
+        if target.path == "/metrics":
+            __response(writer, 200, json.dumps(service.metrics()).encode(), "application/json")
+            return
+        if target.path != "/resize":
+            raise RequestError(404, "unknown path")
+        if method != "POST":
+            raise RequestError(405, "use POST")
+        length = int(headers.get("content-length", 0))
+        if length <= 0 or length > maxBody:
+            raise RequestError(413 if length > 0 else 400, "invalid content length")
+        body = await reader.readexactly(length)
+        job = service.submit(body, parseParams(target.query))
+        # Cancel if the client goes away (EOF) before the result is ready
+        disconnect = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait([job.future, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            service.release(job)
+        if not job.future.done():
+            return
+        res = job.future.result()
+        if res is None:
+            raise RequestError(499, "cancelled")
+        __response(writer, 200, res, "image/png")
+    except RequestError as e:
+        headers = {"Retry-After": "1"} if e.status == 503 else None
+        __response(writer, e.status, str(e).encode(), headers=headers)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    except Exception as e:
+        __response(writer, 500, ("%s: %s" % (type(e).__name__, e)).encode())
+    finally:
+        try:
+            await writer.drain()
+            writer.close()
+        except ConnectionError:
+            pass
+
+
+async def serve(host="127.0.0.1", port=8080, workers=2, queueSize=16, ready=None):
+    '''
+    Runs the service until it is cancelled.
+    @param ready Optional function called with the listening port (port=0 chooses a free port)
+    '''
+    service = RetargetingService(workers, queueSize)
+    service.start()
+    server = await asyncio.start_server(lambda r, w: handleClient(service, r, w), host, port)
+    if ready:
+        ready(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP service for content aware resizing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-j", "--workers", type=int, default=2, help="Number of jobs running at the same time")
+    parser.add_argument("-q", "--queue", type=int, default=16, help="Number of jobs that may wait")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue,
+                          lambda port: print("Listening on %s:%d" % (args.host, port))))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 from distutils.core import setup, Extension
+from distutils.errors import CompileError, LinkError
 from Cython.Build import cythonize
 from Cython.Distutils import build_ext
+import os
+import shutil
+import tempfile
 import numpy
 
 #setup(
@@ -8,13 +12,50 @@ import numpy
 #    include_dirs=[numpy.get_include()]
 #)
 
+openmpFlags = ['-fopenmp']
+
+
+class OpenMPBuildExt(build_ext):
+    '''
+    Compiles with OpenMP only if the compiler supports it (e.g. not Apple clang),
+    otherwise without (findOptimalSeamParallel then runs with one thread).
+    '''
+
+    def build_extensions(self):
+        flags = ['/openmp'] if self.compiler.compiler_type == 'msvc' else openmpFlags
+        supported = self.__supportsFlags(flags)
+        for ext in self.extensions:
+            for args in (ext.extra_compile_args, ext.extra_link_args):
+                args[:] = [arg for arg in args if not arg in openmpFlags]
+                if supported:
+                    args.extend(flags)
+        if not supported:
+            print("The compiler does not support OpenMP, building without it")
+        build_ext.build_extensions(self)
+
+    def __supportsFlags(self, flags):
+        tmpDir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpDir, "openmp_test.c")
+            with open(source, "w") as f:
+                f.write("#include <omp.h>\nint main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }\n")
+            objects = self.compiler.compile([source], output_dir=tmpDir, extra_postargs=flags)
+            self.compiler.link_executable(objects, os.path.join(tmpDir, "openmp_test"), extra_postargs=flags)
+            return True
+        except (CompileError, LinkError):
+            return False
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+
 setup(
 	include_dirs = [numpy.get_include()],   
-	cmdclass = {'build_ext': build_ext},
+	cmdclass = {'build_ext': OpenMPBuildExt},
     ext_modules=[
         Extension("ImgLib.MyLib_Cy", 
         		 ["ImgLib/MyLib_Cy.pyx"],
-        		 extra_compile_args=['-O3'],
+        		 extra_compile_args=['-O3'] + openmpFlags,
+        		 extra_link_args=list(openmpFlags),
         		 #language='c++',
                  include_dirs=[numpy.get_include()]
                 ),
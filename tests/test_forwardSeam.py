@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# The seams of findOptimalSeamForward have the lowest forward energy (see forwardSeamEnergy).
+import itertools
+import unittest
+import numpy as np
+import ImgLib.MyLib as ML
+
+
+def allSeams(h, w):
+    # Every vertical seam of a (h, w) picture
+    for start in range(w):
+        for steps in itertools.product((-1, 0, 1), repeat=h - 1):
+            seam = np.cumsum((start,) + steps)
+            if seam.min() >= 0 and seam.max() < w:
+                yield seam
+
+
+class ForwardSeamTest(unittest.TestCase):
+    def check(self, backend):
+        func = ML.findOptimalSeamForward.implementation(backend)
+        rng = np.random.default_rng(0)
+        for i in range(10):
+            gray = rng.random((6, 7)) * 255
+            minimum = min(ML.forwardSeamEnergy(gray, seam) for seam in allSeams(*gray.shape))
+            seam = func(gray)
+            self.assertAlmostEqual(ML.forwardSeamEnergy(gray, seam), minimum, places=6)
+
+    def testNumpy(self):
+        self.check("numpy")
+
+    def testCython(self):
+        if not "cython" in ML.findOptimalSeamForward.backends():
+            self.skipTest("The Cython extension is not compiled")
+        self.check("cython")
+
+
+if __name__ == "__main__":
+    unittest.main()
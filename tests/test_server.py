@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Tests of the resize service against a localhost instance (see server.serve).
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+import numpy as np
+import server
+from ImgLib.ImageIO import readImage, writeImage
+
+
+def encode(img):
+    out = io.BytesIO()
+    writeImage(out, img, format="png")
+    return out.getvalue()
+
+
+def waitFor(cond, timeout=30):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            raise AssertionError("timeout")
+        time.sleep(0.01)
+
+
+class BlockingResize:
+    # Replaces server.resizeImage: waits until released (or stopped by stopFunc)
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+        self.stopped = threading.Event()
+
+    def __call__(self, img, width, height, operation, energyFactory, stopFunc=None):
+        self.calls += 1
+        while not self.release.wait(0.01):
+            if stopFunc and stopFunc():
+                self.stopped.set()
+                return None
+        return img[:height, :width]
+
+
+class ServerTest(unittest.TestCase):
+    workers = 1
+    queueSize = 1
+
+    def setUp(self):
+        self.resize = server.resizeImage
+        ready = []
+        self.loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.task = self.loop.create_task(server.serve(port=0, workers=self.workers,
+                                                          queueSize=self.queueSize, ready=ready.append))
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self.loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        waitFor(lambda: ready)
+        self.port = ready[0]
+        self.img = (np.random.default_rng(0).random((40, 50, 3)) * 255).astype(np.uint8)
+        self.body = encode(self.img)
+
+    def tearDown(self):
+        if isinstance(server.resizeImage, BlockingResize):
+            server.resizeImage.release.set()
+        server.resizeImage = self.resize
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(10)
+
+    def post(self, query, body=None):
+        '''
+        @return (status, body, headers)
+        '''
+        request = urllib.request.Request("http://127.0.0.1:%d/resize?%s" % (self.port, query),
+                                         data=self.body if body is None else body)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+
+    def metrics(self):
+        with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % self.port, timeout=10) as response:
+            return json.loads(response.read())
+
+    def postInBackground(self, query):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.post(query)), daemon=True)
+        thread.start()
+        return thread, results
+
+    def testResize(self):
+        status, body, headers = self.post("width=45&height=36")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "image/png")
+        self.assertEqual(readImage(io.BytesIO(body)).shape, (36, 45, 3))
+        status, body, headers = self.post("width=55&op=duplicate&energy=L2Gradient")
+        self.assertEqual(status, 200)
+        self.assertEqual(readImage(io.BytesIO(body)).shape, (40, 55, 3))
+
+    def testBadRequest(self):
+        self.assertEqual(self.post("width=45&op=shrink")[0], 400)
+        self.assertEqual(self.post("width=abc")[0], 400)
+        self.assertEqual(self.post("width=60&op=retarget")[0], 400) # Retargeting cannot enlarge
+        self.assertEqual(self.post("width=45", body=b"no image")[0], 400)
+        metrics = self.metrics()
+        self.assertEqual(metrics['completed'], 0)
+        self.assertEqual(metrics['failed'], 2) # The last two fail in the worker
+
+    def testCoalescing(self):
+        server.resizeImage = fake = BlockingResize()
+        requests = [self.postInBackground("width=45&height=36") for i in range(3)]
+        waitFor(lambda: self.metrics()['requests'] == 3)
+        fake.release.set()
+        for thread, results in requests:
+            thread.join(30)
+            self.assertEqual(results[0][0], 200)
+        self.assertEqual(fake.calls, 1)
+        metrics = self.metrics()
+        self.assertEqual(metrics['coalesced'], 2)
+        self.assertEqual(metrics['completed'], 1)
+
+    def testBackpressure(self):
+        server.resizeImage = fake = BlockingResize()
+        running = self.postInBackground("width=45")
+        waitFor(lambda: self.metrics()['running'] == 1)
+        queued = self.postInBackground("width=44")
+        waitFor(lambda: self.metrics()['queueDepth'] == 1)
+        status, body, headers = self.post("width=43")
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["Retry-After"], "1")
+        self.assertEqual(self.metrics()['rejected'], 1)
+        fake.release.set()
+        for thread, results in (running, queued):
+            thread.join(30)
+            self.assertEqual(results[0][0], 200)
+        self.assertEqual(self.post("width=43")[0], 200) # Accepted again
+
+    def testCancellation(self):
+        server.resizeImage = fake = BlockingResize()
+        connection = socket.create_connection(("127.0.0.1", self.port))
+        connection.sendall(("POST /resize?width=45 HTTP/1.1\r\nContent-Length: %d\r\n\r\n"
+                            % len(self.body)).encode() + self.body)
+        waitFor(lambda: self.metrics()['running'] == 1)
+        connection.close()
+        self.assertTrue(fake.stopped.wait(30)) # stopFunc returned True
+        waitFor(lambda: self.metrics()['cancelled'] == 1)
+        metrics = self.metrics()
+        self.assertEqual(metrics['completed'], 0)
+        self.assertEqual(metrics['inFlight'], 0)
+
+    def testMetrics(self):
+        metrics = self.metrics()
+        self.assertEqual(metrics['requests'], 0)
+        self.assertEqual(metrics['queueSize'], self.queueSize)
+        self.assertNotIn('latency', metrics)
+        self.assertEqual(self.post("width=45")[0], 200)
+        metrics = self.metrics()
+        for name, value in (('requests', 1), ('completed', 1), ('failed', 0), ('rejected', 0),
+                            ('queueDepth', 0), ('running', 0), ('inFlight', 0)):
+            self.assertEqual(metrics[name], value, name)
+        self.assertGreater(metrics['latency']['max'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()